@@ -2,33 +2,22 @@
 import os
 import random
 import json
+import logging
 import pickle
+import threading
+import types
 import numpy as np
-import nltk
-import speech_recognition as sr
-from keras.models import load_model
-from nltk.stem import WordNetLemmatizer
-from textblob import TextBlob
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-import sqlite3
 
+from ai.chatbot.featurizer import BagOfWords
+from ai.chatbot.inference import DenseNetwork
 from ai.chatbot.query_bankdata import *
+from ai.chatbot import sentiment as sentiment_tracking
+from services import batching, datastore, startup, tenants
 
 #from query_bankdata import *
 
-
-# Establish a new SQLite database connection
-conn = sqlite3.connect('db/transactions_ut.db')
-
-# Initialize a variable to store the last bot reply
-last_bot_reply = ""
-
-# Initialize counts and list to store negative conversations
-positive_count = 0
-negative_count = 0
-neutral_count = 0
-total_count = 0
-negative_conversations = []
+# Sentiment counts, each session's last bot reply and the conversations flagged for review are kept per chat session
+# by ai/chatbot/sentiment.py
 
 # Get the current directory where the script is located
 current_directory = os.path.dirname(__file__)
@@ -38,42 +27,87 @@ intents_file_path = os.path.join(current_directory, 'intents.json')
 words_file_path = os.path.join(current_directory, 'words.pkl')
 labels_file_path = os.path.join(current_directory, 'labels.pkl')
 model_file_path = os.path.join(current_directory, 'chatbotmodel.h5')
-
-# load intents and saved model output files
-lemmatizer = WordNetLemmatizer()
-intents = json.loads(open(intents_file_path).read())
-words = pickle.load(open(words_file_path, 'rb'))
-labels = pickle.load(open(labels_file_path, 'rb'))
-model = load_model(model_file_path)
+# the model's weights exported for NumPy inference (inference.py) - Keras is only used if this file is missing
+weights_file_path = os.path.join(current_directory, 'chatbotmodel.npz')
+
+app_log = logging.getLogger("dolfin.app")
+
+# Concurrent messages are classified together (services/batching.py): up to CHATBOT_BATCH_SIZE of them, gathered for
+# at most CHATBOT_BATCH_WAIT_MS after the first
+CHATBOT_BATCH_SIZE = int(os.getenv("CHATBOT_BATCH_SIZE", 32))
+CHATBOT_BATCH_WAIT_MS = float(os.getenv("CHATBOT_BATCH_WAIT_MS", 2))
+
+# load intents and saved model output files - on first use, not at import: most processes that import this module
+# never answer a message. startup.warmup() calls load() ahead of time when the app is preloaded.
+_resources = None
+_resources_lock = threading.Lock()
+
+def load():
+    global _resources
+    if _resources is None:
+        with _resources_lock:
+            if _resources is None:
+                import nltk
+                from nltk.stem import WordNetLemmatizer
+
+                startup.check_nltk_data()   # NLTK data is never downloaded at runtime - see services/startup.py
+                with open(intents_file_path) as f:
+                    intents = json.load(f)
+                with open(words_file_path, 'rb') as f:
+                    words = pickle.load(f)
+                with open(labels_file_path, 'rb') as f:
+                    labels = pickle.load(f)
+                lemmatizer = WordNetLemmatizer()
+                _resources = types.SimpleNamespace(
+                    lemmatizer=lemmatizer, featurizer=BagOfWords(words, nltk.word_tokenize, lemmatizer.lemmatize),
+                    intents=intents, words=words, labels=labels, model=load_model())
+    return _resources
+
+def load_model():
+    if os.path.exists(weights_file_path):
+        return DenseNetwork.load(weights_file_path)
+    # TensorFlow takes seconds to import and hundreds of MB per worker
+    app_log.warning("CHATBOT: %s not found, falling back to Keras - export it with: python -m ai.chatbot.inference"
+                    % weights_file_path)
+    from keras.models import load_model as load_keras_model
+    return load_keras_model(model_file_path)
+
+# chatbot_logic.intents, .words, .labels, .model and .lemmatizer still work, loading everything on first access
+def __getattr__(name):
+    if name in ('intents', 'words', 'labels', 'model', 'lemmatizer'):
+        return getattr(load(), name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 # separate input words from input sentence
 def clean_up_sentences(sentence):
-    sentence_words = nltk.word_tokenize(sentence)
-    sentence_words = [lemmatizer.lemmatize(word) for word in sentence_words]
-    return sentence_words
+    return load().featurizer.tokens(sentence)
 
-# determine if input words in saved model words list
+# determine if input words in saved model words list (see featurizer.py)
 def bagw(sentence):
-    sentence_words = clean_up_sentences(sentence)
-    bag = [0]*len(words)
-    for w in sentence_words:
-        for i, word in enumerate(words):
-            if word == w:
-                bag[i] = 1
-    return np.array(bag)
+    return load().featurizer.transform(sentence)
+
+# intent probabilities for bag-of-words vectors from several requests, stacked into one forward pass
+def predict_vectors(vectors):
+    return load().model.predict(np.stack(vectors))
+
+# Only the forward pass is shared: each request featurizes its own message first, so a message that can't be
+# tokenized fails that request alone instead of every request batched with it
+intent_batcher = batching.MicroBatcher(predict_vectors, max_batch=CHATBOT_BATCH_SIZE,
+                                       max_wait=CHATBOT_BATCH_WAIT_MS / 1000, name='chatbot')
 
 # predict label of sentence based on input words
 def predict_class(sentence):
-    bow = bagw(sentence)
-    res = model.predict(np.array([bow]))[0]
+    bot = load()
+    res = intent_batcher(bagw(sentence))
     ERROR_THRESHOLD = 0.25
-    results = [{'intent': labels[i], 'probability': str(res[i])}
+    results = [{'intent': bot.labels[i], 'probability': str(res[i])}
                for i in range(len(res)) if res[i] > ERROR_THRESHOLD]
     results.sort(key=lambda x: x['probability'], reverse=True)
     return results
 
 # Capture the user's speech input
 def listen_to_user(): 
+    import speech_recognition as sr     # needs a microphone (PyAudio) - only imported when voice input is used
     r = sr.Recognizer()
     with sr.Microphone() as source:
         print("Listening...")
@@ -92,50 +126,21 @@ def listen_to_user():
             print("Sorry, my speech service is down. Please try again later.")
             return ""
 
-# Determine sentiment of user's reply
-def determine_sentiment(message, last_bot_reply):
-    global positive_count, negative_count, neutral_count, total_count, negative_conversations
-    analyzer = SentimentIntensityAnalyzer()
-    sentiment = "neutral"
-    
-    sentiment_scores = analyzer.polarity_scores(message)
-    compound_score = sentiment_scores["compound"]
-    
-    if compound_score >= 0.05:
-        positive_count += 1
-        sentiment = 'positive'
-    elif compound_score <= -0.05:
-        negative_count += 1
-        sentiment = 'negative'
-        negative_conversation = f"Bot: {last_bot_reply}\nYou: {message}"
-        negative_conversations.append(negative_conversation)
-    else:
-        neutral_count += 1
-    
-    return sentiment
-
-def process_sentiment(message):
-    global total_count, last_bot_reply
-    total_count += 1
-    sentiment = determine_sentiment(message, last_bot_reply)
-    # print(f"Sentiment: {sentiment}")
-
-    # if total_count > 0:
-    #     print(f"Positive: {(positive_count/total_count)*100}%")
-    #     print(f"Negative: {(negative_count/total_count)*100}%")
-    #     print(f"Neutral: {(neutral_count/total_count)*100}%")
-
-    if sentiment == 'negative' and (negative_count/total_count)*100 >= 50:
-        # print("Storing negative conversation for review.")
-        negative_conversations.append({
-            'User': message,
-            'Bot': last_bot_reply
-        })
-    
-        with open('negative_conversations.txt', 'a') as f:
-            f.write(f"Bot: {last_bot_reply}\n")
-            f.write(f"User: {message}\n")
-            f.write("---\n")
+# Determine sentiment of user's reply - 'positive', 'negative' or 'neutral' from the message alone
+determine_sentiment = sentiment_tracking.classify
+
+def process_sentiment(message, session_id=None, user_id=None):
+    """
+    Records the message's sentiment in its chat session; once half of a session's messages are negative, each further
+    negative one is queued, with the bot reply before it, for the review log (written in the background).
+
+    Returns:
+    \t'positive', 'negative' or 'neutral'.
+    """
+    return sentiment_tracking.tracker.record(session_id, message, user_id)
+
+def remember_reply(reply, session_id=None):
+    sentiment_tracking.tracker.remember_reply(session_id, reply)
 
 def extract_month_year(message):
 
@@ -175,9 +180,17 @@ def get_month_name(month):
 
 # print random response from appropriate responses for label
 
-def get_response(intents_list, intents_json, message):
+def get_response(intents_list, intents_json, message, user_id=None):
+    # Borrow a pooled connection to the user's synced transactions for the duration of the answer.
+    # Without a signed-in user the shared demo data (transactions_ut.db) is used.
+    if user_id is None:
+        with datastore.connection(datastore.TRANSACTIONS_DB) as conn:
+            return answer_intent(intents_list, intents_json, message, conn)
+    with tenants.connection(user_id) as conn:
+        return answer_intent(intents_list, intents_json, message, conn)
+
+def answer_intent(intents_list, intents_json, message, conn):
     global last_bot_ans
-    conn = sqlite3.connect('db/transactions_ut.db')
     tag = intents_list[0]['intent']
     probability = float(intents_list[0]['probability'])
     list_of_intents = intents_json['intents']
@@ -0,0 +1,73 @@
+import functools
+import os
+
+import numpy as np
+
+# Distinct tokens whose lemma is remembered - chat messages reuse a small vocabulary, so hits are the norm
+LEMMA_CACHE_SIZE = int(os.getenv("CHATBOT_LEMMA_CACHE_SIZE", 10000))
+
+
+class BagOfWords:
+    """
+    Turns messages into the bag-of-words vectors the intent model was trained on: position i is 1 when the message
+    contains (after tokenizing and lemmatizing) the word words[i], and 0 otherwise.
+    Words are looked up in a dict built once from the vocabulary instead of being compared with every entry, and
+    lemmas are cached, so featurizing a message costs O(tokens) rather than O(tokens x vocabulary).
+    """
+
+    def __init__(self, words, tokenize, lemmatize, dtype=np.float32, cache_size=LEMMA_CACHE_SIZE):
+        """
+        :param words: The model's vocabulary (words.pkl), in input order.
+        :param tokenize: Callable splitting a sentence into tokens, e.g. nltk.word_tokenize.
+        :param lemmatize: Callable mapping a token to its lemma, e.g. WordNetLemmatizer().lemmatize.
+        :param dtype: dtype of the vectors - float32 is what the model consumes.
+        :param cache_size: How many distinct tokens' lemmas to remember.
+        """
+        self.words = list(words)
+        self.size = len(self.words)
+        self.dtype = dtype
+        self.tokenize = tokenize
+        self.lemmatize = functools.lru_cache(maxsize=cache_size)(lemmatize)
+        # word -> every position it occupies (one, for a vocabulary built with set())
+        positions = {}
+        for i, word in enumerate(self.words):
+            positions.setdefault(word, []).append(i)
+        self.index = {word: tuple(found) for word, found in positions.items()}
+
+    def tokens(self, sentence):
+        """
+        :param sentence: The message text.
+        :return: The message's lemmatized tokens.
+        """
+        return [self.lemmatize(token) for token in self.tokenize(sentence)]
+
+    def _columns(self, sentence):
+        index = self.index
+        return [i for token in self.tokens(sentence) for i in index.get(token, ())]
+
+    def transform(self, sentence, out=None):
+        """
+        :param sentence: The message text.
+        :param out: Optional preallocated vector of length len(words) to write into; it is zeroed first.
+        :return: The message's bag-of-words vector.
+        """
+        if out is None:
+            out = np.zeros(self.size, dtype=self.dtype)
+        else:
+            out[:] = 0
+        out[self._columns(sentence)] = 1
+        return out
+
+    def transform_batch(self, sentences):
+        """
+        :param sentences: Sequence of N message texts.
+        :return: N x len(words) matrix whose row n is transform(sentences[n]).
+        """
+        matrix = np.zeros((len(sentences), self.size), dtype=self.dtype)
+        rows, columns = [], []
+        for row, sentence in enumerate(sentences):
+            found = self._columns(sentence)
+            rows.extend([row] * len(found))
+            columns.extend(found)
+        matrix[rows, columns] = 1
+        return matrix
@@ -0,0 +1,133 @@
+import os
+import sys
+
+import numpy as np
+
+# Pure-NumPy inference for the chatbot's intent classifier (chatbotmodel.h5, trained in chatbot_train.ipynb).
+# The model is a small stack of Dense layers - with Dropout, which does nothing at inference - so its forward pass is
+# two or three matrix products. Running that with NumPy keeps TensorFlow out of the web workers and skips Keras's
+# per-call overhead. After retraining, export the weights again:
+#     python -m ai.chatbot.inference [chatbotmodel.h5] [chatbotmodel.npz] [--int8]
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _softmax(x):
+    x = x - x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+ACTIVATIONS = {
+    'linear':   lambda x: x,
+    'relu':     _relu,
+    'softmax':  _softmax,
+    'sigmoid':  _sigmoid,
+    'tanh':     np.tanh,
+}
+
+# Layers that are the identity at inference time
+PASSTHROUGH_LAYERS = {'Dropout', 'InputLayer', 'GaussianNoise', 'ActivityRegularization'}
+
+
+def quantize(weights):
+    """
+    Symmetric per-output int8 quantization: each column is scaled so its largest magnitude maps to 127.
+    :param weights: float matrix (inputs x outputs).
+    :return: Tuple of int8 matrix and float32 scale per column; weights ~= int8 * scale.
+    """
+    scale = np.abs(weights).max(axis=0) / 127
+    scale[scale == 0] = 1
+    return np.round(weights / scale).astype(np.int8), scale.astype(np.float32)
+
+
+def export(model, path, int8=False):
+    """
+    Writes a Keras Sequential model of Dense layers to a compressed .npz file.
+    :param model: The loaded Keras model.
+    :param path: Where to write the .npz.
+    :param int8: Store the kernels int8-quantized (about a quarter of the size, small loss of precision).
+    :return: Number of Dense layers written.
+    """
+    arrays, activations = {}, []
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        if kind in PASSTHROUGH_LAYERS:
+            continue
+        if kind != 'Dense':
+            raise ValueError("Can't export a %s layer (%s) - only Dense layers are supported" % (kind, layer.name))
+        activation = layer.get_config()['activation']
+        if activation not in ACTIVATIONS:
+            raise ValueError("Can't export activation %r of layer %s" % (activation, layer.name))
+        weights = layer.get_weights()
+        kernel = weights[0].astype(np.float32)
+        bias = weights[1].astype(np.float32) if len(weights) > 1 else np.zeros(kernel.shape[1], dtype=np.float32)
+        n = len(activations)
+        if int8:
+            arrays['kernel%d_int8' % n], arrays['kernel%d_scale' % n] = quantize(kernel)
+        else:
+            arrays['kernel%d' % n] = kernel
+        arrays['bias%d' % n] = bias
+        activations.append(activation)
+    np.savez_compressed(path, activations=np.array(activations), **arrays)
+    return len(activations)
+
+
+class DenseNetwork:
+    """
+    Forward pass of an exported model. predict() takes and returns the same arrays as the Keras model's predict().
+    """
+
+    def __init__(self, layers):
+        """
+        :param layers: List of (float32 kernel, float32 bias, activation name).
+        """
+        self.layers = [(kernel, bias, ACTIVATIONS[activation]) for kernel, bias, activation in layers]
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: .npz written by export(); int8 kernels are expanded back to float32 here, once.
+        :return: The DenseNetwork.
+        """
+        with np.load(path) as data:
+            layers = []
+            for n, activation in enumerate(data['activations']):
+                if 'kernel%d_int8' % n in data:
+                    kernel = data['kernel%d_int8' % n].astype(np.float32) * data['kernel%d_scale' % n]
+                else:
+                    kernel = data['kernel%d' % n]
+                layers.append((np.ascontiguousarray(kernel, dtype=np.float32), data['bias%d' % n], str(activation)))
+        return cls(layers)
+
+    @property
+    def input_size(self):
+        return self.layers[0][0].shape[0]
+
+    def predict(self, x, **kwargs):
+        """
+        :param x: N x input_size matrix (or a single vector) of model inputs.
+        :param kwargs: Ignored - accepted so calls written for Keras (verbose=...) keep working.
+        :return: N x outputs matrix of the last layer's activations.
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+        for kernel, bias, activation in self.layers:
+            x = activation(x @ kernel + bias)
+        return x
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    args = [arg for arg in sys.argv[1:] if arg != '--int8']
+    source = args[0] if len(args) > 0 else os.path.join(here, 'chatbotmodel.h5')
+    target = args[1] if len(args) > 1 else os.path.splitext(source)[0] + '.npz'
+    from keras.models import load_model
+    count = export(load_model(source), target, int8='--int8' in sys.argv[1:])
+    print("Exported %d Dense layer(s) from %s to %s (%d bytes)" % (count, source, target, os.path.getsize(target)))
@@ -5,10 +5,15 @@ import plotly.graph_objects as go
 import os
 
 # Querying Functions
+# Monthly figures come from the monthly_summary rollup (services/rollup.py), one primary-key lookup per answer
+
+# Columns of monthly_summary holding the total for each direction
+DIRECTION_TOTALS = {'debit': 'debit_total', 'credit': 'credit_total'}
+
 # Function to get the true ending balance for a specific month and year
 def get_last_balance_for_month_year(conn, month, year):
     cursor = conn.cursor()
-    cursor.execute(f"SELECT balance FROM transactions WHERE month = ? AND year = ? ORDER BY transactionDate DESC, id DESC LIMIT 1", (month, year))
+    cursor.execute("SELECT end_balance FROM monthly_summary WHERE year = ? AND month = ?", (year, month))
     result = cursor.fetchone()
     final_balance = result[0] if result else 0
     return final_balance
@@ -38,15 +43,12 @@ def get_total_balance_for_year_until(conn, month, year):
 # Function to get total spending/saving for a specific month and year
 def get_total_amount_for_month_year(conn, direction, month, year):
     cursor = conn.cursor()
-    cursor.execute(f"SELECT SUM(amount) FROM transactions WHERE direction = ? AND month = ? AND year = ?", (direction, month, year))
-    result = cursor.fetchone()
-    total_amount = result[0] if result[0] is not None else 0
-    
-    # Get the true ending balance for the month and year, irrespective of direction
-    cursor.execute(f"SELECT balance FROM transactions WHERE month = ? AND year = ? ORDER BY transactionDate DESC, id DESC LIMIT 1", (month, year))
+    # the total for the direction and the true ending balance for the month, irrespective of direction
+    cursor.execute("SELECT %s, end_balance FROM monthly_summary WHERE year = ? AND month = ?" % DIRECTION_TOTALS[direction], (year, month))
     result = cursor.fetchone()
-    final_balance = result[0] if result else 0
-    
+    if result is None:
+        return 0, 0
+    total_amount, final_balance = result
     return total_amount, final_balance
 
 # Function to get total spending/saving for a specific year and plot it
@@ -110,10 +112,10 @@ def plot_total_amount_for_range(conn, direction, start_month, start_year, end_mo
 def get_highest_spending_last_period(conn, period, num, year=None):
     cursor = conn.cursor()
     if period == 'month':
-        query = "SELECT description, subClass, amount FROM transactions WHERE direction = 'debit' AND month = ? AND year = ? ORDER BY amount ASC LIMIT 1"
-        cursor.execute(query, (num, year))
+        query = "SELECT top_debit_description, top_debit_subclass, top_debit_amount FROM monthly_summary WHERE year = ? AND month = ? AND top_debit_amount IS NOT NULL"
+        cursor.execute(query, (year, num))
     elif period == 'year':
-        query = "SELECT description, subClass, amount FROM transactions WHERE direction = 'debit' AND year = ? ORDER BY amount ASC LIMIT 1"
+        query = "SELECT top_debit_description, top_debit_subclass, top_debit_amount FROM monthly_summary WHERE year = ? AND top_debit_amount IS NOT NULL ORDER BY top_debit_amount ASC, month ASC LIMIT 1"
         cursor.execute(query, (num,))
         
     data = cursor.fetchone()
@@ -140,22 +142,22 @@ def get_total_positive_amount_for_month_year(conn, month, year):
 
 def get_total_negative_amount_for_month_year(conn, month, year):
     cursor = conn.cursor()
-    cursor.execute("SELECT SUM(amount) FROM transactions WHERE amount < 0 AND month = ? AND year = ?", (month, year))
+    cursor.execute("SELECT negative_total FROM monthly_summary WHERE year = ? AND month = ?", (year, month))
     result = cursor.fetchone()
-    total_negative_amount = result[0] if result[0] is not None else 0
+    total_negative_amount = result[0] if result else 0
     return total_negative_amount
 
 
 def get_total_negative_amount_for_year(conn, year):
     cursor = conn.cursor()
-    cursor.execute("SELECT SUM(amount) FROM transactions WHERE amount < 0 AND year = ?", (year,))
+    cursor.execute("SELECT SUM(negative_total) FROM monthly_summary WHERE year = ?", (year,))
     result = cursor.fetchone()
     total_negative_amount = result[0] if result[0] is not None else 0
     return total_negative_amount
 
 def get_current_year(conn):
     cursor = conn.cursor()
-    cursor.execute("SELECT MAX(year) FROM transactions")
+    cursor.execute("SELECT MAX(year) FROM monthly_summary")
     result = cursor.fetchone()
     current_year = result[0] if result[0] is not None else None
     return current_year
@@ -169,7 +171,7 @@ def get_last_day_in_range(conn, month, year):
 
 def get_current_month(conn, year):
     cursor = conn.cursor()
-    cursor.execute("SELECT MAX(month) FROM transactions WHERE year = ?", (year,))
+    cursor.execute("SELECT MAX(month) FROM monthly_summary WHERE year = ?", (year,))
     result = cursor.fetchone()
     current_month = result[0] if result[0] is not None else None
     return current_month
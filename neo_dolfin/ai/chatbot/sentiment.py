@@ -0,0 +1,191 @@
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+
+from services import batching, datastore
+from services.cache import LRUCache
+
+# Sentiment of chat messages, tracked per chat session.
+# - One VADER analyzer is shared by every thread (its lexicon is loaded once; scoring only reads it).
+# - Each session's counts and last bot reply live in a bounded LRU store, updated under the session's own lock.
+# - When a negative message arrives while at least half of the session's messages have been negative, the exchange is
+#   flagged for review. Flagged exchanges are written to SQLite (CHATBOT_REVIEW_DB) by a background writer in batches,
+#   so a chat reply never waits on disk.
+
+app_log = logging.getLogger("dolfin.app")
+
+CHATBOT_SENTIMENT_SESSIONS = int(os.getenv("CHATBOT_SENTIMENT_SESSIONS", 10000))     # sessions kept in memory
+CHATBOT_REVIEW_DB = os.getenv("CHATBOT_REVIEW_DB", os.path.join(datastore.BASE_DIR, "db", "chatbot_reviews.db"))
+CHATBOT_REVIEW_FLUSH = float(os.getenv("CHATBOT_REVIEW_FLUSH", 1.0))       # seconds flagged exchanges may wait
+RECENT_NEGATIVES = 20       # negative exchanges kept per session
+
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+REVIEW_SHARE = 0.5          # flag once this share of a session's messages is negative
+
+REVIEW_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS negative_conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created REAL NOT NULL,
+        session_id TEXT,
+        user_id TEXT,
+        bot TEXT,
+        user TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_negative_conversations_created ON negative_conversations (created)",
+]
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def analyzer():
+    """
+    Returns:
+    \tThe process's shared VADER SentimentIntensityAnalyzer, created on first use.
+    """
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+                _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def classify(message):
+    """
+    Returns:
+    \t'positive', 'negative' or 'neutral' from the message's VADER compound score.
+    """
+    compound = analyzer().polarity_scores(message)["compound"]
+    if compound >= POSITIVE_THRESHOLD:
+        return 'positive'
+    if compound <= NEGATIVE_THRESHOLD:
+        return 'negative'
+    return 'neutral'
+
+
+class SessionSentiment:
+    """
+    Sentiment counts and context of one chat session.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'positive': 0, 'negative': 0, 'neutral': 0}
+        self.total = 0
+        self.last_bot_reply = ""
+        self.negatives = collections.deque(maxlen=RECENT_NEGATIVES)
+
+    def to_dict(self):
+        with self.lock:
+            return dict(self.counts, total=self.total)
+
+
+class ReviewLog:
+    """
+    Appends flagged exchanges to the negative_conversations table, batched on a background thread.
+    """
+
+    def __init__(self, db_path=CHATBOT_REVIEW_DB, flush_after=CHATBOT_REVIEW_FLUSH):
+        self.db_path = db_path
+        self._ready = False
+        self.writer = batching.MicroBatcher(self._write, max_batch=500, max_wait=flush_after, name='chatbot-reviews')
+
+    def add(self, session_id, user_id, bot, user):
+        self.writer.submit((time.time(), session_id, user_id, bot, user))
+
+    def flush(self, timeout=None):
+        self.writer.flush(timeout)
+
+    def _connection(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with datastore.connection(self.db_path) as conn:
+                for statement in REVIEW_SCHEMA:
+                    conn.execute(statement)
+            self._ready = True
+        return datastore.connection(self.db_path)
+
+    def _write(self, rows):
+        try:
+            with self._connection() as conn:
+                conn.executemany("INSERT INTO negative_conversations (created, session_id, user_id, bot, user) "
+                                 "VALUES (?, ?, ?, ?, ?)", rows)
+        except Exception as e:
+            app_log.error("CHATBOT: Writing %d flagged conversation(s) failed: %s" % (len(rows), e))
+        return [None] * len(rows)
+
+    def recent(self, limit=50):
+        """
+        Returns:
+        \tThe newest flagged exchanges, newest first: [{'created', 'session_id', 'user_id', 'bot', 'user'}, ...]
+        """
+        with self._connection() as conn:
+            rows = conn.execute("SELECT created, session_id, user_id, bot, user FROM negative_conversations "
+                                "ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(('created', 'session_id', 'user_id', 'bot', 'user'), row)) for row in rows]
+
+
+class SentimentTracker:
+    """
+    Per-session sentiment state (bounded - the least recently active sessions are forgotten first) plus totals over
+    every session this process has seen.
+    """
+
+    def __init__(self, max_sessions=CHATBOT_SENTIMENT_SESSIONS, review_log=None):
+        self.sessions = LRUCache(max_entries=max_sessions, sizeof=lambda state: 1)
+        self.review_log = review_log if review_log is not None else ReviewLog()
+        self._lock = threading.Lock()
+        self.totals = {'positive': 0, 'negative': 0, 'neutral': 0}
+
+    def session(self, session_id):
+        return self.sessions.get_or_compute(session_id, SessionSentiment)
+
+    def record(self, session_id, message, user_id=None):
+        """
+        Scores a user message against the session's history; a negative one is flagged for review together with the
+        bot reply it answered once at least REVIEW_SHARE of the session's messages are negative.
+
+        Returns:
+        \tThe message's sentiment: 'positive', 'negative' or 'neutral'.
+        """
+        sentiment = classify(message)     # outside any lock - scoring is the slow part
+        state = self.session(session_id)
+        with state.lock:
+            state.counts[sentiment] += 1
+            state.total += 1
+            flagged = False
+            if sentiment == 'negative':
+                state.negatives.append({'Bot': state.last_bot_reply, 'User': message})
+                flagged = state.counts['negative'] >= REVIEW_SHARE * state.total
+            bot_reply = state.last_bot_reply
+        with self._lock:
+            self.totals[sentiment] += 1
+        if flagged:
+            self.review_log.add(session_id, user_id, bot_reply, message)
+        return sentiment
+
+    def remember_reply(self, session_id, reply):
+        """
+        Records the bot's reply, the context for the session's next message.
+        """
+        state = self.session(session_id)
+        with state.lock:
+            state.last_bot_reply = reply
+
+    def stats(self):
+        with self._lock:
+            totals = dict(self.totals)
+        return dict(totals, total=sum(totals.values()), sessions=len(self.sessions))
+
+
+tracker = SentimentTracker()
+# flagged exchanges still queued when the process exits are written first
+atexit.register(tracker.review_log.flush, 5)
@@ -1,4 +1,6 @@
 import os
+import hashlib
+import json
 import logging
 import torch
 import sys
@@ -38,6 +40,8 @@ from transformers import (
 ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
 DOCUMENTS_DIR = f"{ROOT_DIR}/KnowledgeBase"
 VECTORSTORE_DIR = os.path.join(ROOT_DIR, "VectorStore")
+# What is in the vectorstore: each source file's content hash and chunk ids, plus the settings the chunks were made with
+MANIFEST_PATH = os.path.join(VECTORSTORE_DIR, "ingest_manifest.json")
 MODELS_DIR = os.path.join(ROOT_DIR, "models")
 
 # Create directories if they don't exist
@@ -48,6 +52,7 @@ os.makedirs(MODELS_DIR, exist_ok=True)
 NUM_INGEST_THREADS = os.cpu_count() or 8
 CHUNK_SIZE = 4096
 MAX_CHUNK_OVERLAP = 200
+CODE_CHUNK_SIZE = CHUNK_SIZE - 120
 MAX_TOKENS = CHUNK_SIZE
 
 # GPU settings
@@ -79,6 +84,14 @@ EMBEDDINGS_MODEL_NAME = "hkunlp/instructor-large"
 LLM_MODEL_ID = "TheBloke/Llama-2-7b-Chat-GGUF"
 LLM_MODEL_BASENAME = "llama-2-7b-chat.Q4_K_M.gguf"
 
+# Changing any of these invalidates every stored chunk, so the next ingest rebuilds the vectorstore
+INGEST_SETTINGS = {
+    "chunk_size": CHUNK_SIZE,
+    "chunk_overlap": MAX_CHUNK_OVERLAP,
+    "code_chunk_size": CODE_CHUNK_SIZE,
+    "embeddings_model": EMBEDDINGS_MODEL_NAME,
+}
+
 def write_log(log_entry):
     """
     Write a log entry to the log file and print it to the console.
@@ -119,18 +132,29 @@ def load_documents_batch(file_paths):
             documents = [future.result() for future in futures]
             return documents, file_paths
 
-def load_documents(documents_dir: str) -> list[Document]:
+def find_documents(documents_dir: str) -> list[str]:
     """
-    Load all documents from the given directory using multiprocessing.
+    List the files in the given directory that have a document loader.
     """
     file_paths = []
     for root, _, files in os.walk(documents_dir):
         for file_name in files:
-            print(f"Importing: {file_name}")
             file_extension = os.path.splitext(file_name)[1]
             file_path = os.path.join(root, file_name)
             if file_extension in DOC_LOADER_MAP.keys():
                 file_paths.append(file_path)
+    return sorted(file_paths)
+
+def load_documents(documents_dir: str, file_paths: list[str] = None) -> list[Document]:
+    """
+    Load the given files (all documents in the directory by default) using multiprocessing.
+    """
+    if file_paths is None:
+        file_paths = find_documents(documents_dir)
+    if not file_paths:
+        return []
+    for file_path in file_paths:
+        print(f"Importing: {os.path.basename(file_path)}")
 
     num_workers = min(NUM_INGEST_THREADS, max(len(file_paths), 1))
     batch_size = round(len(file_paths) / num_workers)
@@ -170,33 +194,118 @@ def split_documents(documents: list[Document]) -> tuple[list[Document], list[Doc
                 text_documents.append(doc)
     return text_documents, code_documents
 
-def ingest_documents():
+def file_hash(file_path: str) -> str:
     """
-    Ingest documents from the source directory, split them into chunks, and store them in the vectorstore.
+    SHA-256 of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path=MANIFEST_PATH) -> dict:
+    """
+    Read the ingestion manifest; an unreadable or missing one is treated as empty.
+    """
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest: dict, manifest_path=MANIFEST_PATH):
+    """
+    Write the ingestion manifest atomically, so an interrupted ingest never leaves a half-written one.
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def plan_ingest(documents_dir: str, manifest: dict, settings=INGEST_SETTINGS):
+    """
+    Compare the documents on disk with the manifest.
+    Returns (rebuild, changed, deleted, hashes): whether the whole store must be rebuilt (no manifest, or different
+    chunking/embedding settings), the files that are new or whose content changed, the files that are gone, and the
+    current hash of every file - all keyed by path relative to documents_dir.
+    """
+    hashes = {os.path.relpath(path, documents_dir): file_hash(path) for path in find_documents(documents_dir)}
+    files = manifest.get("files", {})
+    rebuild = manifest.get("settings") != settings
+    if rebuild:
+        return True, sorted(hashes), sorted(files), hashes
+    changed = sorted(name for name, digest in hashes.items() if files.get(name, {}).get("sha256") != digest)
+    deleted = sorted(name for name in files if name not in hashes)
+    return False, changed, deleted, hashes
+
+def chunk_documents(documents: list[Document]) -> list[Document]:
+    """
+    Split documents into chunks: code with the Python splitter, everything else with the text splitter.
     """
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    logging.info(f"Loading documents from {DOCUMENTS_DIR}")
-    documents = load_documents(DOCUMENTS_DIR)
     text_docs, code_docs = split_documents(documents)
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=MAX_CHUNK_OVERLAP)
     code_splitter = RecursiveCharacterTextSplitter.from_language(
-        language=Language.PYTHON, chunk_size=CHUNK_SIZE - 120, chunk_overlap=MAX_CHUNK_OVERLAP
+        language=Language.PYTHON, chunk_size=CODE_CHUNK_SIZE, chunk_overlap=MAX_CHUNK_OVERLAP
     )
-    text_chunks = text_splitter.split_documents(text_docs)
-    code_chunks = code_splitter.split_documents(code_docs)
-    chunks = text_chunks + code_chunks
-    logging.info(f"Loaded {len(documents)} documents from {DOCUMENTS_DIR}")
-    logging.info(f"Split into {len(chunks)} chunks")
+    return text_splitter.split_documents(text_docs) + code_splitter.split_documents(code_docs)
 
-    embeddings = get_embeddings(device)
-    logging.info(f"Loaded embeddings from {EMBEDDINGS_MODEL_NAME}")
+def ingest_documents():
+    """
+    Bring the vectorstore up to date with the source directory. Only files that are new or whose content changed are
+    loaded, split and embedded; their previous chunks are replaced, and the chunks of deleted files are removed.
+    A restart with nothing changed loads neither the documents nor the embeddings model.
+    """
+    manifest = load_manifest()
+    rebuild, changed, deleted, hashes = plan_ingest(DOCUMENTS_DIR, manifest)
+    if not rebuild and not changed and not deleted:
+        logging.info(f"Vectorstore is up to date with {DOCUMENTS_DIR} ({len(hashes)} documents)")
+        return
+
+    embeddings = None      # removing chunks doesn't need the model
+    if changed:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        embeddings = get_embeddings(device)
+        logging.info(f"Loaded embeddings from {EMBEDDINGS_MODEL_NAME}")
+    vectorstore = Chroma(persist_directory=VECTORSTORE_DIR, embedding_function=embeddings, client_settings=CHROMA_SETTINGS)
 
-    vectorstore = Chroma.from_documents(
-        chunks,
-        embeddings,
-        persist_directory=VECTORSTORE_DIR,
-        client_settings=CHROMA_SETTINGS,
-    )
+    files = manifest.get("files", {})
+    if rebuild:
+        # chunks made with other settings (or by an ingest that kept no manifest) can't be matched to files - start over
+        logging.info("No manifest or ingest settings changed - rebuilding the vectorstore")
+        vectorstore.delete_collection()
+        vectorstore = Chroma(persist_directory=VECTORSTORE_DIR, embedding_function=embeddings, client_settings=CHROMA_SETTINGS)
+        files = {}
+    else:
+        stale_ids = [chunk_id for name in changed + deleted for chunk_id in files.get(name, {}).get("chunks", [])]
+        if stale_ids:
+            vectorstore.delete(ids=stale_ids)
+        for name in deleted:
+            files.pop(name, None)
+        logging.info(f"Removed {len(stale_ids)} chunks of {len(changed) + len(deleted)} changed or deleted documents")
+
+    logging.info(f"Loading {len(changed)} new or changed documents from {DOCUMENTS_DIR}")
+    documents = load_documents(DOCUMENTS_DIR, [os.path.join(DOCUMENTS_DIR, name) for name in changed])
+    chunks = chunk_documents(documents)
+    logging.info(f"Split into {len(chunks)} chunks")
+
+    # chunk ids are derived from the file and its content, so the next ingest knows exactly what to delete
+    chunk_ids = {name: [] for name in changed}
+    ids = []
+    for chunk in chunks:
+        name = os.path.relpath(chunk.metadata["source"], DOCUMENTS_DIR)
+        chunk_id = f"{name}:{hashes[name][:16]}:{len(chunk_ids[name])}"
+        chunk_ids[name].append(chunk_id)
+        ids.append(chunk_id)
+    if chunks:
+        vectorstore.add_documents(chunks, ids=ids)
+
+    loaded = {os.path.relpath(doc.metadata["source"], DOCUMENTS_DIR) for doc in documents if doc is not None}
+    for name in changed:
+        # a file that failed to load is recorded without its hash, so the next ingest retries it
+        files[name] = {"sha256": hashes[name] if name in loaded else None, "chunks": chunk_ids[name]}
+    save_manifest({"settings": INGEST_SETTINGS, "files": files})
+    logging.info(f"Embedded {len(chunks)} chunks from {len(changed)} documents")
 
 # System prompt for the language model
 SYSTEM_PROMPT = """You are a helpful financial well-being and open banking website application assistant. Use the provided context to answer user questions.
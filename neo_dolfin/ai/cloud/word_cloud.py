@@ -5,6 +5,18 @@ from io import BytesIO
 from flask import jsonify
 
 
+def to_base64(wordcloud_object):
+    """
+    Encodes a WordCloud object as a base64 PNG string.
+
+    :param wordcloud_object: The WordCloud object to be encoded.
+    :return: Base64-encoded PNG image.
+    """
+    img = BytesIO()
+    wordcloud_object.to_image().save(img, 'PNG')
+    return base64.b64encode(img.getvalue()).decode('utf-8')
+
+
 def generate(data_with_level, level, mode='default', preprocess=True, whether_jsonify=True):
     """
     Generates a word cloud from the provided data, filtered by a specified level,
@@ -57,10 +69,7 @@ def generate(data_with_level, level, mode='default', preprocess=True, whether_js
         :param wordcloud_object: The WordCloud object to be converted.
         :return: JSON response containing the word cloud image.
         """
-        img = BytesIO()
-        wordcloud_object.to_image().save(img, 'PNG')
-        img_base64 = base64.b64encode(img.getvalue()).decode('utf-8')
-        return jsonify({"image": img_base64})
+        return jsonify({"image": to_base64(wordcloud_object)})
 
     preprocessed_data = preprocess_data(data_with_level, level) if preprocess else data_with_level.copy()
     freq_dict = amount_frequency(preprocessed_data) if mode == 'amount' else default_frequency(preprocessed_data)
@@ -9,24 +9,13 @@ from operator import itemgetter
 import csv
 import itertools
 import datetime
-import SavingPredAIUtil as util
+try:
+    from ai.savings import SavingPredAIUtil as util     # imported from the app (neo_dolfin is the working directory)
+except ImportError:
+    import SavingPredAIUtil as util                     # run as a script from this folder
 
-#read input file 
-transfile = "neo_dolfin/static/data/modified_transactions_data.csv"
-df = util.read_file(path = transfile )
-
-#resample the DataFrame with daily frequency and forward-fill missing values
-data= util.data_resample(df)
-
-# Split the data into train and test
-train_data,test_data = util.train_testsplit(data,0.8)
-print("train sample:\n", train_data.head(3))
-print("test sample:\n", test_data.head(3))
-
-# checking stationarity
-util.ad_test(train_data) 
-
-print("Stationarity check performed.")
+# Fewest days of balance history a forecast is attempted on
+MIN_HISTORY_DAYS = 30
 
 def modeltriplets():
     p = d = q = range(0, 2)
@@ -42,10 +31,9 @@ def modeltriplets():
     print('SARIMAX: {} x {}'.format(pdq[1], seasonal_pdq[2]))
     print('SARIMAX: {} x {}'.format(pdq[2], seasonal_pdq[3]))
     return seasonal_pdq,pdq
-seasonal_pdq,pdq = modeltriplets()
 
 #vals = pd.DataFrame(columns=["pdq","seasonal_pdq","AIC"])
-def get_SARIMAX_Vals(): 
+def get_SARIMAX_Vals(df, pdq, seasonal_pdq):
     AIC=[]
     pdqs=[]
     seas_pdq=[]
@@ -57,17 +45,16 @@ def get_SARIMAX_Vals():
                                                 enforce_stationarity=True,
                                                 enforce_invertibility=False)
 
-            results = mod.fit()
+            try:
+                results = mod.fit(disp=False)
+            except (ValueError, np.linalg.LinAlgError) as e:
+                print('ARIMA{}x{}12 - skipped: {}'.format(param, param_seasonal, e))
+                continue
             pdqs.append(param)
             seas_pdq.append(param_seasonal)
             AIC.append(results.aic)
             print('ARIMA{}x{}12 - AIC:{}'.format(param, param_seasonal, results.aic))
     return pdqs,seas_pdq,AIC
-pdq_param,seas_pdq_param,AIC = get_SARIMAX_Vals() 
-
-params = pd.DataFrame(list(zip(pdq_param, seas_pdq_param,AIC)), columns =['pdq', 'seas_pdq','AIC']) 
-#print(params) 
-#print("minimum AIC:", min(params.AIC))
 
 def findbestpdq(params):
     params = params.sort_values(by='AIC', ascending=True)
@@ -79,30 +66,83 @@ def findbestpdq(params):
     print("seasonal values", spdq_fit)
     return pdq_fit,spdq_fit
 
-pdqfit, spdqfit = findbestpdq(params)
-
-def modelfit(pdqfit, spdqfit):
+def modelfit(train_data, pdqfit, spdqfit):
     mod = sm.tsa.statespace.SARIMAX(train_data,
                                 order=pdqfit,
                                 seasonal_order= spdqfit,
                                 enforce_stationarity=False,
                                 enforce_invertibility=False)
 
-    results = mod.fit()
+    results = mod.fit(disp=False)
     print(results.summary().tables[1])
     return results
 
-def drawPredictions():
-    results = modelfit(pdqfit,spdqfit)  
-    current = datetime.date.today() 
-    start= current - datetime.timedelta(days=180)
-    end = current + datetime.timedelta(days=180)
+def drawPredictions(results, start, end, predtrans_file=None):
     pred = results.get_prediction(start=pd.to_datetime(start),end=pd.to_datetime(end), dynamic=False)
     pred_ci = pred.conf_int()
     #print(pred_ci)
     #print(pred.predicted_mean)
     pred_mean = pd.DataFrame(pred.predicted_mean)
     pred_ci['mean_balance'] = pred_mean
-    predtrans_file = "neo_dolfin/static/Predicted_Balances.csv"
-    pred_ci.to_csv(predtrans_file, sep='\t')
-    return pred
\ No newline at end of file
+    if predtrans_file:
+        pred_ci.to_csv(predtrans_file, sep='\t')
+    return pred_ci
+
+def forecast(trans_data, days=90):
+    """
+    Forecasts the daily balance from a user's transactions: picks the SARIMAX orders with the lowest AIC, fits them to
+    the whole history and predicts the next days.
+    This is slow (one model fit per parameter combination) - the app runs it as a background job.
+    :param trans_data: DataFrame with postDate and balance columns, e.g. the user's transactions table.
+    :param days: How many days past the last transaction to forecast.
+    :return: DataFrame indexed by date with lower balance, upper balance and mean_balance columns.
+    """
+    balances = trans_data[['postDate', 'balance']].dropna().copy()
+    balances['postDate'] = pd.to_datetime(balances['postDate']).dt.normalize()
+    # the closing balance of each day
+    balances = balances.sort_values('postDate', kind='stable').groupby('postDate', as_index=False).last()
+    if len(balances) < 2 or (balances['postDate'].iloc[-1] - balances['postDate'].iloc[0]).days < MIN_HISTORY_DAYS:
+        raise ValueError("At least %d days of transactions are needed for a forecast" % MIN_HISTORY_DAYS)
+
+    data = util.data_resample(balances)
+    series = data.set_index('postDate')['balance'].asfreq('D')
+    seasonal_pdq, pdq = modeltriplets()
+    pdq_param, seas_pdq_param, AIC = get_SARIMAX_Vals(series, pdq, seasonal_pdq)
+    params = pd.DataFrame(list(zip(pdq_param, seas_pdq_param, AIC)), columns=['pdq', 'seas_pdq', 'AIC'])
+    pdqfit, spdqfit = findbestpdq(params)
+    results = modelfit(series, pdqfit, spdqfit)
+    start = series.index[-1] + datetime.timedelta(days=1)
+    return drawPredictions(results, start, series.index[-1] + datetime.timedelta(days=days))
+
+if __name__ == '__main__':
+    #read input file
+    transfile = "neo_dolfin/static/data/modified_transactions_data.csv"
+    df = util.read_file(path = transfile )
+
+    #resample the DataFrame with daily frequency and forward-fill missing values
+    data= util.data_resample(df)
+
+    # Split the data into train and test
+    train_data,test_data = util.train_testsplit(data,0.8)
+    print("train sample:\n", train_data.head(3))
+    print("test sample:\n", test_data.head(3))
+
+    # checking stationarity
+    util.ad_test(train_data)
+
+    print("Stationarity check performed.")
+
+    seasonal_pdq,pdq = modeltriplets()
+    pdq_param,seas_pdq_param,AIC = get_SARIMAX_Vals(df, pdq, seasonal_pdq)
+
+    params = pd.DataFrame(list(zip(pdq_param, seas_pdq_param,AIC)), columns =['pdq', 'seas_pdq','AIC'])
+    #print(params)
+    #print("minimum AIC:", min(params.AIC))
+
+    pdqfit, spdqfit = findbestpdq(params)
+
+    results = modelfit(train_data, pdqfit, spdqfit)
+    current = datetime.date.today()
+    start= current - datetime.timedelta(days=180)
+    end = current + datetime.timedelta(days=180)
+    drawPredictions(results, start, end, "neo_dolfin/static/Predicted_Balances.csv")
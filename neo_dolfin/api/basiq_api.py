@@ -1,51 +1,43 @@
 import requests
 
+from api import transport
+
 
 class Core:
 
     def __init__(self, api_key):
         self.api_key = api_key
 
-    def generate_auth_token(self):
-        url = "https://au-api.basiq.io/token"
-
+    def request_auth_token(self):
         headers = {
-            "accept": "application/json",
             "basiq-version": "3.0",
             "content-type": "application/x-www-form-urlencoded",
             "Authorization": "Basic " + self.api_key
         }
 
-        response = requests.post(url, headers=headers)
-        response_data = response.json()
+        return transport.post("/token", headers=headers, idempotent=True)
+
+    def generate_auth_token(self):
+        response_data = self.request_auth_token()
 
         access_token = response_data["access_token"]
         return access_token
 
     @staticmethod
     def create_user_by_dict(user_payload, access_token):
-        url = "https://au-api.basiq.io/users"
+        url = "/users"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = user_payload
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def create_user(user_first_name, user_middle_name, user_last_name, user_email, user_mobile, access_token):
-        url = "https://au-api.basiq.io/users"
+        url = "/users"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = {
             "email": user_email,
@@ -55,44 +47,30 @@ class Core:
             "lastName": user_last_name
         }
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def retrieve_user(user_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}"
+        url = f"/users/{user_id}"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
-        response = requests.get(url, headers=headers)
-        return response.text
+        headers = transport.bearer(access_token)
+        return transport.get(url, headers=headers, raise_errors=False)
 
     @staticmethod
     def update_user_by_dict(user_id, user_payload, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}"
+        url = f"/users/{user_id}"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = user_payload
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def update_user(user_id, user_first_name, user_last_name, user_email, user_mobile, access_token, user_middle_name=''):
-        url = f"https://au-api.basiq.io/users/{user_id}"
+        url = f"/users/{user_id}"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = {
             "email": user_email,
@@ -102,39 +80,27 @@ class Core:
             "lastName": user_last_name
         }
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def create_auth_link(user_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/auth_link"
+        url = f"/users/{user_id}/auth_link"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.post(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
     @staticmethod
     def retrieve_auth_link(user_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/auth_link"
+        url = f"/users/{user_id}/auth_link"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.get(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
@@ -146,105 +112,93 @@ class Data:
 
     @staticmethod
     def all_accounts(user_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/accounts"
+        url = f"/users/{user_id}/accounts"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
-
-        response = requests.get(url, headers=headers)
+        headers = transport.bearer(access_token)
 
-        return response.text
+        return transport.get(url, headers=headers, raise_errors=False)
 
     @staticmethod
     def get_account(user_id, account_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/accounts/{account_id}"
-
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        url = f"/users/{user_id}/accounts/{account_id}"
 
-        response = requests.get(url, headers=headers)
+        headers = transport.bearer(access_token)
 
-        return response.text
+        return transport.get(url, headers=headers, raise_errors=False)
 
     @staticmethod
     def get_transactions(user_id, access_token, limit_para=500, filter_para=''):
-        url = f"https://au-api.basiq.io/users/{user_id}/transactions?limit={limit_para}&filter={filter_para}"
+        url = f"/users/{user_id}/transactions"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
-        response = requests.get(url, headers=headers)
-        return response.text
+        params = {"limit": limit_para, "filter": filter_para}
+
+        return transport.get(url, headers=headers, params=params, raise_errors=False)
+
+    @staticmethod
+    def iter_transactions(user_id, access_token, limit_para=500, filter_para='', max_pages=None):
+        """
+        Generator over every page of a user's transactions, following links.next. Yields each page's list of
+        transaction dicts; stops after max_pages pages (None = the full history).
+        """
+        url = f"/users/{user_id}/transactions"
+
+        headers = transport.bearer(access_token)
+
+        params = {"limit": limit_para, "filter": filter_para}
+
+        pages = 0
+        while url and (max_pages is None or pages < max_pages):
+            page = transport.get(url, headers=headers, params=params)
+            params = None   # the next link already carries the query
+            transactions = page.get('data') or []
+            if not transactions:
+                return
+            pages += 1
+            yield transactions
+            url = (page.get('links') or {}).get('next')
 
     @staticmethod
     def get_transaction(user_id, transaction_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/transactions/{transaction_id}"
+        url = f"/users/{user_id}/transactions/{transaction_id}"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.get(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
     @staticmethod
     def get_affordability_report(user_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/affordability"
+        url = f"/users/{user_id}/affordability"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            return response.text
+            return transport.post(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
     @staticmethod
     def get_expenses(user_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/expenses"
+        url = f"/users/{user_id}/expenses"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.post(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
     @staticmethod
     def get_income(user_id, access_token):
-        url = f"https://au-api.basiq.io/users/{user_id}/income"
+        url = f"/users/{user_id}/income"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.post(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
\ No newline at end of file
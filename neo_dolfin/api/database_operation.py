@@ -1,5 +1,7 @@
 import sqlite3
 from api.basiq_api import Core, Data
+from api import token_manager
+from services import datastore, ingest
 import os
 from dotenv import load_dotenv
 import json
@@ -12,8 +14,13 @@ API_KEY = os.getenv("API_KEY")
 api_key = API_KEY
 core_instance = Core(api_key)
 data_instance = Data()
-access_token = core_instance.generate_auth_token()
-database_address = "../db/dolfin_db.db"
+# Auth tokens are fetched on first use and renewed before their 60 minute expiry (see api/token_manager.py)
+basiq_token = token_manager.shared(api_key, core_instance.request_auth_token)
+database_address = datastore.DOLFIN_DB
+
+# DataFrame columns from request_transactions() written to the transactions table (trans_u_id is added per user)
+TRANSACTION_COLUMNS = ['id', 'type', 'status', 'description', 'amount', 'account', 'balance', 'direction', 'class',
+                       'institution', 'postDate', 'subClass_title', 'subClass_code']
 
 
 def init_dolfin_db():
@@ -22,7 +29,7 @@ def init_dolfin_db():
     Sets up foreign key constraints as well.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             conn.execute("PRAGMA foreign_keys = ON;")
             cursor = conn.cursor()
             cursor.execute('''
@@ -74,7 +81,7 @@ def register_user(email, mobile, first_name, middle_name, last_name, password, g
     Parameters include personal information, credentials of the user, and address details.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             cursor = conn.cursor()
             cursor.execute('''INSERT INTO users (email, mobile, first_name, middle_name, last_name, password, gender, occupation, birth, address, city, country, state, postcode)
                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
@@ -97,7 +104,7 @@ def get_basiq_id(user_id):
     - The Basiq ID of the user if found, otherwise a message indicating no user was found.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT basiq_id FROM users WHERE u_id = ?", (user_id,))
             result = cursor.fetchone()
@@ -121,7 +128,7 @@ def get_user_info(user_id):
       otherwise a message indicating no user was found.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT email, mobile, first_name, middle_name, last_name FROM users WHERE u_id = ?",
                            (user_id,))
@@ -153,8 +160,8 @@ def register_basiq_id(user_id):
       otherwise a message indicating no user was found or an error occurred.
     """
     try:
-        new_basiq_id = json.loads(core_instance.create_user_by_dict(get_user_info(user_id), access_token)).get('id')
-        with sqlite3.connect(database_address) as conn:
+        new_basiq_id = core_instance.create_user_by_dict(get_user_info(user_id), basiq_token.get()).get('id')
+        with datastore.connection(database_address) as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET basiq_id = ? WHERE u_id = ?", (new_basiq_id, user_id))
             if cursor.rowcount == 0:
@@ -178,12 +185,12 @@ def link_bank_account(user_id):
     """
 
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT basiq_id FROM users WHERE u_id = ?", (user_id,))
             result = cursor.fetchone()
             if result:
-                link = json.loads(core_instance.create_auth_link(result[0], access_token)).get('links').get('public')
+                link = core_instance.create_auth_link(result[0], basiq_token.get()).get('links').get('public')
                 webbrowser.open(link)
             else:
                 return "No user found with the given ID."
@@ -201,8 +208,20 @@ def request_transactions(user_id):
     Returns:
     - A DataFrame containing the transaction data for the user.
     """
-    tran_data = json.loads(data_instance.get_transactions(get_basiq_id(user_id), access_token))
-    transaction_list = tran_data['data']
+    tran_data = data_instance.get_transactions(get_basiq_id(user_id), basiq_token.get())
+    return transactions_to_df(tran_data['data'])
+
+
+def transactions_to_df(transaction_list):
+    """
+    Converts one page of Basiq transactions (the 'data' list of the JSON response) into a DataFrame.
+
+    Parameters:
+    - transaction_list: List of transaction dicts.
+
+    Returns:
+    - A DataFrame with one row per transaction.
+    """
     transactions = []
     for transaction in transaction_list:
         # Add try-except block to handle missing 'id' key
@@ -226,7 +245,7 @@ def request_transactions(user_id):
         except KeyError as e:
             # Handle the case where 'id' key is missing
             print(f"Skipping transaction: {e}")
-    transaction_df = pd.DataFrame(transactions)
+    transaction_df = pd.DataFrame(transactions, columns=TRANSACTION_COLUMNS)
     return transaction_df
 
 
@@ -239,28 +258,42 @@ def cache_transactions(user_id, tran_data):
     - tran_data: A DataFrame containing the transaction data to be cached.
 
     Returns:
-    - A message indicating the transactions were successfully inserted, or an error message if an error occurred.
+    - A dict of counts {'inserted': n, 'updated': n, 'skipped': n}, or an error message if an error occurred.
+      Transactions already stored are updated in place; rows without an id or with unchanged values are skipped.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             conn.execute("PRAGMA foreign_keys = ON;")
-            cursor = conn.cursor()
-            insert_statement = '''
-                INSERT INTO transactions (id, type, status, description, amount, account, balance, direction, class, institution, postDate, subClass_title, subClass_code, trans_u_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            '''
-            for index, row in tran_data.iterrows():
-                cursor.execute(insert_statement, (
-                    row['id'], row['type'], row['status'], row['description'], row['amount'],
-                    row['account'], row['balance'], row['direction'], row['class'], row['institution'],
-                    row['postDate'], row['subClass_title'], row['subClass_code'], user_id))
-
-        return "Transactions successfully inserted."
+            return ingest.upsert_frame(conn, 'transactions', tran_data, TRANSACTION_COLUMNS,
+                                       constants={'trans_u_id': user_id})
 
     except sqlite3.Error as e:
         return "An error occurred: " + str(e)
 
 
+def stream_transactions(user_id, limit_para=500, max_pages=None):
+    """
+    Fetches a user's transactions page by page (following the API's links.next cursor) and caches each page as it
+    arrives, so memory use is bounded by one page however long the user's history is.
+
+    Parameters:
+    - user_id: The unique identifier of the user whose transactions are being cached.
+    - limit_para: Transactions per page.
+    - max_pages: Stop after this many pages; None fetches the full history.
+
+    Returns:
+    - A dict of counts {'inserted': n, 'updated': n, 'skipped': n} summed over all pages, or an error message.
+    """
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    for page in data_instance.iter_transactions(get_basiq_id(user_id), basiq_token.get(), limit_para, max_pages=max_pages):
+        counts = cache_transactions(user_id, transactions_to_df(page))
+        if not isinstance(counts, dict):
+            return counts
+        for key in totals:
+            totals[key] += counts[key]
+    return totals
+
+
 def fetch_transactions_by_user(user_id):
     """
     Fetches all transactions from the database for a given user.
@@ -272,7 +305,7 @@ def fetch_transactions_by_user(user_id):
     - A DataFrame containing all the transactions for the user, or prints an error message if an error occurred.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             query = "SELECT * FROM transactions WHERE trans_u_id = ?"
             return pd.read_sql_query(query, conn, params=(user_id,))
     except sqlite3.Error as e:
@@ -290,7 +323,7 @@ def clear_transactions(user_id):
     - A message indicating the transactions for the user were successfully cleared, or an error message if an error occurred.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM transactions WHERE trans_u_id = ?;", (user_id,))
         return "Transactions for user {} cleared successfully.".format(user_id)
@@ -309,7 +342,7 @@ def verify_user(email, provided_password):
     :return: The user's ID if the email and password match, None otherwise.
     """
     try:
-        with sqlite3.connect(database_address) as conn:
+        with datastore.connection(database_address) as conn:
             cursor = conn.cursor()
             cursor.execute('''SELECT u_id, password FROM users WHERE email = ?''', (email,))
             user_record = cursor.fetchone()
@@ -1,8 +1,11 @@
 import sqlite3
 from .optimized_API import Core, Data
+from api import token_manager
+from services import datastore, frames, ingest, jobs, migrations, rollup, sync, tenants
 import os
 from dotenv import load_dotenv
 import json
+import requests
 import webbrowser
 import logging
 import pandas as pd
@@ -14,13 +17,43 @@ API_KEY = os.getenv("API_KEY")
 api_key = API_KEY
 core_instance = Core(api_key)
 data_instance = Data()
-access_token = core_instance.generate_auth_token()
+# Auth tokens are fetched on first use and renewed before their 60 minute expiry (see api/token_manager.py)
+basiq_token = token_manager.shared(api_key, core_instance.request_auth_token)
 
 basiq_log   = logging.getLogger("dolfin.basiq")
 
-# Use path variables if locations ever change.
-user_db_path = "db/user_database.db"
-transactions_db_path = "transactions_ut.db"
+# Use path variables if locations ever change. Connections come from the shared pool in services/datastore.py
+user_db_path = datastore.USER_DB
+# Transactions are cached per user, one database each - see services/tenants.py
+
+# Pages of transactions fetched for a user's first (full) sync. Unset = the latest 500, "all" = the full history.
+BASIQ_HISTORY_PAGES = os.getenv("BASIQ_HISTORY_PAGES", "1")
+BASIQ_HISTORY_PAGES = None if BASIQ_HISTORY_PAGES.lower() == "all" else int(BASIQ_HISTORY_PAGES)
+
+# DataFrame columns from request_transactions_df() written to the transactions table
+TRANSACTION_COLUMNS = ['id', 'type', 'status', 'description', 'amount', 'account', 'balance', 'direction', 'class',
+                       'institution', 'transactionDate', 'postDate', 'subClass', 'day', 'month', 'year']
+
+# Callbacks run after the cached transactions are rewritten, so anything built from them (e.g. dashboard caches) is dropped.
+_transaction_listeners = []
+
+
+def on_transactions_changed(callback):
+    """
+    Registers a callback to be run whenever cache_transactions() or clear_transactions() changes a user's transactions.
+    The callback receives the affected username.
+    """
+    _transaction_listeners.append(callback)
+    return callback
+
+
+def _notify_transactions_changed(user_id=None):
+    for callback in _transaction_listeners:
+        try:
+            callback(user_id)
+        except Exception as e:
+            basiq_log.error("CACHE - Transaction change listener failed: " + str(e))
+
 
 ## Operations specifically for interacting with the Dolfin Database, using functions from optimized_API.py
 
@@ -32,7 +65,7 @@ def init_dolfin_db():
     T3 2023 - "users_new" will, for the time be, be our primary user profile storage
     """
     try:
-        with sqlite3.connect(user_db_path) as conn:
+        with datastore.connection(user_db_path) as conn:
             conn.execute("PRAGMA foreign_keys = ON;")
             cursor = conn.cursor()
             ## ADRESS FIELDS WILL NEED TO BE ADDED HERE
@@ -57,6 +90,22 @@ def init_dolfin_db():
         return "INITIALISE - An error occurred: " + str(e)
 
 
+def init_transactions_db():
+    """
+    Creates the per-user transaction store directory and upgrades the shared demo cache (transactions_ut.db, used by
+    the chatbot when nobody is signed in) to the latest schema. Each user's own database is created or upgraded the
+    first time it is opened (services/tenants.py). Schema changes live in services/migrations.py.
+    """
+    try:
+        os.makedirs(tenants.TRANSACTIONS_DIR, exist_ok=True)
+        applied = migrations.upgrade(datastore.TRANSACTIONS_DB)
+        basiq_log.info("Transactions database at schema version %d." % migrations.LATEST_VERSION)
+        return "INITIALISE - Transactions database ready (applied migrations: %s)." % (applied or "none")
+    except sqlite3.Error as e:
+        basiq_log.error("INITIALISE - Transactions database migration failed: " + str(e))
+        return "INITIALISE - Transactions database migration failed: " + str(e)
+
+
 def register_user(username, email, mobile, first_name, middle_name, last_name, password):
     """
     Registers a new DolFin user.
@@ -66,7 +115,7 @@ def register_user(username, email, mobile, first_name, middle_name, last_name, p
     ADDRESS - Later will require address values
     """
     try:
-        with sqlite3.connect(user_db_path) as conn:
+        with datastore.connection(user_db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''INSERT INTO users_new (username, email, mobile, first_name, middle_name, last_name, password)
                               VALUES (?, ?, ?, ?, ?, ?, ?)''',
@@ -91,7 +140,7 @@ def get_basiq_id(username):
     \tString: basiq_ID
     """
     try:
-        with sqlite3.connect(user_db_path) as conn:
+        with datastore.connection(user_db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT b_id_temp FROM users_new WHERE username = ?",(username,))
             result = cursor.fetchone()
@@ -109,7 +158,7 @@ def get_user_info(user_id):
     Queries databse for basic information of a user by user ID, including email, mobile, first name, middle name, and last name.
     """
     try:
-        with sqlite3.connect(user_db_path) as conn:
+        with datastore.connection(user_db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT email, mobile, first_name, middle_name, last_name FROM users_new WHERE id = ?",(user_id,))
             result = cursor.fetchone()
@@ -134,8 +183,8 @@ def register_basiq_id(user_id):
     Generates a basiq ID based on user information and updates the basiq ID field in the users table.
     """
     try:
-        new_basiq_id = json.loads(core_instance.create_user_by_dict(get_user_info(user_id), access_token)).get('id')
-        with sqlite3.connect(user_db_path) as conn:
+        new_basiq_id = core_instance.create_user_by_dict(get_user_info(user_id), basiq_token.get()).get('id')
+        with datastore.connection(user_db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users_new SET b_id_temp = ? WHERE id = ?", (new_basiq_id, user_id))
             if cursor.rowcount == 0:
@@ -153,12 +202,12 @@ def link_bank_account(user_id):
     Generates an authorization link based on the user's basiq ID and opens it in a web browser.
     """
     try:
-        with sqlite3.connect(user_db_path) as conn:
+        with datastore.connection(user_db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT b_id_temp FROM users_new WHERE id = ?", (user_id,))
             result = cursor.fetchone()
             if result:
-                link = json.loads(core_instance.create_auth_link(result[0], access_token)).get('links').get('public')
+                link = core_instance.create_auth_link(result[0], basiq_token.get()).get('links').get('public')
                 webbrowser.open(link)
                 # ^^^ a html popup that informs the user that they need to go link their account in the new tab should popup here so the user knows what they need to do now
                 basiq_log.info("AUTH LINK: Link (%s) sent to %s"%(link,user_id))
@@ -173,9 +222,25 @@ def request_transactions_df(user_id, limit_para=500, filter_para=None):
     Requests and returns user transaction data in DataFrame format.
     Fetches the transaction list based on the user's basiq ID and converts it into a DataFrame.
     """
-    tran_data = json.loads(data_instance.get_transaction_list(access_token, get_basiq_id(user_id), limit_para, filter_para))
-    transaction_list = tran_data['data']
-    
+    tran_data = data_instance.get_transaction_list(basiq_token.get(), get_basiq_id(user_id), limit_para, filter_para)
+    return transactions_to_df(tran_data['data'])
+
+
+def iter_transactions_df(user_id, limit_para=500, filter_para=None, max_pages=None):
+    """
+    Streams a user's transactions page by page (following Basiq's links.next), yielding one DataFrame per page of up
+    to limit_para transactions. Stops after max_pages pages; None follows the cursor through the full history.
+    """
+    basiq_id = get_basiq_id(user_id)
+    for page in data_instance.iter_transaction_pages(basiq_token.get(), basiq_id, limit_para, filter_para, max_pages):
+        yield transactions_to_df(page)
+
+
+def transactions_to_df(transaction_list):
+    """
+    Converts one page of Basiq transactions (list of dicts from the JSON response) into the DataFrame layout cached
+    in the transactions table.
+    """
     transactions = []
     for transaction in transaction_list:
         """
@@ -206,6 +271,9 @@ def request_transactions_df(user_id, limit_para=500, filter_para=None):
         }
         transactions.append(transaction)
     transaction_df = pd.DataFrame(transactions)
+    if transaction_df.empty:
+        # nothing new since the last sync - keep the expected columns so callers can treat it like any other batch
+        return pd.DataFrame(columns=TRANSACTION_COLUMNS)
 
     # using 'transactionDate', take it out of str form and into a datetime format, to easily split into d, m, and Y
     transaction_df['transactionDate'] = pd.to_datetime(transaction_df['transactionDate'],format="%Y-%m-%d")
@@ -216,55 +284,132 @@ def request_transactions_df(user_id, limit_para=500, filter_para=None):
     return transaction_df
 
 
-def cache_transactions(tran_data):
+def _store_transactions(conn, tran_data):
+    # upsert one batch and bring the monthly summary of every month it touched up to date, in the same transaction
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")     # the months read here can't change before the batch is written
+    periods = rollup.affected_periods(conn, tran_data)
+    counts = ingest.upsert_frame(conn, 'transactions', tran_data, TRANSACTION_COLUMNS)
+    if counts['inserted'] or counts['updated']:
+        rollup.refresh(conn, periods)
+    return counts
+
+def cache_transactions(tran_data, user_id):
     """
     Caches transaction data (from Dataframe format) for a Dolfin user.
-    Inserts transaction data into the transactions table, including transaction ID, type, status, description, etc.\n
-    NEW - Transaction data stored in a different database
+    Upserts transaction data into the user's transactions table, including transaction ID, type, status, description,
+    etc., in a single transaction - rows already cached are updated rather than failing the whole batch - and advances
+    the user's sync high-water mark in the same transaction.\n
+    NEW - Transaction data stored in a different database, one per user
+
+    Returns:
+    \tDict of counts: {'inserted': n, 'updated': n, 'skipped': n} (skipped = no id, or unchanged), or an error message.
     """
     try:
-        with sqlite3.connect(transactions_db_path) as conn:
-            cursor = conn.cursor()
-            # post and transactionDate are text values as they are not used by dashboard (right now) - subject to change
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions
-                (id VARCHAR(255) PRIMARY KEY,
-                    type VARCHAR(50),
-                    status VARCHAR(50),
-                    description TEXT,
-                    amount REAL,
-                    account VARCHAR(255),
-                    balance REAL,
-                    direction VARCHAR(50),
-                    class VARCHAR(50),
-                    institution VARCHAR(50),
-                    transactionDate TEXT,
-                    postDate TEXT,
-                    subClass VARCHAR(255),
-                    day INTEGER,
-                    month INTEGER,
-                    year INTEGER);
-            ''')
-            #--subClass_code VARCHAR(50));
-            # insert 16 values into each respective wildcard
-            insert_statement = '''
-                INSERT INTO transactions (id, type, status, description, amount, account, balance, direction, class, institution, transactionDate, postDate, subClass, day, month, year) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''' #left out: #, subClass_code) -> made subClasstitle = Subclass
-            # Iterate through dataframe records, and execute the insert statement and add each value to its respective SQL field
-            for index, row in tran_data.iterrows():
-                cursor.execute(insert_statement, (
-                    row['id'], row['type'], row['status'], row['description'], 
-                    row['amount'], row['account'], row['balance'], row['direction'], 
-                    row['class'], row['institution'], str(row['transactionDate']), row['postDate'], 
-                    row['subClass'], row['day'], row['month'], row['year'])) # left out: , row['subClass_code']
-        basiq_log.info("CACHE - Transactions for user successfully inserted in transactions.db")
-        return "CACHE - Transactions for user successfully inserted."
+        with tenants.connection(user_id) as conn:
+            counts = _store_transactions(conn, tran_data)
+            sync.save_mark(conn, user_id, tran_data)
+        _notify_transactions_changed(user_id)
+        basiq_log.info(("CACHE - Transactions for %s cached: %%(inserted)d inserted, %%(updated)d updated, %%(skipped)d skipped." % user_id) % counts)
+        return counts
 
     except sqlite3.Error as e:
         basiq_log.error("CACHE - An error occurred: " + str(e))
         return "CACHE - An error occurred: " + str(e)
 
+def cache_transaction_batches(batches, user_id):
+    """
+    Caches a stream of transaction DataFrames (e.g. from iter_transactions_df) one batch at a time, each in its own
+    short transaction, so memory stays at one page and dashboard reads are never blocked for the whole download.
+    The user's sync high-water mark is advanced once the whole stream has been stored.
+
+    Returns:
+    \tDict of counts summed over all batches: {'inserted': n, 'updated': n, 'skipped': n}, or an error message.
+    """
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    newest = []
+    try:
+        for batch in batches:
+            with tenants.connection(user_id) as conn:
+                counts = _store_transactions(conn, batch)
+            for key in totals:
+                totals[key] += counts[key]
+            top = sync.newest(batch)
+            if top:
+                newest.append(top)
+        with tenants.connection(user_id) as conn:
+            sync.save_mark(conn, user_id, pd.DataFrame(newest, columns=['postDate', 'id']))
+        basiq_log.info(("CACHE - Transactions for %s cached: %%(inserted)d inserted, %%(updated)d updated, %%(skipped)d skipped." % user_id) % totals)
+        return totals
+
+    except sqlite3.Error as e:
+        basiq_log.error("CACHE - An error occurred: " + str(e))
+        return "CACHE - An error occurred: " + str(e)
+    finally:
+        if any(totals.values()):
+            _notify_transactions_changed(user_id)
+
+
+def sync_transactions(user_id, limit_para=500, full=False, history_pages=BASIQ_HISTORY_PAGES):
+    """
+    Brings the cached transactions up to date for a user, streaming pages from Basiq straight into the cache.
+    A returning user only fetches transactions posted since their high-water mark (every page of them) and merges them
+    into their cache. A first-time user (or full=True) starts from an empty cache and fetches history_pages pages of
+    limit_para transactions; history_pages=None backfills the user's full history. Other users' caches are untouched.
+
+    Returns:
+    \tDict of counts from cache_transaction_batches(), or an error message.
+    """
+    try:
+        with tenants.connection(user_id) as conn:
+            mark = None if full else sync.get_mark(conn, user_id)
+    except sqlite3.Error as e:
+        basiq_log.error("SYNC - An error occurred: " + str(e))
+        return "SYNC - An error occurred: " + str(e)
+
+    if mark is None:
+        clear_transactions(user_id)
+    filter_para = sync.mark_filter(mark)
+    basiq_log.info("SYNC - %s sync for %s%s" % ("Incremental" if filter_para else "Full", user_id,
+                                                " (%s)" % filter_para if filter_para else ""))
+    max_pages = None if filter_para else history_pages
+    try:
+        return cache_transaction_batches(iter_transactions_df(user_id, limit_para, filter_para, max_pages), user_id=user_id)
+    except requests.exceptions.RequestException as e:
+        # Basiq still failing after retries - whatever was already streamed in stays cached, the mark is not moved
+        basiq_log.error("SYNC - Basiq request failed: " + str(e))
+        return "SYNC - Basiq request failed: " + str(e)
+
+
+def has_cached_transactions(user_id):
+    """
+    True once the user has completed at least one sync, i.e. there is cached data the dashboard can show.
+    """
+    try:
+        with tenants.connection(user_id) as conn:
+            return sync.get_mark(conn, user_id) is not None
+    except sqlite3.Error as e:
+        basiq_log.error("SYNC - An error occurred: " + str(e))
+        return False
+
+
+def _sync_job(user_id):
+    result = sync_transactions(user_id)
+    if not isinstance(result, dict):
+        raise RuntimeError(result)
+    # load the analytics frame now, on the worker, rather than in the user's first EPV/forecast request
+    frames.get_frame(user_id)
+    return result
+
+
+def start_sync(user_id):
+    """
+    Queues sync_transactions() for the user on the background job runner (services/jobs.py) and returns the Job.
+    If a sync for the user is already queued or running, that job is returned instead.
+    """
+    return jobs.runner.submit('sync', user_id, _sync_job, user_id, ttl=0)
+
+
 # irrelevant with separate db -Leaving in in case change appears.
 # def fetch_transactions_by_user(user_id):
 #     """
@@ -272,42 +417,22 @@ def cache_transactions(tran_data):
 #     Queries the transactions table for all transaction information for a specific user.
 #     """
 #     try:
-#         with sqlite3.connect(transactions_db_path) as conn:
+#         with tenants.connection(user_id) as conn:
 #             query = "SELECT * FROM transactions WHERE trans_u_id = ?"
 #             return pd.read_sql_query(query, conn, params=(user_id,))
 #     except sqlite3.Error as e:
 #         print(f"An error occurred: {e}")
 
 
-def clear_transactions():
+def clear_transactions(user_id):
     """
-    Clears all cached data from the transactions table.
-    Deletes all records from the transactions table.
+    Clears a user's cached data from their transactions table.
+    Deletes all of the user's transaction records and their sync mark, so the next sync is a full one.
     """
     try:
         # Database connection
-        with sqlite3.connect(transactions_db_path) as conn:
+        with tenants.connection(user_id) as conn:
             cursor = conn.cursor()
-            # post and transactionDate are text values as they are not used by dashboard (right now) - subject to change
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions
-                (id VARCHAR(255) PRIMARY KEY,
-                    type VARCHAR(50),
-                    status VARCHAR(50),
-                    description TEXT,
-                    amount REAL,
-                    account VARCHAR(255),
-                    balance REAL,
-                    direction VARCHAR(50),
-                    class VARCHAR(50),
-                    institution VARCHAR(50),
-                    transactionDate TEXT,
-                    postDate TEXT,
-                    subClass VARCHAR(255),
-                    day INTEGER,
-                    month INTEGER,
-                    year INTEGER);
-            ''')
             #Omitted due to different structure:
             #--subClass_code VARCHAR(50));
             #--trans_u_id INTEGER NOT NULL;
@@ -315,7 +440,10 @@ def clear_transactions():
 
             # SQL statement to delete all data from the transactions table
             cursor.execute("DELETE FROM transactions;")
-            basiq_log.info("CLEAR DATABASE - Transactions cleared from transactions.db successfully.")
+            rollup.clear(conn)
+            sync.clear_marks(conn)
+            basiq_log.info("CLEAR DATABASE - Transactions for %s cleared successfully." % user_id)
+        _notify_transactions_changed(user_id)
         return "CLEAR DATABASE - Transactions cleared successfully."
     except sqlite3.Error as e:
         basiq_log.error("CLEAR DATABASE - An error occurred: " + str(e))
@@ -1,29 +1,37 @@
 import requests
 
+from api import transport
+
 
 class Core:
 
     def __init__(self, api_key):
         self.api_key = api_key
 
-    def generate_auth_token(self):
+    def request_auth_token(self):
         """
-        Basiq 3.0 forced. Generate authentication token that will need to be used and passed for all JSON reqs.
-        Before being able to use any of the Basiq fucntions, you need to swap your API Key for an Auth Token.
-        The Auth token expires *every 60 minutes*, so needs to be refreshed. Best practice is to refresh this 2-3 times an hour.
+        Basiq 3.0 forced. Swaps the API Key for an Auth Token that will need to be used and passed for all JSON reqs.
+        Returns the whole token response, including 'expires_in' (seconds) - the Auth token expires *every 60 minutes*.
+        Use api/token_manager.py to cache and refresh it rather than calling this per request.
         https://api.basiq.io/reference/posttoken
         """
-        url = "https://au-api.basiq.io/token"
-
         headers = {
-            "accept": "application/json",
             "basiq-version": "3.0",
             "content-type": "application/x-www-form-urlencoded",
             "Authorization": "Basic " + self.api_key
         }
 
-        response = requests.post(url, headers=headers)
-        response_data = response.json()
+        # exchanging the key for a token has no side effects, so it is safe to retry on 5xx
+        return transport.post("/token", headers=headers, idempotent=True)
+
+    def generate_auth_token(self):
+        """
+        Basiq 3.0 forced. Generate authentication token that will need to be used and passed for all JSON reqs.
+        Before being able to use any of the Basiq fucntions, you need to swap your API Key for an Auth Token.
+        The Auth token expires *every 60 minutes*, so needs to be refreshed. Best practice is to refresh this 2-3 times an hour.
+        https://api.basiq.io/reference/posttoken
+        """
+        response_data = self.request_auth_token()
 
         access_token = response_data["access_token"]
         return access_token
@@ -34,18 +42,13 @@ class Core:
         Requires a specific dictionary param to operate, containing the same five parameters needed in create_user().
         https://api.basiq.io/reference/createuser
         """
-        url = "https://au-api.basiq.io/users"
+        url = "/users"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = user_payload
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def create_user(user_first_name, user_middle_name, user_last_name, user_email, user_mobile, access_token):
@@ -54,13 +57,9 @@ class Core:
         T3 2023 - Note that for testing purposes mob and email fields should not be checked for uniqueness in the Dolfin DB until a deployment environment.\n
         https://api.basiq.io/reference/createuser
         """
-        url = "https://au-api.basiq.io/users"
+        url = "/users"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = {
             "email": user_email,
@@ -70,8 +69,7 @@ class Core:
             "lastName": user_last_name
         }
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def retrieve_user(basiq_id, access_token):
@@ -80,39 +78,26 @@ class Core:
         Untrested, but likely memory intensive. Surgical access to user object fields can be provided via other functions.
         https://api.basiq.io/reference/getuser
         """
-        url = f"https://au-api.basiq.io/users/{basiq_id}"
+        url = f"/users/{basiq_id}"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
-        response = requests.get(url, headers=headers)
-        return response.text
+        headers = transport.bearer(access_token)
+        return transport.get(url, headers=headers, raise_errors=False)
 
     @staticmethod
     def update_user_by_dict(basiq_id, user_payload, access_token):
-        url = f"https://au-api.basiq.io/users/{basiq_id}"
+        url = f"/users/{basiq_id}"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = user_payload
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def update_user(basiq_id, user_first_name, user_last_name, user_email, user_mobile, access_token, user_middle_name=''):
-        url = f"https://au-api.basiq.io/users/{basiq_id}"
+        url = f"/users/{basiq_id}"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         payload = {
             "email": user_email,
@@ -122,8 +107,7 @@ class Core:
             "lastName": user_last_name
         }
 
-        response = requests.post(url, json=payload, headers=headers)
-        return response.text
+        return transport.post(url, json=payload, headers=headers, raise_errors=False)
 
     @staticmethod
     def create_auth_link(basiq_id, access_token):
@@ -131,34 +115,23 @@ class Core:
         An Authlink is requried for a user to give their consent for Basiq to connect to their institution. A consent dialogue opens for users to authenticate themselves on the instiuutioion side of things.\n
         In the future, this will be updated to have detailed consent lists as to how data willl be access by DolFin and why.
         """
-        url = f"https://au-api.basiq.io/users/{basiq_id}/auth_link"
+        url = f"/users/{basiq_id}/auth_link"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.post(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
     @staticmethod
     def retrieve_auth_link(basiq_id, access_token):
-        url = f"https://au-api.basiq.io/users/{basiq_id}/auth_link"
+        url = f"/users/{basiq_id}/auth_link"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.get(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
@@ -170,16 +143,11 @@ class Data:
 
     @staticmethod
     def all_accounts(access_token, basiq_id):
-        url = f"https://au-api.basiq.io/users/{basiq_id}/accounts"
+        url = f"/users/{basiq_id}/accounts"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
-        response = requests.get(url, headers=headers)
-
-        return response.text
+        return transport.get(url, headers=headers, raise_errors=False)
 
     @staticmethod
     def get_account(access_token, basiq_id, account_id):
@@ -187,16 +155,11 @@ class Data:
         Not currently used
         https://api.basiq.io/reference/getaccount
         """
-        url = f"https://au-api.basiq.io/users/{basiq_id}/accounts/{account_id}"
+        url = f"/users/{basiq_id}/accounts/{account_id}"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
-        response = requests.get(url, headers=headers)
-
-        return response.text
+        return transport.get(url, headers=headers, raise_errors=False)
 
     @staticmethod
     def get_transaction_list(access_token, basiq_id, limit_para, filter_para):
@@ -205,19 +168,38 @@ class Data:
         Function name differs to reference hyperlink for readabilities sake, else a single 's' is the on difference
         between this and a specific transaction fetch. https://api.basiq.io/reference/gettransactions
         """
-        # filter params are not nessecary in default JSON req
-        if filter_para != None:
-            url = f"https://au-api.basiq.io/users/{basiq_id}/transactions?limit={limit_para}&filter={filter_para}"
-        else:
-            url = f"https://au-api.basiq.io/users/{basiq_id}/transactions?limit={limit_para}"
+        url = f"/users/{basiq_id}/transactions"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
+
+        # filter params are not nessecary in default JSON req - None values are left out of the query string
+        params = {"limit": limit_para, "filter": filter_para}
+
+        return transport.get(url, headers=headers, params=params, raise_errors=False)
+
+    @staticmethod
+    def iter_transaction_pages(access_token, basiq_id, limit_para=500, filter_para=None, max_pages=None):
+        """
+        Generator over every page of a user's transactions, following the links.next cursor Basiq returns with each
+        page. Yields the page's list of transaction dicts, so only one page is held in memory at a time.
+        Stops after max_pages pages (None = the full history). https://api.basiq.io/reference/gettransactions
+        """
+        url = f"/users/{basiq_id}/transactions"
+
+        headers = transport.bearer(access_token)
 
-        response = requests.get(url, headers=headers)
-        return response.text
+        params = {"limit": limit_para, "filter": filter_para}
+
+        pages = 0
+        while url and (max_pages is None or pages < max_pages):
+            page = transport.get(url, headers=headers, params=params)
+            params = None   # the next link already carries the query
+            transactions = page.get('data') or []
+            if not transactions:
+                return
+            pages += 1
+            yield transactions
+            url = (page.get('links') or {}).get('next')
 
     @staticmethod
     def get_transaction(access_token, basiq_id, transaction_id):
@@ -226,17 +208,12 @@ class Data:
         https://api.basiq.io/reference/gettransaction
         """
         
-        url = f"https://au-api.basiq.io/users/{basiq_id}/transactions/{transaction_id}"
+        url = f"/users/{basiq_id}/transactions/{transaction_id}"
 
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token)
 
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.get(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
@@ -246,18 +223,12 @@ class Data:
         T3 2023 - Not tested or implemented.
         https://api.basiq.io/reference/postaffordability
         """
-        url = f"https://au-api.basiq.io/users/{basiq_id}/affordability"
+        url = f"/users/{basiq_id}/affordability"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            return response.text
+            return transport.post(url, headers=headers)  # Raises for bad status codes
         except requests.exceptions.RequestException as e:
             return str(e)
 
@@ -267,18 +238,12 @@ class Data:
         T3 2023 - Not tested or implemented.
         https://api.basiq.io/reference/postexpenses
         """
-        url = f"https://au-api.basiq.io/users/{basiq_id}/expenses"
+        url = f"/users/{basiq_id}/expenses"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.post(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
 
@@ -288,17 +253,11 @@ class Data:
         T3 2023 - Not tested or implemented.
         https://api.basiq.io/reference/postincome
         """
-        url = f"https://au-api.basiq.io/users/{basiq_id}/income"
+        url = f"/users/{basiq_id}/income"
 
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {access_token}"
-        }
+        headers = transport.bearer(access_token, json_body=True)
 
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
-            return response.text
+            return transport.post(url, headers=headers)
         except requests.exceptions.RequestException as e:
             return str(e)
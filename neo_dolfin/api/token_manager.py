@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+
+## Basiq access-token manager.
+## Tokens are fetched lazily on first use (never at import, so startup doesn't wait on Basiq), cached with their expiry,
+## and renewed in a background thread shortly before they run out. Concurrent callers share a single in-flight
+## renewal. Each process (including forked gunicorn workers) keeps its own locks and refresh thread.
+
+basiq_log = logging.getLogger("dolfin.basiq")
+
+TOKEN_LIFETIME = float(os.getenv("BASIQ_TOKEN_LIFETIME", 3600))              # used if Basiq doesn't send expires_in
+TOKEN_REFRESH_MARGIN = float(os.getenv("BASIQ_TOKEN_REFRESH_MARGIN", 900))   # renew this many seconds before expiry
+TOKEN_RETRY_INTERVAL = float(os.getenv("BASIQ_TOKEN_RETRY_INTERVAL", 30))    # wait after a failed background renewal
+
+
+class TokenManager:
+    """
+    Caches an access token and renews it before it expires.
+
+    :param fetch: Callable returning the token response from Basiq - a dict with 'access_token' and 'expires_in'
+                  (seconds), e.g. Core.request_auth_token.
+    :param proactive: Schedule a renewal ahead of expiry even if no request asks for the token.
+    """
+
+    def __init__(self, fetch, refresh_margin=TOKEN_REFRESH_MARGIN, proactive=True, clock=time.monotonic):
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.proactive = proactive
+        self.clock = clock
+        self._token = None
+        self._expires_at = 0
+        self._init_process_state()
+
+    def _init_process_state(self):
+        # Locks and threads don't survive fork; a worker starts with fresh ones (the token itself is still valid)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()           # held while fetching - the single in-flight renewal
+        self._state_lock = threading.Lock()     # guards the background-refresh bookkeeping below
+        self._refreshing = False
+        self._next_attempt = 0
+        self._timer = None
+
+    def _check_process(self):
+        if self._pid != os.getpid():
+            self._init_process_state()
+            if self._token:
+                self._schedule_refresh()
+
+    def get(self):
+        """
+        Returns a valid token, fetching one first if there is none or it has expired. A token that is close to expiry
+        is still returned while a background renewal runs.
+        """
+        self._check_process()
+        remaining = self._expires_at - self.clock()
+        if self._token and remaining > 0:
+            if remaining <= self.refresh_margin:
+                self.refresh_in_background()
+            return self._token
+        return self.refresh(stale=self._token)
+
+    def refresh(self, stale=None):
+        """
+        Fetches a new token. Callers that arrive while another thread is fetching wait for it and share its token
+        instead of making their own request.
+
+        :param stale: The token the caller found unusable; if it has already been replaced, no new fetch is made.
+        """
+        with self._lock:
+            if self._token and self._token != stale and self._expires_at - self.clock() > 0:
+                return self._token
+            response = self.fetch()
+            self._token = response["access_token"]
+            self._expires_at = self.clock() + float(response.get("expires_in") or TOKEN_LIFETIME)
+            basiq_log.info("BASIQ: Access token renewed, valid for %.0fs." % (self._expires_at - self.clock()))
+        self._schedule_refresh()
+        return self._token
+
+    def refresh_in_background(self):
+        """
+        Starts one background renewal unless one is already running.
+        """
+        with self._state_lock:
+            if self._refreshing or self.clock() < self._next_attempt:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="basiq-token-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh(stale=self._token)
+        except Exception as e:
+            # keep the current token; the next get() tries again, or fetches synchronously once it has expired
+            basiq_log.error("BASIQ: Background token refresh failed: " + str(e))
+            self._next_attempt = self.clock() + TOKEN_RETRY_INTERVAL
+        finally:
+            self._refreshing = False
+
+    def _schedule_refresh(self):
+        # Proactive renewal, so an idle process still has a fresh token when the next request comes in
+        if not self.proactive:
+            return
+        remaining = self._expires_at - self.clock()
+        delay = max(remaining - self.refresh_margin, remaining / 2, 0)
+        timer = threading.Timer(delay, self.refresh_in_background)
+        timer.daemon = True
+        with self._state_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = timer
+        timer.start()
+
+    def invalidate(self):
+        """
+        Forgets the cached token (e.g. after Basiq rejects it), so the next get() fetches a new one.
+        """
+        with self._lock:
+            self._token = None
+            self._expires_at = 0
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def shared(api_key, fetch):
+    """
+    Returns the process-wide TokenManager for an API key, creating it with fetch on first use - so modules using the
+    same key share one token instead of each fetching their own.
+    """
+    with _managers_lock:
+        manager = _managers.get(api_key)
+        if manager is None:
+            manager = _managers[api_key] = TokenManager(fetch)
+        return manager
@@ -0,0 +1,145 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+## Shared HTTP transport for the Basiq clients (api/basiq_api.py and api/temporary_used/optimized_API.py).
+## One keep-alive requests.Session per process pools TLS connections across calls and users, every call has a timeout,
+## rate limits (429) and server errors (5xx) are retried with exponential backoff and jitter, and responses are parsed
+## from JSON exactly once.
+
+basiq_log = logging.getLogger("dolfin.basiq")
+
+BASIQ_URL = os.getenv("BASIQ_URL", "https://au-api.basiq.io")
+HTTP_POOL_SIZE = int(os.getenv("BASIQ_HTTP_POOL_SIZE", 32))            # keep-alive connections per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("BASIQ_CONNECT_TIMEOUT", 5))     # seconds
+HTTP_READ_TIMEOUT = float(os.getenv("BASIQ_READ_TIMEOUT", 30))          # seconds
+HTTP_RETRIES = int(os.getenv("BASIQ_RETRIES", 4))                      # retries after the first attempt
+HTTP_BACKOFF = float(os.getenv("BASIQ_BACKOFF", 0.5))                  # first backoff, doubled on each retry
+HTTP_BACKOFF_MAX = float(os.getenv("BASIQ_BACKOFF_MAX", 20))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class BasiqHTTPError(requests.exceptions.HTTPError):
+    """
+    Raised for an error status once retries are used up. Subclasses requests' HTTPError, so existing
+    "except requests.exceptions.RequestException" handlers still catch it. The parsed error body is in .payload.
+    """
+
+    def __init__(self, message, response=None, payload=None):
+        super().__init__(message, response=response)
+        self.status_code = response.status_code if response is not None else None
+        self.payload = payload
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns this process's pooled session, creating it on first use (and again in a forked worker, which must not
+    share sockets with its parent).
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                # retries are handled in request() so backoff and logging are in one place
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"accept": "application/json"})
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number attempt (0-based): "full jitter" exponential backoff, or the server's
+    Retry-After when it sends one.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * (2 ** attempt)))
+
+
+def _parse(response):
+    if not response.content:
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+
+def request(method, url, headers=None, raise_errors=True, retries=None, timeout=None, idempotent=None, **kwargs):
+    """
+    Sends a request through the pooled session, retrying 429/5xx responses and connection failures.
+
+    :param url: Absolute URL, or a path relative to BASIQ_URL.
+    :param raise_errors: Raise BasiqHTTPError for a 4xx/5xx response. When False the parsed error body is returned,
+                         like the clients' old response.text behaviour.
+    :param idempotent: Whether 5xx responses may be retried. Defaults to True for GET; POSTs that create resources
+                       are only retried on 429 and connect timeouts, where the server has not acted on them.
+    :param kwargs: Passed through to requests (params, json, data, ...).
+
+    Returns:
+    \tThe response body parsed from JSON (or the raw text if it isn't JSON, None if empty).
+    """
+    if not url.startswith("http"):
+        url = BASIQ_URL + url
+    retries = HTTP_RETRIES if retries is None else retries
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    if idempotent is None:
+        idempotent = method.upper() in ("GET", "HEAD", "PUT", "DELETE")
+
+    attempt = 0
+    while True:
+        try:
+            response = get_session().request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+            if not retryable or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            basiq_log.warning("BASIQ: %s %s failed (%s), retrying in %.2fs" % (method, url, e.__class__.__name__, delay))
+        else:
+            status = response.status_code
+            retryable = status == 429 or (idempotent and status in RETRY_STATUSES)
+            if not retryable or attempt >= retries:
+                payload = _parse(response)
+                if raise_errors and status >= 400:
+                    raise BasiqHTTPError("%d Error for url: %s" % (status, url), response=response, payload=payload)
+                return payload
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            basiq_log.warning("BASIQ: %s %s returned %d, retrying in %.2fs" % (method, url, status, delay))
+        attempt += 1
+        time.sleep(delay)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def bearer(access_token, json_body=False):
+    """
+    Per-call headers for an authenticated request. "accept" is already set on the session; json_body adds the JSON
+    content type for POSTs that send no body of their own (requests sets it when json= is passed).
+    """
+    if json_body:
+        return {"authorization": f"Bearer {access_token}", "content-type": "application/json"}
+    return {"authorization": f"Bearer {access_token}"}
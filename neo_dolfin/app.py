@@ -11,14 +11,11 @@ from logging.config import dictConfig
 from logging.handlers import RotatingFileHandler
 import secrets
 import io
-import boto3 as boto3
 import time 
 import pandas as pd
 from pandas import json_normalize 
 import os 
 from dotenv import load_dotenv
-import ssl 
-import nltk
 #import certifi
 import requests
 from argon2 import PasswordHasher
@@ -27,16 +24,11 @@ import re
 import sqlite3
 import urllib.parse
 from io import StringIO, BytesIO
-import pymysql
-import requests
 import json
 import csv
-import matplotlib.pyplot as plt
 import base64
-import matplotlib
-matplotlib.use('Agg')
-
-from ai.cloud import word_cloud, expenditure_cluster_model
+import threading
+import uuid
 
 load_dotenv()  # Load environment variables from .env
 #from services.basiq_service import BasiqService
@@ -44,6 +36,7 @@ from api.temporary_used import optimized_API
 from api.temporary_used import API_db_op
 from api import database_operation
 from ai.chatbot import chatbot_logic
+from services import analytics, compression, dashboard, chart_data, datasets, datastore, frames, http_cache, jobs, tenants
 
 # Access environment variables
 PASSWORD = os.getenv("PASSWORD")
@@ -52,23 +45,10 @@ DBNAME = os.getenv("DBNAME")
 PROJECT_ID = os.getenv("PROJECT_ID")
 INSTANCE_NAME = os.getenv("INSTANCE_NAME")
 
-# Chatbot Logic req files for VENV
-script_dir = os.path.dirname(os.path.abspath(__file__))
-venv_dir = os.path.join(script_dir, 'venv')  # Assumes venv is at the parent directory
-nltk_data_path = os.path.join(venv_dir, 'nltk_data')
-
-# Configure SSL for older versions of Python (if needed)
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-# Download NLTK data into the custom directory
-nltk.data.path.append(nltk_data_path)
-nltk.download('punkt', download_dir=nltk_data_path)
-nltk.download('wordnet', download_dir=nltk_data_path)
+# The chatbot's NLTK data lives in venv/nltk_data (NLTK_DATA_PATH) and is installed once, not downloaded here:
+#     python -m nltk.downloader -d venv/nltk_data punkt wordnet
+# Importing the app does no network I/O, opens no databases and loads no models - databases are created on the first
+# request (init_databases below); see services/startup.py, whose warmup() preloads the models.
 
 # setup logging configs - needs to be done before flask app is initialised
 # can be stored in a dict instead of being passed, but am being memory conservative. python3 also recommends storing in dict over reading from file.
@@ -185,17 +165,16 @@ setup_logging()
 
 app = Flask(__name__)
 app.static_folder = 'static'
-app.config['SECRET_KEY'] = secrets.token_hex(16)  # Replace with a secure random key
+# Session cookies are signed with this key, so every process serving the app must use the same one: set SECRET_KEY
+# when the workers don't share a preloaded app (gunicorn.conf.py refuses to start without it then). Without it a
+# random key is used, and sessions end when the server restarts.
+app.config['SECRET_KEY'] = os.getenv("SECRET_KEY") or secrets.token_hex(16)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db/user_database.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# Dataframes
-df1 = pd.read_csv('static/data/transaction_ut.csv')
-df2 = pd.read_csv('static/data/modified_transactions_data.csv')
-df3 = pd.read_csv('static/data/Predicted_Balances.csv')
-
 # SQL Database Configure
 db = SQLAlchemy(app)
+datastore.init_app(app)     # pooled sqlite connections for transactions, returned at the end of each request
 
 # Setup BASIQ functions
 user_ops = API_db_op
@@ -261,14 +240,30 @@ class Response(db.Model):
     response8 = db.Column(db.String(255), nullable=False)
     response9 = db.Column(db.Integer, nullable=False)
     
-try:
-    with app.app_context():
-        db.create_all()
-except Exception as e:
-    print("Error creating database:", str(e))
-
-# do, then print confirmation/error
-user_ops.init_dolfin_db()
+# Create/migrate the user and transactions databases once per process, before its first request - not at import,
+# which with preload_app would open SQLite in the gunicorn master before it forks the workers
+_databases_ready = False
+_databases_lock = threading.Lock()
+
+@app.before_request
+def init_databases():
+    global _databases_ready
+    if not _databases_ready:
+        with _databases_lock:
+            if not _databases_ready:
+                try:
+                    db.create_all()
+                except Exception as e:
+                    print("Error creating database:", str(e))
+                app_log.info(user_ops.init_dolfin_db())
+                app_log.info(user_ops.init_transactions_db())
+                _databases_ready = True
+
+# Dashboard snapshots and analytics frames are rebuilt whenever the transaction cache changes
+user_ops.on_transactions_changed(dashboard.invalidate)
+user_ops.on_transactions_changed(frames.invalidate)
+# ... and cached analytics results (EPV, word clouds, forecasts) are recomputed on next request
+user_ops.on_transactions_changed(jobs.runner.invalidate)
 # Debug and easy testing with API reference
 # print(API_CORE_ops.generate_auth_token())
 
@@ -325,13 +320,11 @@ def before_request():
             return redirect('/login')
     return check_auth()
 
-# make sure no cache
-@app.after_request
-def add_no_cache_header(response):
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+# Caching policy: fingerprinted static files are immutable, JSON data endpoints use ETags (http_cache.json_response),
+# everything else - authenticated pages included - is no-store
+http_cache.init_app(app)
+# gzip/brotli for dynamic responses, precompressed .br/.gz variants for static files (see services/compression.py)
+compression.init_app(app)
 
 # ROUTING
 ## LANDING PAGE
@@ -376,16 +369,15 @@ def login():
             user_log.info("AUTH: User %s has been successfully authenticated. Session active."%(user.username)) # capture IP?
 
             ## This section should be done on authentication to avoid empty filling the dash
-            user_ops.clear_transactions()  # Ensure no previous data remains from a previous user etc.
-                                    
-
-            cache = user_ops.request_transactions_df(user.username)     # Get a dataframe of the last 500 transactions
-            #print(cache)                                               # used for testing and debugging
-                                               
-            user_ops.cache_transactions(cache)                          # Insert cahce in to database and confirm success
-
-            # redirect to the dashboard.
-            return redirect('/dash')
+            # The Basiq sync runs in the background: returning users only fetch transactions newer than what is already
+            # cached, anyone else gets a fresh cache of their last 500 transactions.
+            user_ops.start_sync(user.username)
+
+            # redirect to the dashboard - straight away if there is cached data to show while the refresh runs,
+            # otherwise via the loading page until the first sync finishes.
+            if user_ops.has_cached_transactions(user.username):
+                return redirect('/dash')
+            return redirect('/load')
         
         ## Otherwise, fail by default:
         user_log.warning("AUTH: Login attempt as \"%s\" was rejected. Invalid credentials."%(input_username)) # Log. capture IP? Left as warning for now, could change with justification.
@@ -530,234 +522,102 @@ def checkAF_response(responsedata):
 def sign_out():
     if 'user_id' in session:
         user_id = session['user_id']
-        #user_ops.clear_transactions()
-        db_op.clear_transactions(user_id)
+        # Cached transactions are kept, so the next login only needs to sync what is new
         user_log.info("LOGOUT: %s has logged out." % user_id)
         session.pop('user_id', None)
     return redirect('/')
 
 @app.route('/dash',methods=['GET','POST'])
 def auth_dash2(): 
-    user_id     = session.get('user_id') # Not used right now.
+    user_id     = session.get('user_id')
     first_name  = session.get('first_name')
+
+    # Predicted balances chart - static data, serialised once (services/datasets.py)
+    predicted_balances = datasets.get('predicted_balances')
+
     if request.method == 'GET':
+        # Every widget (accounts, pie, doughnut, bar, line, balance, range, last transaction) comes from a single scan of
+        # the newly loaded transactions, cached per user until the transaction cache is rewritten.
+        snapshot = dashboard.get_snapshot(user_id)
+        dfx5 = predicted_balances.records_json()
         # From session variable, user the user's first name in:
         #   Welcome message
         #   ...
+        view = dashboard.account_payload(snapshot, dashboard.ALL_ACCOUNTS)
+        return render_template("dash2.html",jsd1=view['jsd1'], jsd2=view['jsd2'], jsd3=view['jsd3'], jsd4=view['jsd4'], jsd5=dfx5, jsd6=view['currentBalance'], jsd7=view['balanceRange'], jsd8=view['jsd8'], user_id=first_name, jsxx=view['jsxx'], defacc=view['defacc'],show_alert=True)
 
-        #con = sqlite3.connect("db/transactions_ut.db")
-        #con = sqlite3.connect("db/user_database.db")
-
-        # connect to the newly loaded transactions database, for dashboard to do its thing.
-        con = sqlite3.connect("transactions_ut.db")
-        cursor = con.cursor()
-        app_log.info("APP: Connected to most recent transaction data.")
-
-        ## Accout relative code here
-
-        defacc = 'ALL'
-
-        # Select Account 
-        cursor.execute('SELECT DISTINCT account FROM transactions')
-        query = cursor.fetchall()
-        dfxx = pd.DataFrame(query,columns=['account'])
-        new_record = pd.DataFrame([{'account': 'ALL'}])
-        dfxx = pd.concat([new_record, dfxx], ignore_index=True)
-        jfxx = dfxx.to_json(orient='records')
-
-        # Get class for pie chart
-        cursor.execute('SELECT class FROM transactions')
-        query = cursor.fetchall()
-        dfx1 = pd.DataFrame(query,columns=['class'])
-        jfx1 = dfx1.to_json(orient='records')
-
-        # Get subclass for doughnut chart
-        cursor.execute('SELECT subclass FROM transactions')
-        query = cursor.fetchall()
-        dfx2 = pd.DataFrame(query,columns=['subclass'])
-        jfx2 = dfx2.to_json(orient='records')
-
-        # Get transaction values for bar chart
-        cursor.execute('SELECT amount,direction FROM transactions')
-        query = cursor.fetchall()
-        dfx3 = pd.DataFrame(query,columns=['amount','direction'])
-        jfx3 = dfx3.to_json(orient='records')
-
-        # Line chart datasets
-        cursor.execute('SELECT balance,postDate FROM transactions')
-        query = cursor.fetchall()
-        dfx4 = pd.DataFrame(query,columns=['balance','postDate'])
-        dfx4 = dfx4.to_json(orient='records')
-        
-        dfx5 = df3.to_json(orient='records')
-
-        cursor.execute('SELECT balance FROM transactions LIMIT 1')
-        query = cursor.fetchone()
-        curr_bal = query[0]
-
-        cursor.execute('SELECT MAX(balance) - MIN(balance) AS balance_range FROM transactions')
-        query = cursor.fetchone()
-        curr_range = query[0]
-        print(curr_range)
-
-        cursor.execute('SELECT amount,class,day,month,year FROM transactions LIMIT 1')
-        query = cursor.fetchall()
-        dfx8= pd.DataFrame(query,columns=['amount','class','day','month','year'])
-        jfx8 = dfx8.to_json(orient='records')
-        print(jfx8)
-
-        return render_template("dash2.html",jsd1=jfx1, jsd2=jfx2, jsd3=jfx3, jsd4=dfx4, jsd5=dfx5, jsd6=curr_bal, jsd7=curr_range, jsd8=jfx8, user_id=first_name, jsxx=jfxx, defacc=defacc,show_alert=True)
-        
-    
     if request.method == "POST":
-            # Get the account value from the JSON payload
+        # Get the account value from the JSON payload, 'ALL' or a specific account
         data = request.get_json()
         account_value = data.get('account', None)
-        print(account_value)
-
-        if account_value == 'ALL':
-            
-            defacc = account_value
-            user_id = session.get('user_id')
-            con = sqlite3.connect("transactions_ut.db")
-            cursor = con.cursor() 
-            
-            cursor.execute('SELECT DISTINCT account FROM transactions')
-            query = cursor.fetchall()
-            dfxx = pd.DataFrame(query,columns=['account'])
-            new_record = pd.DataFrame([{'account': 'ALL'}])
-            dfxx = pd.concat([new_record, dfxx], ignore_index=True)
-            jfxx = dfxx.to_json(orient='records')
-
-            # Get class for pie chart
-            cursor.execute('SELECT class FROM transactions')
-            query = cursor.fetchall()
-            dfx1 = pd.DataFrame(query,columns=['class'])
-            jfx1 = dfx1.to_json(orient='records')
-
-            # Get subclass for doughnut chart
-            cursor.execute('SELECT subclass FROM transactions')
-            query = cursor.fetchall()
-            dfx2 = pd.DataFrame(query,columns=['subclass'])
-            jfx2 = dfx2.to_json(orient='records')
-
-            # Get transaction values for bar chart
-            cursor.execute('SELECT amount,direction FROM transactions')
-            query = cursor.fetchall()
-            dfx3 = pd.DataFrame(query,columns=['amount','direction'])
-            jfx3 = dfx3.to_json(orient='records')
-
-            # Line chart datasets
-            cursor.execute('SELECT balance,postDate FROM transactions')
-            query = cursor.fetchall()
-            dfx4 = pd.DataFrame(query,columns=['balance','postDate'])
-            dfx4 = dfx4.to_json(orient='records')
-            
-            dfx5 = df3.to_json(orient='records')
-
-            cursor.execute('SELECT balance FROM transactions LIMIT 1')
-            query = cursor.fetchone()
-            curr_bal = query[0]
-            
-            cursor.execute('SELECT MAX(balance) - MIN(balance) AS balance_range FROM transactions')
-            query = cursor.fetchone()
-            curr_range = query[0]
-
-            cursor.execute('SELECT amount,class,day,month,year FROM transactions LIMIT 1')
-            query = cursor.fetchall()
-            dfx8= pd.DataFrame(query,columns=['amount','class','day','month','year'])
-            jfx8 = dfx8.to_json(orient='records')
-            
-            updated_data = {
-                'currentBalance': curr_bal,
-                'balanceRange': curr_range,
-                'jsd1': jfx1,
-                'jsd2': jfx2,
-                'jsd3': jfx3,
-                'jsd4': dfx4,
-                'jsd5': dfx5,
-                'jsd8': jfx8,
-                'user_id': first_name,
-                'jsxx': jfxx,
-                'defacc': defacc,
-            }
-
-            return jsonify(updated_data)
-            
-        if account_value != 'ALL':
-
-            user_id = session.get('user_id')
-            con = sqlite3.connect("transactions_ut.db")
-            cursor = con.cursor() 
-
-            defacc = account_value
-
-            cursor.execute('SELECT DISTINCT account FROM transactions')
-            query = cursor.fetchall()
-            dfxx = pd.DataFrame(query,columns=['account'])
-            new_record = pd.DataFrame([{'account': 'ALL'}])
-            dfxx = pd.concat([new_record, dfxx], ignore_index=True)
-            jfxx = dfxx.to_json(orient='records')
-
-            # Get class for pie chart
-            cursor.execute('SELECT class FROM transactions WHERE account = ?', (account_value,))
-            query = cursor.fetchall()
-            dfx1 = pd.DataFrame(query,columns=['class'])
-            jfx1 = dfx1.to_json(orient='records')
-
-            # Get subclass for doughnut chart
-            cursor.execute('SELECT subclass FROM transactions WHERE account = ?', (account_value,))
-            query = cursor.fetchall()
-            dfx2 = pd.DataFrame(query,columns=['subclass'])
-            jfx2 = dfx2.to_json(orient='records')
-
-            # Get transaction values for bar chart
-            cursor.execute('SELECT amount,direction FROM transactions WHERE account = ?', (account_value,))
-            query = cursor.fetchall()
-            dfx3 = pd.DataFrame(query,columns=['amount','direction'])
-            jfx3 = dfx3.to_json(orient='records')
-
-            # Line chart datasets
-            cursor.execute('SELECT balance,postDate FROM transactions WHERE account = ?', (account_value,))
-            query = cursor.fetchall()
-            dfx4 = pd.DataFrame(query,columns=['balance','postDate'])
-            dfx4 = dfx4.to_json(orient='records')
-            
-            dfx5 = df3.to_json(orient='records')
-
-            cursor.execute('SELECT balance FROM transactions WHERE account = ? LIMIT 1', (account_value,))
-            query = cursor.fetchone()
-            curr_bal = query[0]
-
-            cursor.execute('SELECT MAX(balance) - MIN(balance) AS balance_range FROM transactions WHERE account = ?', (account_value,))
-            query = cursor.fetchone()
-            curr_range = query[0]
-
-            cursor.execute('SELECT amount,class,day,month,year FROM transactions WHERE account = ? LIMIT 1', (account_value,))
-            query = cursor.fetchall()
-            dfx8= pd.DataFrame(query,columns=['amount','class','day','month','year'])
-            jfx8 = dfx8.to_json(orient='records')
-
-            updated_data = {
-                'currentBalance': curr_bal,
-                'balanceRange': curr_range,
-                'jsd1': jfx1,
-                'jsd2': jfx2,
-                'jsd3': jfx3,
-                'jsd4': dfx4,
-                'jsd5': dfx5,
-                'jsd8': jfx8,
-                'user_id': first_name,
-                'jsxx': jfxx,
-                'defacc': defacc,
-            }
-
-            return jsonify(updated_data)   
+
+        def build():
+            updated_data = dict(dashboard.account_payload(dashboard.get_snapshot(user_id), account_value))
+            updated_data['jsd5'] = predicted_balances.records_json()
+            updated_data['user_id'] = first_name
+            return updated_data
+        # The page sends back the ETag of its copy; unchanged data is answered with 304 without touching the snapshot
+        return http_cache.json_response(build, user_id, first_name, account_value,
+                                        tenants.data_version(user_id), predicted_balances.version())
+
+## DASHBOARD CHART DATA API - pre-aggregated chart payloads for an account
+# e.g. /dash/charts?account=ALL&period=month&top=5
+@app.route('/dash/charts', methods=['GET'])
+def dash_charts():
+    user_id = session.get('user_id')
+    account = request.args.get('account', dashboard.ALL_ACCOUNTS)
+    period  = request.args.get('period', dashboard.DEFAULT_PERIOD)
+    top_n   = request.args.get('top', dashboard.DEFAULT_TOP_N, type=int)
+
+    if period not in chart_data.PERIODS or top_n < 1:
+        return jsonify({'error': 'period must be one of %s and top must be a positive integer' % list(chart_data.PERIODS)}), 400
+
+    return http_cache.json_response(lambda: chart_payload(user_id, account, period, top_n),
+                                    user_id, account, period, top_n, tenants.data_version(user_id))
+
+def chart_payload(user_id, account, period, top_n):
+    # The default view is what the dashboard renders, so it comes straight from the cached snapshot
+    if period == dashboard.DEFAULT_PERIOD and top_n == dashboard.DEFAULT_TOP_N:
+        snapshot = dashboard.get_snapshot(user_id)
+    else:
+        snapshot = dashboard.build_snapshot(tenants.get_db(user_id), period, top_n)
+
+    payload = dashboard.account_payload(snapshot, account)
+    return {
+        'account':          account,
+        'period':           period,
+        'currentBalance':   payload['currentBalance'],
+        'balanceRange':     payload['balanceRange'],
+        'categories':       json.loads(payload['jsd1']),
+        'subclasses':       json.loads(payload['jsd2']),
+        'flows':            json.loads(payload['jsd3']),
+        'balances':         json.loads(payload['jsd4']),
+        'lastTransaction':  json.loads(payload['jsd8']),
+    }
 
 @app.route("/load", methods=['GET', 'POST'])
 def dashboardLoader():
+    if request.method == 'POST':
+        # "Try again" on the loading page after a failed sync
+        user_ops.start_sync(session.get('user_id'))
+        return redirect('/load')
     return render_template("loadingPage.html")
 
+# Polled by loadingPage.html - ready once the user's sync has succeeded, or straight away if cached data exists.
+# A failed sync with nothing cached is not ready: the page shows the error instead of an empty dashboard.
+@app.route("/load/status", methods=['GET'])
+def dashboardLoaderStatus():
+    user_id = session.get('user_id')
+    job = jobs.runner.latest('sync', user_id)
+    has_data = user_ops.has_cached_transactions(user_id)
+    if job is None and not has_data:
+        job = user_ops.start_sync(user_id)      # e.g. the server restarted since login
+    return jsonify({
+        'state':    job.state if job else 'done',
+        'ready':    has_data or job.state == jobs.DONE,
+        'error':    job.error if job else None,
+    })
+
 ## APPLICATION NEWS PAGE   
 @app.route('/news/')
 def auth_news():
@@ -836,7 +696,7 @@ def profile():
      # Get transaction values for account
       if request.method == 'GET':
         user_id = session.get('user_id')
-        con = sqlite3.connect("db/transactions_ut.db")
+        con = tenants.get_db(user_id)
         cursor = con.cursor() 
         defacc = 'ALL'  
         email = session.get('email') 
@@ -868,6 +728,10 @@ def profile():
         return render_template("profile.html", jsd8=jfx8, email=email, jsd6=curr_bal, jsxx=jfxx, jsd3=jfx3, user_id=user_id, defacc=defacc)
 
 def generate_pie_chart(data, category, custom_labels=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
     # Count the occurrences of each value in the given category
     value_counts = data[category].value_counts()
 
@@ -1017,32 +881,39 @@ def chatbot():
         return render_template('chatbot.html')
     elif request.method == 'POST':
         user_input = request.get_json().get("message")
+        chat_id = session.setdefault('chat_id', uuid.uuid4().hex)
         prediction = chatbot_logic.predict_class(user_input)
-        sentiment = chatbot_logic.process_sentiment(user_input)
-        response = chatbot_logic.get_response(prediction, chatbot_logic.intents, user_input)
+        sentiment = chatbot_logic.process_sentiment(user_input, chat_id, session.get('user_id'))
+        response = chatbot_logic.get_response(prediction, chatbot_logic.intents, user_input, session.get('user_id'))
+        chatbot_logic.remember_reply(response, chat_id)
         message={"answer" :response}
         return jsonify(message)
     return render_template('chatbot.html')
 
-global current_trans_data_with_level
+# Batch-size and queue-time metrics of the chatbot's intent classifier in this worker
+@app.route('/chatbot/metrics')
+def chatbot_metrics():
+    return jsonify(dict(chatbot_logic.intent_batcher.stats(), sentiment=chatbot_logic.sentiment_tracking.tracker.stats()))
+
+## Heavy analytics run as background jobs (services/jobs.py): each endpoint submits its job and returns it - with the
+## result straight away if an identical job finished recently - and the page polls /jobs/<id> until it is done.
+def job_response(job):
+    if job.active:
+        return jsonify(job.to_dict()), 202
+    # a finished job never changes, so the browser can revalidate its copy by ETag
+    return http_cache.json_response(lambda: job.to_dict(with_result=True), job.user_id, job.id, job.state)
+
 @app.route('/dash/epv')
 def epv_load():
-    global current_trans_data_with_level
-    con = sqlite3.connect("transactions_ut.db")
-    cursor = con.cursor()
-    query = "SELECT * FROM transactions"
-    cursor.execute(query)
-
-    data = cursor.fetchall()
-    columns = [description[0] for description in cursor.description]
-    trans_data = pd.DataFrame(data, columns=columns)
-    con.close()
-    trans_data_with_level, data_cluster = expenditure_cluster_model.cluster(trans_data)
-    current_trans_data_with_level = trans_data_with_level
-    re = {
-        'data_cluster': data_cluster
-    }
-    return jsonify(re)
+    user_id = session.get('user_id')
+    return job_response(submit_epv(user_id))
+
+
+# The user's EPV job for their current data - a result computed before their transactions last changed isn't reused
+def submit_epv(user_id, version=None):
+    if version is None:
+        version = tenants.data_version(user_id)
+    return jobs.runner.submit('epv', user_id, analytics.expenditure_levels, user_id, version=version)
 
 
 @app.route('/dash/epv/generate_word_cloud', methods=['POST'])
@@ -1050,8 +921,37 @@ def generate_wordcloud():
     data = request.json
     level = data.get('level', 'level 0')
     mode = data.get('mode', 'default')
-    response = word_cloud.generate(current_trans_data_with_level, level, mode)
-    return response
+    user_id = session.get('user_id')
+    version = tenants.data_version(user_id)
+    # the level bounds must come from the current data: a stale or missing EPV result is recomputed first, and the
+    # page is handed that EPV job to poll before it asks for the word cloud again
+    epv = submit_epv(user_id, version)
+    if epv.state != jobs.DONE:
+        return job_response(epv)
+    job = jobs.runner.submit('word_cloud', user_id, analytics.word_cloud_image, user_id, level, mode,
+                             epv.result['level_bounds'], version=version)
+    return job_response(job)
+
+
+@app.route('/dash/forecast')
+def balance_forecast():
+    user_id = session.get('user_id')
+    days = min(max(request.args.get('days', 90, type=int), 1), 365)
+    job = jobs.runner.submit('forecast', user_id, analytics.balance_forecast, user_id, days,
+                             version=tenants.data_version(user_id))
+    return job_response(job)
+
+
+# Status (and result, once done) of one of the user's jobs; DELETE cancels it
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    job = jobs.runner.get(job_id)
+    if job is None or job.user_id != session.get('user_id'):
+        return jsonify({'error': 'Job not found'}), 404
+    if request.method == 'DELETE':
+        jobs.runner.cancel(job_id)
+        job = jobs.runner.get(job_id)
+    return job_response(job)
 # Run the Flask appp
 if __name__ == '__main__':
     app.run(host='0.0.0.0',port=8000, debug=True, threaded=False)
@@ -0,0 +1,71 @@
+import gc
+import logging
+import multiprocessing
+import os
+import random
+
+## Production serving: run "gunicorn app:app" from the neo_dolfin directory (gunicorn picks this file up by itself).
+## The app is imported once in the master process and warmed up there (services/startup.py: the chatbot's intent
+## model, intents, word lists and NLTK data, the static datasets and the analytics libraries), and workers are forked
+## from it so they share those pages copy-on-write instead of each loading its own copy. Each worker serves several
+## requests at once on threads.
+##
+## Settings, all optional:
+##     GUNICORN_BIND       address to listen on (default 0.0.0.0:8000)
+##     WEB_CONCURRENCY     worker processes (default: one per CPU core)
+##     GUNICORN_THREADS    request threads per worker (default 4)
+##     GUNICORN_TIMEOUT    seconds before a silent worker is restarted (default 120)
+##     GUNICORN_PRELOAD    0 to import the app in each worker instead of the master - requires SECRET_KEY
+##     SECRET_KEY          key signing session cookies (see app.py); without it every server start picks a random one
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+if not preload_app and not os.getenv("SECRET_KEY"):
+    # each worker would generate its own key and reject the session cookies signed by the others
+    raise RuntimeError("GUNICORN_PRELOAD=0 needs SECRET_KEY set, so all workers sign sessions with the same key")
+# recycle workers now and then so slow leaks in third-party libraries can't grow without bound
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    # Runs in the master once the app is imported (with preload_app) and before any worker is forked
+    if not preload_app:
+        return
+    # app.py's dictConfig (disable_existing_loggers) switches off gunicorn's own loggers when it is imported here
+    for name in ("gunicorn.error", "gunicorn.access"):
+        logging.getLogger(name).disabled = False
+    from services import datastore, startup
+    # the app loads these on first use - load them here rather than once per worker
+    startup.warmup()
+    # Connections opened while importing the app (migrations, schema checks) are not handed down to the workers
+    datastore.close_all()
+    # Keep the garbage collector from writing to (and so copying) every object inherited from the master
+    gc.freeze()
+    server.log.info("Preloaded app, datasets and models in the master (pid %s)" % os.getpid())
+
+
+def post_fork(server, worker):
+    # The SQLite pools, Basiq HTTP session, token manager and job runner reset themselves after fork
+    # (os.register_at_fork). What is left: fresh random state, so workers don't all pick the same "random" replies,
+    # and SQLAlchemy's pool for the user database, whose inherited connections belong to the master.
+    random.seed()
+    try:
+        import numpy as np
+        np.random.seed()
+    except ImportError:
+        pass
+    if preload_app:
+        import app as dolfin
+        with dolfin.app.app_context():
+            dolfin.db.engine.dispose(close=False)
+    server.log.info("Worker %s ready" % worker.pid)
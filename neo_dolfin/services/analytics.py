@@ -0,0 +1,72 @@
+import numpy as np
+
+from services import frames
+
+## Heavy analytics behind /dash/epv, /dash/epv/generate_word_cloud and /dash/forecast.
+## Each function reads the user's cached transactions frame (services/frames.py) and returns a JSON-serialisable
+## result, so it can run as a background job (services/jobs.py) whose result is cached in the jobs table and can be
+## served by any worker. Amounts are widened from the frame's float32 to float64 before modelling, so totals stay
+## plain floats in the JSON.
+
+
+def expenditure_levels(user_id):
+    """
+    Clusters the user's spending into expenditure levels (KMeans with the number of levels picked by silhouette score).
+
+    Returns:
+    \t{'data_cluster': [{'name': level, 'value': total spent}, ...], 'level_bounds': [largest amount in each level]}
+    """
+    # scikit-learn is imported on first use rather than with the app (services/startup.py warms it up for preload)
+    from ai.cloud import expenditure_cluster_model
+
+    trans_data = frames.get_frame(user_id)[['transactionDate', 'amount', 'description']].astype({'amount': 'float64'})
+    trans_data_with_level, data_cluster = expenditure_cluster_model.cluster(trans_data)
+    # Levels are ranges of amount (the clustering is one-dimensional), so their upper bounds are enough to label any
+    # transaction again later without refitting or keeping the clustered frame in memory.
+    upper = trans_data_with_level.groupby('Expenditure Level')['amount'].max()
+    return {
+        'data_cluster': [{'name': entry['name'], 'value': round(entry['value'], 2)} for entry in data_cluster],
+        'level_bounds': [float(upper['Level %d' % i]) for i in range(len(upper))],
+    }
+
+
+def word_cloud_image(user_id, level, mode, level_bounds):
+    """
+    Renders the word cloud of one expenditure level.
+
+    :param level_bounds: 'level_bounds' from the user's expenditure_levels() result.
+
+    Returns:
+    \t{'image': base64-encoded PNG}
+    """
+    from ai.cloud import word_cloud
+
+    frame = frames.get_frame(user_id)
+    spending = frame.loc[frame['amount'] < 0, ['amount', 'description']].astype({'amount': 'float64'})
+    spending['amount'] = spending['amount'] * -1
+    levels = np.searchsorted(np.asarray(level_bounds[:-1]), spending['amount'].to_numpy(), side='left')
+    spending['Expenditure Level'] = ['Level %d' % i for i in levels]
+    wordcloud = word_cloud.generate(spending, level, mode, whether_jsonify=False)
+    return {'image': word_cloud.to_base64(wordcloud)}
+
+
+def balance_forecast(user_id, days=90):
+    """
+    Forecasts the user's daily balance (ai/savings/SavingPredAI.py).
+
+    Returns:
+    \t[{'date': 'YYYY-MM-DD', 'balance': predicted balance, 'lower': ..., 'upper': ...}, ...]
+    """
+    # statsmodels is slow to import and only needed here
+    from ai.savings import SavingPredAI
+
+    predictions = SavingPredAI.forecast(frames.get_frame(user_id)[['postDate', 'balance']], days)
+    return [
+        {
+            'date':     date.strftime('%Y-%m-%d'),
+            'balance':  round(float(row['mean_balance']), 2),
+            'lower':    round(float(row['lower balance']), 2),
+            'upper':    round(float(row['upper balance']), 2),
+        }
+        for date, row in predictions.iterrows()
+    ]
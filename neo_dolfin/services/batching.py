@@ -0,0 +1,186 @@
+import asyncio
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future, wait
+
+## Micro-batching.
+## A MicroBatcher sits in front of a function that is much cheaper per item when given many items at once (a model's
+## forward pass). Callers hand it one item each - from request threads with batcher(item), or from asyncio code with
+## await batcher.call_async(item) - and a single dispatcher thread per process groups whatever arrives within
+## max_wait of the first item (or max_batch items, whichever comes first) into one call, then resolves each caller's
+## future with its own result. One copy of the model serves every thread in the worker.
+
+app_log = logging.getLogger("dolfin.app")
+
+MAX_BATCH = 32          # items per call
+MAX_WAIT = 0.002        # seconds the first item of a batch waits for company
+RECENT_WAITS = 1000     # queue waits kept for the percentiles in stats()
+
+_batchers = weakref.WeakSet()
+
+
+class MicroBatcher:
+    """
+    Groups single-item calls into batched calls of fn.
+    """
+
+    def __init__(self, fn, max_batch=MAX_BATCH, max_wait=MAX_WAIT, name='batch'):
+        """
+        :param fn: Called with a list of items; must return a sequence with one result per item, in order.
+        :param max_batch: Largest batch passed to fn.
+        :param max_wait: Seconds to keep a batch open for more items after its first one arrives.
+        :param name: Used in logs.
+        """
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait))
+        self.name = name
+        self.reset()
+        _batchers.add(self)
+
+    def reset(self):
+        """
+        Drops the queue, dispatcher thread and metrics - used after fork, where the parent's thread doesn't exist.
+        """
+        self._queue = queue.Queue()
+        self._thread = None
+        self._last = None
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._sizes = collections.Counter()
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_run = 0.0
+        self._recent_waits = collections.deque(maxlen=RECENT_WAITS)
+
+    def submit(self, item):
+        """
+        Queues one item.
+
+        Returns:
+        \tA concurrent.futures.Future resolved with fn's result for the item (or the exception fn raised).
+        """
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((item, future, time.perf_counter()))
+        self._last = future
+        return future
+
+    def flush(self, timeout=None):
+        """
+        Waits until every item submitted so far has been processed (batches run in submission order).
+        """
+        last = self._last
+        if last is not None:
+            wait([last], timeout)
+
+    def __call__(self, item, timeout=None):
+        """
+        Queues one item and waits for its result.
+        """
+        return self.submit(item).result(timeout)
+
+    async def call_async(self, item):
+        """
+        Queues one item and awaits its result without blocking the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(item))
+
+    def stats(self):
+        """
+        Returns:
+        \tBatch-size and wait-time metrics since start-up: batch count, items, mean/max batch size, the batch size
+        \thistogram, mean/p50/p95/max time items spent queued and mean time per batched call, in milliseconds.
+        """
+        with self._metrics_lock:
+            waits = sorted(self._recent_waits)
+            batches = self._batches
+
+            def percentile(p):
+                return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 3) if waits else 0.0
+
+            return {
+                'name':             self.name,
+                'max_batch':        self.max_batch,
+                'max_wait_ms':      self.max_wait * 1000,
+                'queued':           self._queue.qsize(),
+                'batches':          batches,
+                'items':            self._items,
+                'mean_batch_size':  round(self._items / batches, 2) if batches else 0.0,
+                'max_batch_size':   max(self._sizes) if self._sizes else 0,
+                'batch_sizes':      dict(sorted(self._sizes.items())),
+                'mean_queue_ms':    round(self._total_wait / self._items * 1000, 3) if self._items else 0.0,
+                'p50_queue_ms':     percentile(0.5),
+                'p95_queue_ms':     percentile(0.95),
+                'max_queue_ms':     round(self._max_wait_seen * 1000, 3),
+                'mean_run_ms':      round(self._total_run / batches * 1000, 3) if batches else 0.0,
+            }
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="%s-batcher" % self.name, daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # items that queued up while the previous batch ran join straight away, even past the deadline
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._dispatch(batch)
+            except Exception as e:      # keep serving - the callers have already been given the error
+                app_log.error("BATCHING: %s dispatcher error: %s" % (self.name, e))
+
+    def _dispatch(self, batch):
+        batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            results = self.fn([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError("%s returned %d results for %d items" % (self.name, len(results), len(batch)))
+        except BaseException as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        finished = time.perf_counter()
+        waits = [started - queued for _, _, queued in batch]
+        with self._metrics_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._sizes[len(batch)] += 1
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+            self._total_run += finished - started
+            self._recent_waits.extend(waits)
+
+
+def _reset_after_fork():
+    for batcher in list(_batchers):
+        batcher.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
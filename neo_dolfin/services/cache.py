@@ -0,0 +1,138 @@
+import sys
+import threading
+from collections import OrderedDict
+
+## Small in-process LRU cache, shared by the dashboard and analytics layers.
+
+
+class _Flight:
+    """
+    A computation in progress for one key. Other callers asking for the same key wait on it instead of
+    computing the value again.
+    """
+    __slots__ = ('done', 'value', 'error', 'stale')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False     # set when the key is invalidated mid-computation, so the result is not stored
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with an entry limit and an approximate memory cap.
+
+    :max_entries: Maximum number of keys kept.
+    :max_bytes: Approximate memory cap; entries are evicted oldest first until the total fits.
+    :sizeof: Function returning the approximate size of a value in bytes. Defaults to sys.getsizeof.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or sys.getsizeof
+        self._data = OrderedDict()     # key -> (value, size)
+        self._inflight = {}            # key -> _Flight
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for key, calling compute() to fill it on a miss. Concurrent misses for the same
+        key are collapsed, so compute() runs once and every caller receives its result (or its exception).
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _Flight()
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None and not flight.stale:
+                    self._store(key, flight.value)
+                del self._inflight[key]
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._invalidate(key)
+
+    def invalidate_where(self, predicate):
+        """
+        Invalidates every cached or in-flight key for which predicate(key) is true.
+        """
+        with self._lock:
+            for key in [k for k in list(self._data) + list(self._inflight) if predicate(k)]:
+                self._invalidate(key)
+
+    def clear(self):
+        self.invalidate_where(lambda key: True)
+
+    def _store(self, key, value):
+        size = self._sizeof(value)
+        self._drop(key)
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        self._data[key] = (value, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, old_size) = self._data.popitem(last=False)
+            self._bytes -= old_size
+
+    def _invalidate(self, key):
+        flight = self._inflight.get(key)
+        if flight is not None:
+            flight.stale = True
+        self._drop(key)
+
+    def _drop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
@@ -0,0 +1,99 @@
+## Chart aggregates for the dashboard, grouped in SQL so the payload size depends on the number of
+## categories/periods rather than the number of transactions.
+##
+## Every query groups by account as well, so one round of queries serves 'ALL' and each individual account.
+
+# SQL expressions used to bin postDate (ISO8601 text, e.g. "2023-08-03T00:07:36Z") into periods
+PERIODS = {
+    'day':      "substr(postDate, 1, 10)",
+    'week':     "strftime('%Y-W%W', substr(postDate, 1, 10))",
+    'month':    "substr(postDate, 1, 7)",
+}
+
+
+def account_summary(conn):
+    """
+    Per account: balance range and the first row in table order (current balance and last transaction).
+
+    Returns:
+    \tList of tuples (account, min_balance, max_balance, first_rowid, balance, amount, class, day, month, year),
+    \tordered by the account's first appearance in the table.
+    """
+    return conn.execute('''
+        SELECT s.account, s.min_balance, s.max_balance, s.first_rowid,
+               t.balance, t.amount, t.class, t.day, t.month, t.year
+        FROM (SELECT account, MIN(balance) AS min_balance, MAX(balance) AS max_balance, MIN(rowid) AS first_rowid
+              FROM transactions GROUP BY account) AS s
+        JOIN transactions AS t ON t.rowid = s.first_rowid
+        ORDER BY s.first_rowid
+    ''').fetchall()
+
+
+def category_totals(conn):
+    """
+    Transaction count and amount total per (account, class).
+    """
+    return conn.execute('''
+        SELECT account, class, COUNT(*), SUM(amount)
+        FROM transactions
+        GROUP BY account, class
+    ''').fetchall()
+
+
+def subclass_totals(conn):
+    """
+    Transaction count and amount total per (account, subClass).
+    """
+    return conn.execute('''
+        SELECT account, subClass, COUNT(*), SUM(amount)
+        FROM transactions
+        GROUP BY account, subClass
+    ''').fetchall()
+
+
+def flow_totals(conn, period):
+    """
+    Credit and debit totals per (account, period). Debits are returned as positive values.
+    """
+    return conn.execute(f'''
+        SELECT account, {PERIODS[period]} AS period,
+               SUM(CASE WHEN direction = 'credit' THEN amount ELSE 0 END),
+               SUM(CASE WHEN direction = 'debit' THEN ABS(amount) ELSE 0 END)
+        FROM transactions
+        GROUP BY account, period
+    ''').fetchall()
+
+
+def closing_balances(conn, period):
+    """
+    Closing balance per (account, period) - the balance on the latest posted transaction in the period.
+    Uses SQLite's bare-column behaviour with MAX(), which takes the other columns from the row holding the maximum.
+    """
+    return conn.execute(f'''
+        SELECT account, {PERIODS[period]} AS period, balance, MAX(postDate)
+        FROM transactions
+        GROUP BY account, period
+    ''').fetchall()
+
+
+def top_n_with_other(totals, top_n, other_label='Other'):
+    """
+    Keeps the top_n labels by count and folds the rest into a single 'Other' bucket.
+
+    :totals: Dict of {label: [count, amount_total]}.
+
+    Returns:
+    \tDict: {'labels': [...], 'counts': [...], 'totals': [...]}, ordered by count descending.
+    """
+    ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    labels, counts, amounts = [], [], []
+    for label, (count, amount) in ranked[:top_n]:
+        labels.append(label)
+        counts.append(count)
+        amounts.append(round(amount or 0, 2))
+    rest = ranked[top_n:]
+    if rest:
+        labels.append(other_label)
+        counts.append(sum(count for _, (count, _) in rest))
+        amounts.append(round(sum(amount or 0 for _, (_, amount) in rest), 2))
+    return {'labels': labels, 'counts': counts, 'totals': amounts}
@@ -0,0 +1,140 @@
+import gzip
+import mimetypes
+import os
+import sys
+
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli       # optional - pip install Brotli to serve br as well as gzip
+except ImportError:
+    brotli = None
+
+## Response compression.
+##  - Dynamic responses (dashboard JSON, base64 PNG payloads, rendered templates) are compressed per request when they
+##    are a compressible type, at least COMPRESS_MIN_SIZE bytes, and the client accepts br or gzip.
+##  - Static files are never compressed per request. Precompress them once at build/deploy time:
+##        python -m services.compression [static_dir]
+##    which writes .br/.gz siblings next to each text asset; the static route serves the best variant the client
+##    accepts, falling back to the plain file if there is none (or it is older than the file).
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 500))      # bytes - smaller bodies aren't worth it
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))              # gzip level for dynamic responses
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))             # brotli quality for dynamic responses
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+    'application/json', 'image/svg+xml', 'application/xml',
+}
+STATIC_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt', '.csv', '.map', '.xml'}
+
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def encodings():
+    """
+    Encodings this process can produce, best first.
+    """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding, static=False):
+    """
+    Compresses data with encoding ('br' or 'gzip'); static uses the slowest, smallest settings.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if static else COMPRESS_LEVEL, mtime=0)
+
+
+def _accepted(options):
+    # the client's preferred encoding among options, or None
+    best = request.accept_encodings.best_match(options)
+    return best if best in options else None
+
+
+def _compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _accepted(encodings())
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # the compressed body is a different representation, so a strong ETag can no longer promise byte equality
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _static_view(app):
+    plain = app.view_functions['static']
+
+    def static(filename):
+        path = safe_join(app.static_folder, filename)
+        if path is not None and os.path.isfile(path):
+            available = [encoding for encoding in SUFFIXES
+                         if os.path.isfile(path + SUFFIXES[encoding])
+                         and os.path.getmtime(path + SUFFIXES[encoding]) >= os.path.getmtime(path)]
+            encoding = _accepted(available) if available else None
+            if encoding is not None:
+                response = send_from_directory(app.static_folder, filename + SUFFIXES[encoding],
+                                               mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+            response = plain(filename=filename)
+            if available:
+                response.vary.add('Accept-Encoding')
+            return response
+        return plain(filename=filename)
+    return static
+
+
+def init_app(app):
+    """
+    Compresses dynamic responses and serves precompressed static variants.
+    """
+    app.view_functions['static'] = _static_view(app)
+    app.after_request(_compress_response)
+
+
+def precompress(static_dir, min_size=COMPRESS_MIN_SIZE):
+    """
+    Writes .gz (and .br, if brotli is installed) siblings for every text asset under static_dir that is at least
+    min_size bytes, skipping ones that are already up to date.
+
+    Returns:
+    \tNumber of files written.
+    """
+    written = 0
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in STATIC_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) < min_size:
+                continue
+            with open(path, 'rb') as f:
+                data = None
+                for encoding in encodings():
+                    target = path + SUFFIXES[encoding]
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    data = data if data is not None else f.read()
+                    with open(target, 'wb') as out:
+                        out.write(compress(data, encoding, static=True))
+                    written += 1
+    return written
+
+
+if __name__ == '__main__':
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+    print("Precompressed %d file(s) under %s" % (precompress(static_dir), static_dir))
@@ -0,0 +1,198 @@
+import json
+import os
+
+from services import chart_data, tenants
+from services.cache import LRUCache
+
+## Dashboard snapshot builder - one round of grouped queries produces every widget payload used by /dash
+
+ALL_ACCOUNTS = 'ALL'
+
+# Materialised snapshots are kept per user; an account toggle is then a dictionary lookup into the user's snapshot.
+DASH_CACHE_MAX_USERS = int(os.getenv("DASH_CACHE_MAX_USERS", 512))
+DASH_CACHE_MAX_MB = int(os.getenv("DASH_CACHE_MAX_MB", 64))
+
+# Charts are built from grouped aggregates (see services/chart_data.py), so the payload stays the same size as a
+# user's history grows. Balance/flow series keep only the most recent DASH_MAX_BINS periods.
+DEFAULT_PERIOD = 'day'
+DEFAULT_TOP_N = int(os.getenv("DASH_TOP_SUBCLASSES", 8))
+DASH_MAX_BINS = int(os.getenv("DASH_MAX_BINS", 366))
+
+
+def _to_json(value):
+    """
+    Serialise a chart payload compactly; the template and dash2.html JSON.parse these strings.
+    """
+    return json.dumps(value, separators=(',', ':'))
+
+
+class _AccountView:
+    """
+    Collects the grouped aggregates for one account (or for 'ALL') and turns them into the widget payload.
+    """
+    __slots__ = ('categories', 'subclasses', 'flows', 'balances', 'latest', 'min_balance', 'max_balance')
+
+    def __init__(self):
+        self.categories = {}    # class -> [count, amount total]
+        self.subclasses = {}    # subClass -> [count, amount total]
+        self.flows = {}         # period -> [credit total, debit total]
+        self.balances = {}      # period -> (latest postDate, closing balance)
+        self.latest = None      # (balance, {amount, class, day, month, year}) of the first row in table order
+        self.min_balance = None
+        self.max_balance = None
+
+    @staticmethod
+    def add_total(totals, label, count, amount):
+        entry = totals.setdefault(label, [0, 0.0])
+        entry[0] += count
+        entry[1] += amount or 0
+
+    def add_summary(self, min_balance, max_balance, balance, latest):
+        if min_balance is not None and (self.min_balance is None or min_balance < self.min_balance):
+            self.min_balance = min_balance
+        if max_balance is not None and (self.max_balance is None or max_balance > self.max_balance):
+            self.max_balance = max_balance
+        if self.latest is None:
+            self.latest = (balance, latest)
+
+    def add_flow(self, period, credit, debit):
+        entry = self.flows.setdefault(period, [0.0, 0.0])
+        entry[0] += credit or 0
+        entry[1] += debit or 0
+
+    def add_balance(self, period, balance, post_date):
+        current = self.balances.get(period)
+        if current is None or (post_date or '') > (current[0] or ''):
+            self.balances[period] = (post_date, balance)
+
+    def payload(self, account, accounts_json, top_n):
+        """
+        Build the widget payload for this account, keyed the same as the /dash POST response.
+        """
+        balance_range = None
+        if self.min_balance is not None:
+            balance_range = round(self.max_balance - self.min_balance, 2)
+
+        flow_periods = sorted(self.flows)
+        kept_flows = flow_periods[-DASH_MAX_BINS:]
+        balance_periods = sorted(self.balances)[-DASH_MAX_BINS:]
+
+        return {
+            'currentBalance':   self.latest[0] if self.latest else None,
+            'balanceRange':     balance_range,
+            'jsd1':             _to_json(chart_data.top_n_with_other(self.categories, len(self.categories))),
+            'jsd2':             _to_json(chart_data.top_n_with_other(self.subclasses, top_n)),
+            'jsd3':             _to_json({
+                                    'labels':       kept_flows,
+                                    'credit':       [round(self.flows[p][0], 2) for p in kept_flows],
+                                    'debit':        [round(self.flows[p][1], 2) for p in kept_flows],
+                                    'creditTotal':  round(sum(self.flows[p][0] for p in flow_periods), 2),
+                                    'debitTotal':   round(sum(self.flows[p][1] for p in flow_periods), 2),
+                                }),
+            'jsd4':             _to_json({
+                                    'labels':       balance_periods,
+                                    'balances':     [self.balances[p][1] for p in balance_periods],
+                                }),
+            'jsd8':             _to_json([self.latest[1]] if self.latest else []),
+            'jsxx':             accounts_json,
+            'defacc':           account,
+        }
+
+
+def build_snapshot(conn, period=DEFAULT_PERIOD, top_n=DEFAULT_TOP_N):
+    """
+    Builds the widget payloads for 'ALL' and for every account from a handful of grouped queries.
+
+    :conn: An open sqlite3 connection to the transactions database.
+    :period: Bin size for the credit/debit and balance series - 'day', 'week' or 'month'.
+    :top_n: Number of subclasses shown before the rest are folded into 'Other'.
+
+    Returns:
+    \tDict: {account: payload}, always containing an 'ALL' entry. Each payload holds the chart JSON strings
+    \t(jsd1-jsd4, jsd8), current balance, balance range, account list (jsxx) and the account name (defacc).
+    """
+    if period not in chart_data.PERIODS:
+        raise ValueError("Unknown period: %s" % period)
+
+    everything = _AccountView()
+    views = {}
+
+    def views_for(account):
+        view = views.get(account)
+        if view is None:
+            view = views[account] = _AccountView()
+        return everything, view
+
+    # Accounts come back ordered by first appearance, so the first one also holds the overall latest transaction
+    for account, min_bal, max_bal, _, balance, amount, tran_class, day, month, year in chart_data.account_summary(conn):
+        latest = {'amount': amount, 'class': tran_class, 'day': day, 'month': month, 'year': year}
+        for view in views_for(account):
+            view.add_summary(min_bal, max_bal, balance, latest)
+
+    for account, tran_class, count, total in chart_data.category_totals(conn):
+        for view in views_for(account):
+            view.add_total(view.categories, tran_class, count, total)
+
+    for account, subclass, count, total in chart_data.subclass_totals(conn):
+        for view in views_for(account):
+            view.add_total(view.subclasses, subclass, count, total)
+
+    for account, bin_label, credit, debit in chart_data.flow_totals(conn, period):
+        for view in views_for(account):
+            view.add_flow(bin_label, credit, debit)
+
+    for account, bin_label, balance, post_date in chart_data.closing_balances(conn, period):
+        for view in views_for(account):
+            view.add_balance(bin_label, balance, post_date)
+
+    accounts = list(views)
+    accounts_json = _to_json([{'account': account} for account in [ALL_ACCOUNTS] + accounts])
+    snapshot = {ALL_ACCOUNTS: everything.payload(ALL_ACCOUNTS, accounts_json, top_n)}
+    for account, view in views.items():
+        snapshot[account] = view.payload(account, accounts_json, top_n)
+    return snapshot
+
+
+def account_payload(snapshot, account):
+    """
+    Returns the payload for an account from a snapshot. Accounts with no transactions get an empty payload
+    rather than an error, so a stale account toggle on the page doesn't break the dashboard.
+    """
+    if account in snapshot:
+        return snapshot[account]
+    return _AccountView().payload(account, snapshot[ALL_ACCOUNTS]['jsxx'], DEFAULT_TOP_N)
+
+
+def _snapshot_size(snapshot):
+    """
+    Approximate memory held by a snapshot - dominated by the JSON strings of each account payload.
+    """
+    size = 0
+    for payload in snapshot.values():
+        for value in payload.values():
+            size += len(value) if isinstance(value, str) else 16
+    return size
+
+
+# entries are (data version, snapshot) - see tenants.cached
+snapshot_cache = LRUCache(max_entries=DASH_CACHE_MAX_USERS, max_bytes=DASH_CACHE_MAX_MB * 1024 * 1024,
+                          sizeof=lambda entry: _snapshot_size(entry[1]))
+
+
+def get_snapshot(user_id):
+    """
+    Returns the user's dashboard snapshot from the cache, building it from their transactions database on a miss or
+    when their data has changed since (including through another worker). Concurrent requests for the same user share
+    a single build.
+    """
+    return tenants.cached(snapshot_cache, user_id, build_snapshot)
+
+
+def invalidate(user_id=None):
+    """
+    Drops a user's cached snapshot after their transactions change. user_id=None drops every user's snapshot.
+    """
+    if user_id is None:
+        snapshot_cache.clear()
+    else:
+        snapshot_cache.invalidate(user_id)
@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from services import datastore
+
+## Static datasets shipped with the app (static/data/*.csv).
+## Files are read on first use rather than at import, and the records JSON handed to templates is serialised once and
+## cached. Both are reloaded when the file's mtime changes. A server that imports the app before forking workers
+## (gunicorn preload_app) can call preload() in the master so the workers share the loaded frames copy-on-write
+## instead of each reading its own copy.
+
+app_log = logging.getLogger("dolfin.app")
+
+DATA_DIR = os.path.join(datastore.BASE_DIR, "static", "data")
+
+
+class Dataset:
+    """
+    A CSV file loaded lazily and reloaded when it changes on disk.
+
+    :param path: CSV path, absolute or relative to static/data.
+    :param read_options: Passed to pandas.read_csv.
+    """
+
+    def __init__(self, path, **read_options):
+        self.path = path if os.path.isabs(path) else os.path.join(DATA_DIR, path)
+        self.read_options = read_options
+        self._mtime = None
+        self._frame = None
+        self._records_json = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    frame = pd.read_csv(self.path, **self.read_options)
+                    self._frame, self._records_json, self._mtime = frame, None, mtime
+                    app_log.info("DATASETS: Loaded %s (%d rows)." % (os.path.basename(self.path), len(frame)))
+        return self._frame
+
+    def version(self):
+        """
+        Changes whenever the file does - for ETags of responses built from it.
+        """
+        return os.stat(self.path).st_mtime_ns
+
+    def frame(self):
+        """
+        Returns the DataFrame. It is shared between requests - don't modify it.
+        """
+        return self._current()
+
+    def records_json(self):
+        """
+        Returns the data as a JSON array of records (DataFrame.to_json(orient='records')), serialised once per load.
+        """
+        frame = self._current()
+        records = self._records_json
+        if records is None or frame is not self._frame:
+            records = frame.to_json(orient='records')
+            with self._lock:
+                if frame is self._frame:
+                    self._records_json = records
+        return records
+
+
+_datasets = {}
+
+
+def register(name, path, **read_options):
+    _datasets[name] = Dataset(path, **read_options)
+    return _datasets[name]
+
+
+def get(name):
+    return _datasets[name]
+
+
+def preload():
+    """
+    Loads every registered dataset (and its records JSON) now, e.g. in a pre-fork server's master process.
+    """
+    for dataset in _datasets.values():
+        dataset.records_json()
+
+
+# Only what a route reads - preload() parses each of these in the master
+register('predicted_balances', 'Predicted_Balances.csv')
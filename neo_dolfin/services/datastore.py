@@ -0,0 +1,278 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+## Shared SQLite data-access layer.
+## Every module gets its connections from here instead of calling sqlite3.connect() ad hoc, so all databases run in WAL
+## mode (dashboard reads don't block on a login sync writing transactions), share one busy timeout and statement cache,
+## and are always returned/closed.
+
+db_log = logging.getLogger("dolfin.db")
+
+# All paths are resolved from the neo_dolfin directory so they no longer depend on the working directory.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the shipped demo data the chatbot answers from when nobody is signed in
+TRANSACTIONS_DB = os.getenv("TRANSACTIONS_DB_PATH", os.path.join(BASE_DIR, "db", "transactions_ut.db"))
+USER_DB = os.getenv("USER_DB_PATH", os.path.join(BASE_DIR, "db", "user_database.db"))
+DOLFIN_DB = os.getenv("DOLFIN_DB_PATH", os.path.join(BASE_DIR, "db", "dolfin_db.db"))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))               # connections kept per database file
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))       # seconds to wait for a free connection
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))  # how long SQLite waits on a locked database
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 256))  # prepared statements cached per connection
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+DB_MAX_POOLS = int(os.getenv("DB_MAX_POOLS", 256))              # database files with open connections at once
+
+# Timing hooks - callbacks run after every query as callback(sql, seconds, db_path)
+_query_hooks = []
+
+
+def add_query_hook(callback):
+    """
+    Registers a callback(sql, seconds, db_path) that runs after every query made through a pooled connection.
+    """
+    _query_hooks.append(callback)
+    return callback
+
+
+def remove_query_hook(callback):
+    if callback in _query_hooks:
+        _query_hooks.remove(callback)
+
+
+def _log_slow_query(sql, seconds, db_path):
+    if seconds * 1000 >= DB_SLOW_QUERY_MS:
+        db_log.warning("DB: Slow query (%.1f ms) on %s: %s" % (seconds * 1000, os.path.basename(db_path), " ".join(sql.split())[:200]))
+
+
+add_query_hook(_log_slow_query)
+
+
+def _run_timed(cursor, method, sql, args):
+    start = time.perf_counter()
+    try:
+        return method(sql, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        for hook in list(_query_hooks):
+            try:
+                hook(sql, elapsed, cursor.connection.db_path)
+            except Exception as e:
+                db_log.error("DB: Query hook failed: " + str(e))
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each execute()/executemany() to the registered timing hooks.
+    """
+
+    def execute(self, sql, *args):
+        return _run_timed(self, super().execute, sql, args)
+
+    def executemany(self, sql, *args):
+        return _run_timed(self, super().executemany, sql, args)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection whose cursors are timed. Connection.execute() is routed through a TimedCursor too.
+    """
+    db_path = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def open_connection(db_path):
+    """
+    Opens a new connection with the standard pragmas. Used by the pool; call directly only for one-off scripts.
+    """
+    conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000, factory=PooledConnection,
+                           cached_statements=DB_STATEMENT_CACHE, check_same_thread=False)
+    conn.db_path = db_path
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")        # safe with WAL, avoids an fsync on every commit
+    conn.execute("PRAGMA busy_timeout = %d;" % DB_BUSY_TIMEOUT_MS)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Small thread-safe pool of connections to one database file. Connections are created lazily up to size,
+    handed to one thread at a time, and rolled back (if left mid-transaction) when they come back.
+    """
+
+    def __init__(self, db_path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()     # most recently used first, so warm connections are reused
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return open_connection(self.db_path)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("DB: No free connection for %s after %.0fs" % (self.db_path, self.timeout))
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped rather than handed to the next caller
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection. Commits on success and rolls back on error, like "with sqlite3.connect(...)", and always
+        returns the connection to the pool.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=TRANSACTIONS_DB):
+    """
+    Returns the pool for db_path. At most DB_MAX_POOLS pools are kept (one per user database in services/tenants.py);
+    the least recently used one has its idle connections closed when another is needed. Connections it still has out
+    are closed when they are released and the pool is garbage collected.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+            evicted = _pools.popitem(last=False)[1] if len(_pools) > DB_MAX_POOLS else None
+        else:
+            _pools.move_to_end(db_path)
+            evicted = None
+    if evicted is not None:
+        evicted.close_all()
+    return pool
+
+
+def connection(db_path=TRANSACTIONS_DB):
+    """
+    Context manager for a pooled connection to db_path, for code that runs outside a Flask request.
+
+    Usage: with datastore.connection(datastore.USER_DB) as conn: ...
+    """
+    return get_pool(db_path).connection()
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+def _reset_after_fork():
+    # SQLite connections must not be shared across processes; a forked worker starts with empty pools.
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+## Flask integration - one connection per database per request/app context, returned to the pool on teardown
+
+def get_db(db_path=TRANSACTIONS_DB):
+    """
+    Returns the connection for db_path bound to the current Flask app context, borrowing it on first use.
+    """
+    from flask import g
+    conns = g.setdefault('_dolfin_db', {})
+    if db_path not in conns:
+        pool = get_pool(db_path)
+        conns[db_path] = (pool, pool.acquire())    # released to the same pool even if it is evicted meanwhile
+    return conns[db_path][1]
+
+
+def _teardown_db(exc):
+    from flask import g
+    conns = g.pop('_dolfin_db', None)
+    if not conns:
+        return
+    for pool, conn in conns.values():
+        try:
+            if conn.in_transaction:
+                if exc is None:
+                    conn.commit()
+                else:
+                    conn.rollback()
+        finally:
+            pool.release(conn)
+
+
+def init_app(app):
+    """
+    Ties request-scoped connections from get_db() to the Flask app context lifecycle.
+    """
+    app.teardown_appcontext(_teardown_db)
@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+
+from services import tenants
+from services.cache import LRUCache
+
+## Per-user transaction frames for the analytics code (services/analytics.py).
+## Each user's transactions are read from their database once, after a sync or on first use, into a compact columnar
+## DataFrame - categoricals for the low-cardinality text columns, 32-bit numbers, real datetimes - and kept in an LRU
+## cache with a memory budget. Every consumer gets the same frame, so it must be treated as read-only: select or
+## .copy() before modifying anything.
+
+FRAME_CACHE_MAX_USERS = int(os.getenv("FRAME_CACHE_MAX_USERS", 256))
+FRAME_CACHE_MAX_MB = int(os.getenv("FRAME_CACHE_MAX_MB", 256))
+
+CATEGORY_COLUMNS = ['type', 'status', 'account', 'direction', 'class', 'institution', 'subClass']
+FLOAT_COLUMNS = ['amount', 'balance']
+INT_COLUMNS = ['day', 'month', 'year']
+DATE_COLUMNS = ['transactionDate', 'postDate']
+
+
+def load_frame(conn):
+    """
+    Reads the transactions table into a compact DataFrame.
+
+    :param conn: Connection to a transactions database.
+
+    Returns:
+    \tDataFrame with the transactions columns, in table order.
+    """
+    frame = pd.read_sql_query("SELECT * FROM transactions", conn)
+    for column in frame.columns:
+        if column in CATEGORY_COLUMNS:
+            frame[column] = frame[column].astype('category')
+        elif column in FLOAT_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float32')
+        elif column in INT_COLUMNS:
+            values = pd.to_numeric(frame[column], errors='coerce')
+            frame[column] = values.astype('Int32' if values.isna().any() else 'int32')
+        elif column in DATE_COLUMNS:
+            # stored as text, either '2023-06-01' or '2023-06-01 00:00:00'
+            frame[column] = pd.to_datetime(frame[column], format='ISO8601', errors='coerce')
+    return frame
+
+
+def _frame_size(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+# entries are (data version, frame) - see tenants.cached
+frame_cache = LRUCache(max_entries=FRAME_CACHE_MAX_USERS, max_bytes=FRAME_CACHE_MAX_MB * 1024 * 1024,
+                       sizeof=lambda entry: _frame_size(entry[1]))
+
+
+def get_frame(user_id):
+    """
+    Returns the user's transactions frame from the cache, loading it from their database on a miss or when their data
+    has changed since (including through another worker). Concurrent misses for the same user share a single load.
+    The frame is shared - don't modify it.
+    """
+    return tenants.cached(frame_cache, user_id, load_frame)
+
+
+def invalidate(user_id=None):
+    """
+    Drops a user's cached frame after their transactions change. user_id=None drops every user's frame.
+    """
+    if user_id is None:
+        frame_cache.clear()
+    else:
+        frame_cache.invalidate(user_id)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+
+from flask import current_app, request, jsonify
+
+## HTTP caching policy.
+##  - Static files: url_for('static', ...) adds a content fingerprint (?v=<hash>). A fingerprinted URL never changes
+##    content, so it is cached for a year as immutable; a file is re-downloaded only when its hash (and URL) changes.
+##    Static URLs written by hand (/static/..., ../static/...) are revalidated with their ETag instead.
+##  - JSON data endpoints: json_response() sends a strong ETag derived from the data version and answers a matching
+##    If-None-Match with 304 before building the payload.
+##  - Everything else (authenticated HTML, redirects): no-store, as before.
+
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", 365 * 24 * 3600))
+FINGERPRINT_ARG = 'v'
+
+NO_STORE = {
+    'Cache-Control':    'no-cache, no-store, must-revalidate',
+    'Pragma':           'no-cache',
+    'Expires':          '0',
+}
+
+_fingerprints = {}      # static file path -> (mtime_ns, size, hash)
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprint(path):
+    """
+    Short content hash of a file, recomputed only when its mtime or size changes.
+
+    Returns:
+    \tThe hash, or None if the file doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    value = digest.hexdigest()[:12]
+    with _fingerprints_lock:
+        _fingerprints[path] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+def etag_for(*parts):
+    """
+    Strong ETag value for a response determined entirely by parts (user, data version, query arguments, ...).
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def json_response(build, *version_parts):
+    """
+    Conditional JSON response for data endpoints.
+
+    :param build: Callable returning the payload; not called when the client's copy is still current.
+    :param version_parts: Everything the payload depends on - include the user and their data version.
+
+    Returns:
+    \tA 304 response if If-None-Match matches, otherwise the JSON payload with its ETag.
+    """
+    etag = etag_for(request.path, *version_parts)
+    if request.if_none_match.contains_weak(etag):      # weak match - compression (services/compression.py) marks it W/
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'     # stored by the browser only, revalidated on every use
+    return response
+
+
+def _add_fingerprint(app):
+    def url_defaults(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and FINGERPRINT_ARG not in values:
+            value = fingerprint(os.path.join(app.static_folder, values['filename']))
+            if value:
+                values[FINGERPRINT_ARG] = value
+    return url_defaults
+
+
+def _apply_policy(app):
+    def after_request(response):
+        if request.endpoint == 'static':
+            version = request.args.get(FINGERPRINT_ARG)
+            filename = (request.view_args or {}).get('filename')
+            if response.status_code == 200 or response.status_code == 304:
+                if version and filename and version == fingerprint(os.path.join(app.static_folder, filename)):
+                    response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % STATIC_MAX_AGE
+                else:
+                    response.headers['Cache-Control'] = 'public, no-cache'
+                return response
+        elif 'Cache-Control' in response.headers and response.headers.get('ETag'):
+            return response     # set by json_response()
+        response.headers.update(NO_STORE)
+        return response
+    return after_request
+
+
+def init_app(app):
+    """
+    Installs static fingerprinting and the response caching policy on the app.
+    """
+    app.url_defaults(_add_fingerprint(app))
+    app.after_request(_apply_policy(app))
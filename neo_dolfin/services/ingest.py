@@ -0,0 +1,103 @@
+import pandas as pd
+
+## Bulk ingest of transaction DataFrames into SQLite.
+## Values are taken column-wise from the DataFrame (no iterrows boxing), written with one executemany() inside a single
+## transaction, and existing rows are updated in place (INSERT ... ON CONFLICT DO UPDATE) instead of aborting the batch.
+
+# Bound parameters per "id IN (...)" lookup, well under SQLite's variable limit
+_LOOKUP_CHUNK = 500
+
+
+def _column_values(series):
+    """
+    Converts a DataFrame column to a list of plain Python values sqlite3 can bind (NaN/NaT become None).
+    Datetime columns are stored as text, matching str(Timestamp).
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return [None if pd.isna(value) else str(value) for value in series]
+    values = series.astype(object).where(series.notna(), None)
+    return values.tolist()
+
+
+def frame_rows(frame, columns, constants=None):
+    """
+    Builds parameter tuples for executemany() from the given DataFrame columns.
+
+    :param constants: Optional dict of {column: value} appended to every row (e.g. the owning user's id).
+
+    Returns:
+    \tTuple (columns, rows) - the full column list and a list of row tuples in that order.
+    """
+    constants = constants or {}
+    data = [_column_values(frame[column]) for column in columns]
+    data.extend([value] * len(frame) for value in constants.values())
+    return list(columns) + list(constants), list(zip(*data))
+
+
+def upsert_statement(table, columns, key='id'):
+    """
+    INSERT ... ON CONFLICT(key) DO UPDATE that only touches a row when at least one value differs, so unchanged rows
+    don't count as changes (and aren't rewritten).
+    """
+    others = [column for column in columns if column != key]
+    quoted = lambda name: '"%s"' % name
+    return '''
+        INSERT INTO {table} ({columns}) VALUES ({placeholders})
+        ON CONFLICT({key}) DO UPDATE SET {assignments}
+        WHERE {changed}
+    '''.format(
+        table=table,
+        columns=", ".join(quoted(c) for c in columns),
+        placeholders=", ".join("?" for _ in columns),
+        key=quoted(key),
+        assignments=", ".join("%s = excluded.%s" % (quoted(c), quoted(c)) for c in others),
+        changed=" OR ".join("%s.%s IS NOT excluded.%s" % (table, quoted(c), quoted(c)) for c in others),
+    )
+
+
+def _existing_keys(conn, table, key, keys):
+    found = set()
+    for start in range(0, len(keys), _LOOKUP_CHUNK):
+        chunk = keys[start:start + _LOOKUP_CHUNK]
+        query = 'SELECT "%s" FROM %s WHERE "%s" IN (%s)' % (key, table, key, ", ".join("?" for _ in chunk))
+        found.update(row[0] for row in conn.execute(query, chunk))
+    return found
+
+
+def upsert_frame(conn, table, frame, columns, key='id', constants=None):
+    """
+    Inserts or updates every row of frame in one transaction.
+
+    Rows without a key are skipped; if a key appears more than once in the frame the last occurrence wins. Existing
+    rows whose values are identical are left alone.
+
+    :param conn: Open sqlite3 connection. The caller commits (datastore.connection() does so on exit).
+    :param columns: DataFrame columns to write; must include key.
+    :param constants: Optional dict of {column: value} written on every row.
+
+    Returns:
+    \tDict: {'inserted': n, 'updated': n, 'skipped': n}
+    """
+    columns, rows = frame_rows(frame, columns, constants)
+    key_index = columns.index(key)
+    total = len(rows)
+
+    # Drop keyless rows and collapse duplicate keys (last one wins), keeping first-seen order
+    latest = {}
+    for row in rows:
+        if row[key_index] is not None:
+            latest[row[key_index]] = row
+    rows = list(latest.values())
+    if not rows:
+        return {'inserted': 0, 'updated': 0, 'skipped': total}
+
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")     # take the write lock up front so the counts below stay accurate
+    existing = _existing_keys(conn, table, key, list(latest))
+    # the cursor's rowcount counts only the rows this statement wrote; total_changes would include trigger writes
+    # (migration 5 bumps data_version on every change)
+    changed = conn.executemany(upsert_statement(table, columns, key), rows).rowcount
+
+    inserted = len(rows) - len(existing)
+    updated = changed - inserted
+    return {'inserted': inserted, 'updated': updated, 'skipped': total - inserted - updated}
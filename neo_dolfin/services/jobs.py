@@ -0,0 +1,318 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from services import datastore
+
+## Background jobs.
+## Slow work (the Basiq sync at login, EPV clustering, word clouds, balance forecasts) runs on a small thread pool so
+## requests return straight away; callers get a job id they can poll. Every job is recorded in a SQLite table
+## (JOBS_DB), so its status and result can be read from any gunicorn worker, not only the one running it.
+##  - Submitting a job identical to one already queued or running for the user (same kind and arguments) returns the
+##    existing job instead of starting a second one.
+##  - A finished job's result is reused for identical submissions for its TTL (see invalidate() for data changes).
+##    Jobs computed from a user's transactions are submitted with their data version, so a result is never reused
+##    once the data has changed - even when the change happened in another worker, where invalidate() never ran.
+##  - A queued job can be cancelled outright; a running one is marked cancelled and its result is discarded.
+
+app_log = logging.getLogger("dolfin.app")
+
+JOBS_DB = os.getenv("JOBS_DB_PATH", os.path.join(datastore.BASE_DIR, "db", "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 900))           # seconds a finished result is reused
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 24 * 3600))       # seconds a finished job stays in the table
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+JOBS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        user_id TEXT,
+        key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        pid INTEGER,
+        owner TEXT,
+        created REAL,
+        started REAL,
+        finished REAL,
+        expires REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_lookup ON jobs (kind, user_id, key, created)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished)",
+]
+
+
+class Job:
+    """
+    One unit of background work and its outcome.
+    """
+
+    def __init__(self, kind, user_id, key=''):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.key = key
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.pid = os.getpid()
+        self.owner = _process_token
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.expires = None
+        self.ttl = 0
+        self.future = None
+
+    @classmethod
+    def from_row(cls, row):
+        job = cls.__new__(cls)
+        (job.id, job.kind, job.user_id, job.key, job.state, result, job.error, job.pid, job.owner,
+         job.created, job.started, job.finished, job.expires) = row
+        job.result = json.loads(result) if result is not None else None
+        job.ttl = 0
+        job.future = None
+        return job
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    def to_dict(self, with_result=False):
+        job = {
+            'id':       self.id,
+            'kind':     self.kind,
+            'state':    self.state,
+            'error':    self.error,
+            'created':  self.created,
+            'started':  self.started,
+            'finished': self.finished,
+        }
+        if with_result and self.state == DONE:
+            job['result'] = self.result
+        return job
+
+
+def _key(args, kwargs, version=None):
+    # Jobs count as identical when their arguments (and the data version they were submitted for) serialise the same
+    return json.dumps([args, kwargs, version], sort_keys=True, default=str)
+
+
+# Identifies this process in the jobs table; pids alone are reused, e.g. by a restarted container
+_process_token = uuid.uuid4().hex
+
+
+def _new_process_token():
+    global _process_token
+    _process_token = uuid.uuid4().hex
+
+
+def _owner_alive(job):
+    if job.owner == _process_token:
+        return True
+    if job.pid == os.getpid():
+        return False        # an earlier process that had the same pid
+    try:
+        os.kill(job.pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class JobRunner:
+    """
+    Runs jobs on a thread pool and records them in the jobs table.
+
+    :param db_path: SQLite file holding the jobs table.
+    :param result_ttl: Default seconds a finished result is reused; submit(ttl=...) overrides it per job.
+    """
+
+    _COLUMNS = "id, kind, user_id, key, state, result, error, pid, owner, created, started, finished, expires"
+
+    def __init__(self, db_path=JOBS_DB, max_workers=JOB_WORKERS, result_ttl=JOB_RESULT_TTL):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self._ready = False
+        self.reset()
+
+    def reset(self):
+        # Threads don't survive fork - a worker process starts with its own pool; its parent's jobs stay in the table
+        self._executor = None
+        self._active = {}       # job id -> Job queued or running in this process
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dolfin-job")
+        return self._executor
+
+    def _connection(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with datastore.connection(self.db_path) as conn:
+                for statement in JOBS_SCHEMA:
+                    conn.execute(statement)
+            self._ready = True
+        return datastore.connection(self.db_path)
+
+    def _save(self, job, only_if_active=False):
+        with self._connection() as conn:
+            if only_if_active:
+                # a job cancelled from another process keeps its cancelled state
+                conn.execute("UPDATE jobs SET state = ?, result = ?, error = ?, started = ?, finished = ?, expires = ? "
+                             "WHERE id = ? AND state IN (?, ?)",
+                             (job.state, None if job.result is None else json.dumps(job.result, default=str),
+                              job.error, job.started, job.finished, job.expires, job.id, QUEUED, RUNNING))
+            else:
+                conn.execute("INSERT OR REPLACE INTO jobs (%s) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                             % self._COLUMNS,
+                             (job.id, job.kind, job.user_id, job.key, job.state,
+                              None if job.result is None else json.dumps(job.result, default=str),
+                              job.error, job.pid, job.owner, job.created, job.started, job.finished, job.expires))
+
+    def _load(self, where, args):
+        with self._connection() as conn:
+            row = conn.execute("SELECT %s FROM jobs WHERE %s ORDER BY created DESC LIMIT 1"
+                               % (self._COLUMNS, where), args).fetchone()
+        if row is None:
+            return None
+        job = Job.from_row(row)
+        if job.active and not _owner_alive(job):
+            # the process running it has exited - fail it so it can be resubmitted, then re-read in case it finished
+            # in the meantime
+            job.state, job.error, job.finished = FAILED, "Worker process exited", time.time()
+            self._save(job, only_if_active=True)
+            return self._load("id = ?", (job.id,))
+        return job
+
+    def submit(self, kind, user_id, fn, *args, ttl=None, version=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs), unless an identical job (same kind, user, arguments and version) is already queued
+        or running, or finished successfully less than ttl seconds ago.
+
+        :param ttl: Seconds the result is reused for identical submissions (default result_ttl, 0 to never reuse).
+        :param version: Version of the data fn reads (e.g. tenants.data_version); not passed to fn. A result is only
+                        reused for submissions with the same version.
+
+        Returns:
+        \tThe Job - new, in progress, or finished with a cached result.
+        """
+        key = _key(args, kwargs, version)
+        with self._lock:
+            for job in self._active.values():
+                if (job.kind, job.user_id, job.key) == (kind, user_id, key):
+                    return job
+            job = self._load("kind = ? AND user_id IS ? AND key = ? AND state IN (?, ?, ?)",
+                             (kind, user_id, key, QUEUED, RUNNING, DONE))
+            if job is not None and (job.active or (job.state == DONE and (job.expires or 0) > time.time())):
+                return job
+
+            job = Job(kind, user_id, key)
+            job.ttl = self.result_ttl if ttl is None else ttl
+            self._active[job.id] = job
+            self._save(job)
+            job.future = self._pool().submit(self._run, job, fn, args, kwargs)
+        self._prune()
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.state != QUEUED:
+            return
+        job.state, job.started = RUNNING, time.time()
+        self._save(job, only_if_active=True)
+        try:
+            result = fn(*args, **kwargs)
+            if job.state != CANCELLED:
+                job.result, job.state = result, DONE
+                job.expires = time.time() + job.ttl
+        except Exception as e:
+            app_log.error("JOBS: %s job for %s failed: %s" % (job.kind, job.user_id, e))
+            if job.state != CANCELLED:
+                job.error, job.state = str(e), FAILED
+        finally:
+            job.finished = time.time()
+            try:
+                self._save(job, only_if_active=True)
+            finally:
+                with self._lock:
+                    self._active.pop(job.id, None)
+
+    def get(self, job_id):
+        """
+        Returns the Job with this id (from any worker process), or None.
+        """
+        job = self._active.get(job_id)
+        return job if job is not None else self._load("id = ?", (job_id,))
+
+    def latest(self, kind, user_id):
+        """
+        Returns the user's most recent job of this kind, or None.
+        """
+        active = [job for job in self._active.values() if (job.kind, job.user_id) == (kind, user_id)]
+        if active:
+            return max(active, key=lambda job: job.created)
+        return self._load("kind = ? AND user_id IS ?", (kind, user_id))
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued or running job. Python threads can't be interrupted, so a running job finishes in the
+        background but its result is thrown away.
+
+        Returns:
+        \tTrue if the job was active and is now cancelled.
+        """
+        job = self._active.get(job_id)
+        if job is None:
+            job = self._load("id = ?", (job_id,))
+            if job is None or not job.active:
+                return False
+        if job.future is not None:
+            job.future.cancel()
+        job.state, job.finished = CANCELLED, time.time()
+        self._save(job, only_if_active=True)
+        with self._lock:
+            self._active.pop(job.id, None)
+        return True
+
+    def invalidate(self, user_id=None, kinds=None):
+        """
+        Stops finished results from being reused, e.g. after the user's transactions change.
+
+        :param user_id: Only this user's results (default everyone's).
+        :param kinds: Only jobs of these kinds (default all).
+        """
+        where, args = ["state = ?"], [DONE]
+        if user_id is not None:
+            where.append("user_id = ?")
+            args.append(user_id)
+        if kinds:
+            where.append("kind IN (%s)" % ", ".join("?" * len(kinds)))
+            args.extend(kinds)
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET expires = 0 WHERE " + " AND ".join(where), args)
+
+    def _prune(self):
+        try:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM jobs WHERE finished < ?", (time.time() - JOB_RETENTION,))
+        except Exception as e:
+            app_log.error("JOBS: Pruning the job table failed: " + str(e))
+
+
+runner = JobRunner()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_new_process_token)
+    os.register_at_fork(after_in_child=runner.reset)
@@ -0,0 +1,197 @@
+import logging
+import sys
+import threading
+
+from services import datastore, rollup
+
+## Versioned schema migrations for the transactions database (transactions_ut.db).
+## The schema version lives in SQLite's PRAGMA user_version; each migration (SQL statements, or a function taking the
+## connection) runs once, in order, inside its own transaction, so existing database files are upgraded in place the first time they are opened.
+##
+## To upgrade a database file by hand and print the query-plan check:
+##     python -m services.migrations [path/to/transactions_ut.db ...]
+
+db_log = logging.getLogger("dolfin.db")
+
+def _unique_transaction_ids(conn):
+    # Caches written by pandas.to_sql (e.g. db/transactions_ut.db) have no primary key, which INSERT ... ON CONFLICT(id)
+    # needs. Drop duplicate ids (keeping the first row, as the dashboard does) and back the column with a unique index.
+    columns = conn.execute("PRAGMA table_info(transactions)").fetchall()
+    if any(name == 'id' and pk for _, name, _, _, _, pk in columns):
+        return
+    conn.execute('''DELETE FROM transactions
+                    WHERE id IS NOT NULL
+                      AND rowid NOT IN (SELECT MIN(rowid) FROM transactions WHERE id IS NOT NULL GROUP BY id)''')
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_id ON transactions (id);")
+
+
+MIGRATIONS = [
+    (1, "transactions table", [
+        # post and transactionDate are text values - same shape API_db_op.cache_transactions has always written
+        '''CREATE TABLE IF NOT EXISTS transactions
+           (id VARCHAR(255) PRIMARY KEY,
+            type VARCHAR(50),
+            status VARCHAR(50),
+            description TEXT,
+            amount REAL,
+            account VARCHAR(255),
+            balance REAL,
+            direction VARCHAR(50),
+            class VARCHAR(50),
+            institution VARCHAR(50),
+            transactionDate TEXT,
+            postDate TEXT,
+            subClass VARCHAR(255),
+            day INTEGER,
+            month INTEGER,
+            year INTEGER);''',
+    ]),
+    (2, "indexes for dashboard and chatbot access paths", [
+        # Dashboard aggregates (services/chart_data.py) - all grouped by account, covering so the table isn't read
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_class ON transactions (account, class, amount);",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_subclass ON transactions (account, subClass, amount);",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_post ON transactions (account, postDate, direction, amount, balance);",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_balance ON transactions (account, balance);",
+        # Chatbot lookups (ai/chatbot/query_bankdata.py) - month/day balances ordered by transactionDate, id
+        "CREATE INDEX IF NOT EXISTS idx_transactions_year_month ON transactions (year, month, transactionDate, id, balance, amount);",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_year_month_day ON transactions (year, month, day, transactionDate, id, balance);",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_direction_period ON transactions (direction, year, month, amount);",
+        # Profile page - most recent transactions
+        "CREATE INDEX IF NOT EXISTS idx_transactions_post_date ON transactions (postDate);",
+        "ANALYZE;",
+    ]),
+    (3, "unique transaction ids for upserts", [
+        _unique_transaction_ids,
+    ]),
+    (4, "per-user sync high-water marks", [
+        # see services/sync.py
+        '''CREATE TABLE IF NOT EXISTS sync_state
+           (user_id VARCHAR(255) PRIMARY KEY,
+            last_post_date TEXT,
+            last_transaction_id VARCHAR(255),
+            synced_at TEXT);''',
+    ]),
+    (5, "data version counter", [
+        # Bumped by triggers on every change to transactions, so a cheap read tells whether anything built from them
+        # (e.g. an HTTP ETag in services/http_cache.py) is still current - including writes from other processes.
+        "CREATE TABLE IF NOT EXISTS data_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL);",
+        "INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0);",
+        "CREATE TRIGGER IF NOT EXISTS transactions_version_insert AFTER INSERT ON transactions BEGIN UPDATE data_version SET version = version + 1; END;",
+        "CREATE TRIGGER IF NOT EXISTS transactions_version_update AFTER UPDATE ON transactions BEGIN UPDATE data_version SET version = version + 1; END;",
+        "CREATE TRIGGER IF NOT EXISTS transactions_version_delete AFTER DELETE ON transactions BEGIN UPDATE data_version SET version = version + 1; END;",
+    ]),
+    (6, "monthly summary for the chatbot", [
+        # see services/rollup.py - kept current by the cache writers, backfilled here from what is already cached
+        '''CREATE TABLE IF NOT EXISTS monthly_summary
+           (year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            end_balance REAL,
+            debit_total REAL NOT NULL,
+            credit_total REAL NOT NULL,
+            negative_total REAL NOT NULL,
+            transaction_count INTEGER NOT NULL,
+            top_debit_description TEXT,
+            top_debit_subclass VARCHAR(255),
+            top_debit_amount REAL,
+            PRIMARY KEY (year, month)) WITHOUT ROWID;''',
+        rollup.rebuild,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Hot queries and the parameters used to plan them. check_query_plans() proves each one is answered from an index.
+HOT_QUERIES = {
+    'dashboard account filter':     ("SELECT class FROM transactions WHERE account = ?", ('acc',)),
+    'dashboard category totals':    ("SELECT account, class, COUNT(*), SUM(amount) FROM transactions GROUP BY account, class", ()),
+    'dashboard subclass totals':    ("SELECT account, subClass, COUNT(*), SUM(amount) FROM transactions GROUP BY account, subClass", ()),
+    'dashboard balance range':      ("SELECT account, MIN(balance), MAX(balance) FROM transactions GROUP BY account", ()),
+    'dashboard closing balances':   ("SELECT account, substr(postDate, 1, 10) AS period, balance, MAX(postDate) FROM transactions GROUP BY account, period", ()),
+    'chatbot month summary':        ("SELECT end_balance, debit_total FROM monthly_summary WHERE year = ? AND month = ?", (2023, 6)),
+    'chatbot year summary':         ("SELECT top_debit_description, top_debit_subclass, top_debit_amount FROM monthly_summary WHERE year = ? AND top_debit_amount IS NOT NULL ORDER BY top_debit_amount ASC LIMIT 1", (2023,)),
+    'chatbot latest month':         ("SELECT MAX(month) FROM monthly_summary WHERE year = ?", (2023,)),
+    'chatbot day balance':          ("SELECT balance FROM transactions WHERE day = ? AND month = ? AND year = ? ORDER BY transactionDate DESC, id DESC LIMIT 1", (1, 6, 2023)),
+    'rollup month refresh':         ("SELECT TOTAL(amount), COUNT(*) FROM transactions WHERE year = ? AND month = ?", (2023, 6)),
+    'rollup top debit':             ("SELECT description FROM transactions WHERE direction = 'debit' AND year = ? AND month = ? ORDER BY amount ASC, rowid ASC LIMIT 1", (2023, 6)),
+    'profile recent transactions':  ("SELECT amount, class, day, month, year FROM transactions ORDER BY postDate DESC LIMIT 5", ()),
+}
+
+_upgraded = set()
+_upgrade_lock = threading.Lock()
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applies every pending migration to an open connection, oldest first.
+
+    Returns:
+    \tList of the versions that were applied (empty if the database was already up to date).
+    """
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # re-check under the write lock, in case another process migrated first
+            if version > current_version(conn):
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute("PRAGMA user_version = %d" % version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        db_log.info("DB: Migrated schema to version %d (%s)." % (version, description))
+        applied.append(version)
+    return applied
+
+
+def upgrade(db_path=datastore.TRANSACTIONS_DB):
+    """
+    Brings the database file at db_path up to LATEST_VERSION. Cheap to call repeatedly - after the first successful
+    upgrade in this process the check is skipped.
+    """
+    if db_path in _upgraded:
+        return []
+    with _upgrade_lock:
+        if db_path in _upgraded:
+            return []
+        with datastore.connection(db_path) as conn:
+            applied = migrate(conn)
+        _upgraded.add(db_path)
+        return applied
+
+
+def query_plan(conn, sql, params=()):
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def check_query_plans(conn):
+    """
+    Runs EXPLAIN QUERY PLAN for every hot query.
+
+    Returns:
+    \tDict: {name: (uses_index, plan_lines)}. A query counts as indexed when no step scans the table without an index.
+    """
+    results = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = query_plan(conn, sql, params)
+        full_scan = any(step.startswith("SCAN ") and "INDEX" not in step and "PRIMARY KEY" not in step for step in plan)
+        results[name] = (not full_scan, plan)
+    return results
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:] or [datastore.TRANSACTIONS_DB]:
+        print("%s: applied %s" % (path, upgrade(path) or "nothing (up to date)"))
+        with datastore.connection(path) as conn:
+            for name, (ok, plan) in check_query_plans(conn).items():
+                print("  [%s] %-28s %s" % ("ok" if ok else "SCAN", name, " | ".join(plan)))
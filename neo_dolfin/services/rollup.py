@@ -0,0 +1,95 @@
+## Monthly rollup of a transactions database.
+## monthly_summary (migration 6 in services/migrations.py) holds one row per (year, month) with everything the chatbot's
+## financial intents ask about - end-of-month balance, debit/credit totals, the total of negative amounts, the largest
+## debit and the transaction count - so each answer is a primary-key lookup (ai/chatbot/query_bankdata.py) instead of
+## scans and sorts over transactions. The cache writers (api/temporary_used/API_db_op.py) refresh only the months a
+## batch touched, in the same transaction as the batch itself; rebuild() recomputes everything.
+
+# Bound parameters per "id IN (...)" lookup, well under SQLite's variable limit
+_LOOKUP_CHUNK = 500
+
+# The same definitions query_bankdata.py used against transactions: the balance of the month's last transaction
+# (by transactionDate, then id), and the debit with the lowest (most negative) amount
+_REFRESH = '''
+    INSERT INTO monthly_summary (year, month, end_balance, debit_total, credit_total, negative_total, transaction_count,
+                                 top_debit_description, top_debit_subclass, top_debit_amount)
+    SELECT :year, :month,
+           (SELECT balance FROM transactions WHERE year = :year AND month = :month
+            ORDER BY transactionDate DESC, id DESC LIMIT 1),
+           TOTAL(CASE WHEN direction = 'debit' THEN amount END),
+           TOTAL(CASE WHEN direction = 'credit' THEN amount END),
+           TOTAL(CASE WHEN amount < 0 THEN amount END),
+           COUNT(*),
+           (SELECT description FROM transactions WHERE direction = 'debit' AND year = :year AND month = :month
+            ORDER BY amount ASC, rowid ASC LIMIT 1),
+           (SELECT subClass FROM transactions WHERE direction = 'debit' AND year = :year AND month = :month
+            ORDER BY amount ASC, rowid ASC LIMIT 1),
+           (SELECT amount FROM transactions WHERE direction = 'debit' AND year = :year AND month = :month
+            ORDER BY amount ASC, rowid ASC LIMIT 1)
+    FROM transactions
+    WHERE year = :year AND month = :month
+    HAVING COUNT(*) > 0
+'''
+
+
+def periods_of(frame):
+    """
+    Returns:
+    \tSet of (year, month) pairs present in a transactions DataFrame.
+    """
+    if frame is None or frame.empty or 'year' not in frame or 'month' not in frame:
+        return set()
+    pairs = frame[['year', 'month']].dropna().drop_duplicates()
+    return {(int(year), int(month)) for year, month in pairs.itertuples(index=False)}
+
+
+def affected_periods(conn, frame, key='id'):
+    """
+    Months a batch is about to change: the months of its rows, plus the months its already-cached rows are in now
+    (a transaction whose date changes leaves one month and joins another). Call before writing the batch.
+
+    Returns:
+    \tSet of (year, month) pairs.
+    """
+    periods = periods_of(frame)
+    if frame is None or frame.empty or key not in frame:
+        return periods
+    keys = frame[key].dropna().unique().tolist()
+    for start in range(0, len(keys), _LOOKUP_CHUNK):
+        chunk = keys[start:start + _LOOKUP_CHUNK]
+        query = ('SELECT DISTINCT year, month FROM transactions WHERE "%s" IN (%s) AND year IS NOT NULL AND month IS NOT NULL'
+                 % (key, ", ".join("?" for _ in chunk)))
+        periods.update((int(year), int(month)) for year, month in conn.execute(query, chunk))
+    return periods
+
+
+def refresh(conn, periods):
+    """
+    Recomputes the summary rows of the given months from transactions; a month left without transactions loses its
+    row. Runs in the caller's transaction.
+
+    :param periods: Iterable of (year, month) pairs.
+
+    Returns:
+    \tNumber of months recomputed.
+    """
+    params = [{'year': year, 'month': month} for year, month in sorted(set(periods))]
+    conn.executemany("DELETE FROM monthly_summary WHERE year = :year AND month = :month", params)
+    conn.executemany(_REFRESH, params)
+    return len(params)
+
+
+def rebuild(conn):
+    """
+    Recomputes the whole table from transactions, e.g. after the transactions were written by something else.
+
+    Returns:
+    \tNumber of months in the table.
+    """
+    conn.execute("DELETE FROM monthly_summary")
+    periods = conn.execute("SELECT DISTINCT year, month FROM transactions WHERE year IS NOT NULL AND month IS NOT NULL").fetchall()
+    return refresh(conn, [(int(year), int(month)) for year, month in periods])
+
+
+def clear(conn):
+    conn.execute("DELETE FROM monthly_summary")
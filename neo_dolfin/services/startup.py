@@ -0,0 +1,180 @@
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+## Startup: what importing the app must not do, and what can be done ahead of time instead.
+##  - Importing app.py does no network I/O and loads no models. NLTK data is never downloaded at runtime; install it
+##    once (python -m nltk.downloader -d venv/nltk_data punkt wordnet) and check_nltk_data() only looks for it.
+##  - The chatbot's intent model and NLTK, scikit-learn, wordcloud and matplotlib are loaded on first use.
+##  - warmup() does all of that work up front. gunicorn.conf.py calls it in the master when the app is preloaded, so
+##    workers are forked with everything loaded; the dev server just pays for it on the first request that needs it.
+##  - python -m services.startup [--warmup] reports where import (and warm-up) time goes.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NLTK_DATA_PATH = os.getenv("NLTK_DATA_PATH", os.path.join(APP_DIR, 'venv', 'nltk_data'))
+NLTK_RESOURCES = {
+    'punkt':    'tokenizers/punkt',
+    'wordnet':  'corpora/wordnet',
+}
+
+app_log = logging.getLogger("dolfin.app")
+
+
+def check_nltk_data():
+    """
+    Points NLTK at NLTK_DATA_PATH (after its own default locations) and checks the data the chatbot needs is installed.
+    Nothing is downloaded; missing packages are logged with the command that installs them.
+
+    Returns:
+    \tNames of the missing packages - empty if everything is there.
+    """
+    import nltk
+
+    if NLTK_DATA_PATH not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_PATH)
+    missing = []
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(package)
+    if missing:
+        app_log.warning("STARTUP: NLTK data not installed (%s) - the chatbot can't answer until it is: "
+                        "python -m nltk.downloader -d %s %s" % (", ".join(missing), NLTK_DATA_PATH, " ".join(missing)))
+    return missing
+
+
+def _warm_chatbot():
+    from ai.chatbot import chatbot_logic
+    bot = chatbot_logic.load()      # checks the NLTK data too
+    try:
+        bot.lemmatizer.lemmatize("warmup")      # WordNet itself loads lazily on first use
+    except LookupError:
+        pass    # not installed - already logged
+    from ai.chatbot import sentiment
+    sentiment.analyzer()        # VADER lexicon
+
+
+def _warm_analytics():
+    from ai.cloud import expenditure_cluster_model, word_cloud      # scikit-learn, wordcloud
+
+
+def _warm_datasets():
+    from services import datasets
+    datasets.preload()
+
+
+WARMUP_STEPS = [
+    ('datasets', _warm_datasets),
+    ('chatbot', _warm_chatbot),
+    ('analytics', _warm_analytics),
+]
+
+
+def warmup():
+    """
+    Loads everything the app otherwise loads on first use: the static datasets, the chatbot's model, NLTK data and
+    sentiment lexicon, and the analytics libraries. A step that fails is logged and left to load lazily as usual.
+
+    Returns:
+    \t{step: seconds taken} for the steps that succeeded.
+    """
+    timings = {}
+    for name, step in WARMUP_STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            app_log.error("STARTUP: warm-up of %s failed: %s" % (name, e))
+            continue
+        timings[name] = time.perf_counter() - started
+    app_log.info("STARTUP: warmed up " + ", ".join("%s %.2fs" % item for item in timings.items()))
+    return timings
+
+
+## Import-time benchmark, built on python -X importtime
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def parse_importtime(text):
+    """
+    Parses the stderr of python -X importtime.
+
+    Returns:
+    \t[(module, depth, self microseconds, cumulative microseconds), ...] in the order Python reported them - each
+    \tmodule comes after the modules it imported.
+    """
+    rows = []
+    for line in text.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            rows.append((match.group(4), (len(match.group(3)) - 1) // 2, int(match.group(1)), int(match.group(2))))
+    return rows
+
+
+def breakdown(rows, module='app'):
+    """
+    Summarises parse_importtime() rows for one module.
+
+    Returns:
+    \t{'total': module's cumulative microseconds, 'imports': [(direct import, cumulative us), ...] slowest first,
+    \t'packages': [(top-level package, self us summed over its modules), ...] slowest first}
+    """
+    total, imports, pending = 0, [], []
+    for name, depth, _, cumulative in rows:
+        if name == module:
+            total = cumulative
+            imports = [(child, us) for child, child_depth, us in pending if child_depth == depth + 1]
+            break
+        pending.append((name, depth, cumulative))
+    packages = {}
+    for name, _, self_us, _ in rows:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        'total':    total,
+        'imports':  sorted(imports, key=lambda item: item[1], reverse=True),
+        'packages': sorted(packages.items(), key=lambda item: item[1], reverse=True),
+    }
+
+
+def profile_import(module='app'):
+    """
+    Imports module in a fresh interpreter under -X importtime (from the app directory, like the app itself runs).
+
+    Returns:
+    \tbreakdown() of the result, plus 'wall': seconds the child process took.
+    """
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError("importing %s failed:\n%s" % (module, result.stderr[-2000:]))
+    summary = breakdown(parse_importtime(result.stderr), module)
+    summary['wall'] = wall
+    return summary
+
+
+def report(summary, top=15):
+    lines = ["Importing app: %.2fs (%.2fs with interpreter start-up)" % (summary['total'] / 1e6, summary['wall']), "",
+             "Slowest imports in app.py (cumulative):"]
+    lines += ["  %8.1f ms  %s" % (us / 1e3, name) for name, us in summary['imports'][:top]]
+    lines += ["", "Slowest packages (own import time):"]
+    lines += ["  %8.1f ms  %s" % (us / 1e3, name) for name, us in summary['packages'][:top]]
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    print(report(profile_import()))
+    if '--warmup' in sys.argv[1:]:
+        sys.path.insert(0, APP_DIR)
+        os.chdir(APP_DIR)
+        import app      # noqa: F401 - warm-up needs the app's logging and databases set up
+        print("\nWarm-up:")
+        for name, seconds in warmup().items():
+            print("  %8.1f ms  %s" % (seconds * 1e3, name))
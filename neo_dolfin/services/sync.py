@@ -0,0 +1,65 @@
+import datetime
+
+## Incremental Basiq transaction sync.
+## Each user's high-water mark - the newest postDate cached and that transaction's id - is kept in the sync_state table
+## next to the transactions cache (see services/migrations.py). A returning user only asks Basiq for transactions posted
+## on or after the mark; the overlap with what is already cached is absorbed by the upsert in services/ingest.py.
+
+
+def get_mark(conn, user_id):
+    """
+    Returns:
+    \tTuple (last_post_date, last_transaction_id) for the user, or None if they have never been synced.
+    """
+    row = conn.execute("SELECT last_post_date, last_transaction_id FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+    return tuple(row) if row else None
+
+
+def newest(frame):
+    """
+    Returns:
+    \tTuple (postDate, id) of the most recently posted transaction in frame, or None if it is empty.
+    """
+    if frame is None or frame.empty:
+        return None
+    # Basiq lists newest first, so a stable sort keeps the first of several same-day transactions on top
+    top = frame.sort_values('postDate', ascending=False, kind='stable').iloc[0]
+    return str(top['postDate']), str(top['id'])
+
+
+def save_mark(conn, user_id, frame):
+    """
+    Moves the user's high-water mark forward to the newest transaction in frame (never backwards) and records the
+    sync time. Call inside the same transaction that cached frame.
+    """
+    mark = get_mark(conn, user_id)
+    latest = newest(frame)
+    if mark and mark[0] and (latest is None or latest[0] < mark[0]):
+        latest = mark
+    post_date, transaction_id = latest or (None, None)
+    conn.execute('''
+        INSERT INTO sync_state (user_id, last_post_date, last_transaction_id, synced_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET last_post_date = excluded.last_post_date,
+                                           last_transaction_id = excluded.last_transaction_id,
+                                           synced_at = excluded.synced_at
+    ''', (user_id, post_date, transaction_id, datetime.datetime.now(datetime.timezone.utc).isoformat()))
+
+
+def clear_marks(conn, user_id=None):
+    """
+    Forgets the high-water mark for one user, or for everyone when user_id is None, forcing a full sync next time.
+    """
+    if user_id is None:
+        conn.execute("DELETE FROM sync_state;")
+    else:
+        conn.execute("DELETE FROM sync_state WHERE user_id = ?;", (user_id,))
+
+
+def mark_filter(mark):
+    """
+    Basiq filter expression for transactions posted on or after the mark, or None (fetch everything) without one.
+    postDate is cached at day precision, so the mark's day is fetched again and de-duplicated on insert.
+    """
+    if not mark or not mark[0]:
+        return None
+    return "transaction.postDate.gteq('%s')" % mark[0][:10]
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import re
+import threading
+
+from services import datastore, migrations
+
+## Per-user transaction stores.
+## Each user's cached transactions live in their own SQLite file under TRANSACTIONS_DIR, with the schema from
+## services/migrations.py. A login sync only ever rewrites that user's file, so concurrent sessions no longer wipe each
+## other's data or queue behind one another's writes, and every existing query is scoped simply by which database it
+## runs against.
+
+TRANSACTIONS_DIR = os.getenv("TRANSACTIONS_DIR", os.path.join(datastore.BASE_DIR, "db", "transactions"))
+
+_paths = {}
+_paths_lock = threading.Lock()
+
+
+def _file_name(user_id):
+    # Readable but filesystem-safe, with a hash suffix so distinct ids never share a file
+    user_id = str(user_id)
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)[:64].lstrip(".")
+    return "%s-%s.db" % (safe, hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:10])
+
+
+def transactions_db(user_id):
+    """
+    Returns the path of the user's transaction database, creating it at the latest schema on first use.
+    """
+    path = _paths.get(user_id)
+    if path is None:
+        with _paths_lock:
+            path = _paths.get(user_id)
+            if path is None:
+                os.makedirs(TRANSACTIONS_DIR, exist_ok=True)
+                path = os.path.join(TRANSACTIONS_DIR, _file_name(user_id))
+                migrations.upgrade(path)
+                _paths[user_id] = path
+    return path
+
+
+def connection(user_id):
+    """
+    Context manager for a pooled connection to the user's transactions, for code outside a Flask request.
+    """
+    return datastore.connection(transactions_db(user_id))
+
+
+def get_db(user_id):
+    """
+    The user's transactions connection for the current Flask request (see datastore.get_db).
+    """
+    return datastore.get_db(transactions_db(user_id))
+
+
+def current_version(conn):
+    """
+    Returns a number that changes whenever the transactions in conn's database do (see migration 5 in
+    services/migrations.py).
+    """
+    return conn.execute("SELECT version FROM data_version").fetchone()[0]
+
+
+def data_version(user_id):
+    """
+    Returns a number that changes whenever the user's transactions do.
+    """
+    with connection(user_id) as conn:
+        return current_version(conn)
+
+
+def cached(cache, user_id, build):
+    """
+    Returns build(conn) for the user's transactions from cache, rebuilding it when their data version has moved on.
+    Each worker process has its own cache and only hears about its own syncs, so entries are checked against the
+    version in the database rather than trusted until invalidated.
+
+    :param cache: LRUCache holding (version, value) entries keyed by user id.
+    :param build: Called with a connection to the user's transactions database.
+    """
+    with connection(user_id) as conn:
+        version = current_version(conn)
+        entry = cache.get(user_id)
+        if entry is not None:
+            if entry[0] == version:
+                return entry[1]
+            cache.invalidate(user_id)
+        # the version is read before the data, so a write landing mid-build leaves the entry stale, never wrong
+        return cache.get_or_compute(user_id, lambda: (current_version(conn), build(conn)))[1]
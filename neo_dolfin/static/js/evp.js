@@ -1,20 +1,52 @@
 var currentLevel='Level 0';
 var currentMode='default';
+var wordCloudRequest=0;
+
+// The EPV and word cloud endpoints answer with a background job; poll it until its result is ready
+function waitForJob(job){
+    if (job.state === 'done') {
+        return job.result;
+    }
+    if (job.state !== 'queued' && job.state !== 'running') {
+        throw new Error(job.error || job.state);
+    }
+    return new Promise(resolve => setTimeout(resolve, 1000))
+        .then(() => fetch('/jobs/' + job.id))
+        .then(response => response.json())
+        .then(waitForJob);
+}
+
+// kind: the job the endpoint runs - when it answers with another job (the word cloud with the EPV it is drawn from,
+// which had to be recomputed first), wait for that one and ask again
+function runJob(url, options, kind){
+    return fetch(url, options)
+        .then(response => response.json())
+        .then(job => {
+            if (kind && job.kind && job.kind !== kind) {
+                return Promise.resolve(waitForJob(job)).then(() => runJob(url, options, kind));
+            }
+            return waitForJob(job);
+        });
+}
+
 function request_word_cloud(){
     let requestData = {
         level: currentLevel,
         mode: currentMode
     };
+    let requestId = ++wordCloudRequest;
 
-    fetch('dash/epv/generate_word_cloud', {
+    runJob('dash/epv/generate_word_cloud', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify(requestData)
-    })
-    .then(response => response.json())
+    }, 'word_cloud')
     .then(data => {
+        if (requestId !== wordCloudRequest) {
+            return;     // a newer level/mode was picked meanwhile
+        }
         let image = data.image;
         let imgTag = document.getElementById('word_cloud');
         imgTag.src = 'data:image/png;base64,' + image;
@@ -23,8 +55,7 @@ function request_word_cloud(){
 }
 
 window.onload = function () {
-fetch('/dash/epv')
-        .then(response => response.json())
+runJob('/dash/epv')
         .then(data => {
 
             var chartDom = document.getElementById('chartContainer');
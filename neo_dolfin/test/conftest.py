@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from api import transport
+from services import dashboard, frames, ingest, tenants
+
+
+## Basiq HTTP fakes, installed in place of api/transport.py's pooled session
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.content = b'{}' if payload is not None else b''
+        self.headers = headers or {}
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    # script: a list of responses (or exceptions to raise) returned in order, or {url: response}
+    def __init__(self, script):
+        self.script = script if isinstance(script, dict) else list(script)
+        self.calls = []
+
+    def request(self, method, url, headers=None, timeout=None, **kwargs):
+        self.calls.append((method, url, timeout))
+        outcome = self.script[url] if isinstance(self.script, dict) else self.script.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def basiq_session(monkeypatch):
+    """
+    Returns a function that makes transport use a FakeSession with the given script, and returns the session.
+    """
+    def use(script):
+        session = FakeSession(script)
+        monkeypatch.setattr(transport, 'get_session', lambda: session)
+        return session
+    return use
+
+
+## Per-user transaction stores (services/tenants.py) in a temporary directory
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenants, 'TRANSACTIONS_DIR', str(tmp_path))
+    monkeypatch.setattr(tenants, '_paths', {})
+    dashboard.invalidate()
+    frames.invalidate()
+    yield tmp_path
+    dashboard.invalidate()
+    frames.invalidate()
+
+
+@pytest.fixture
+def cache(store, request):
+    """
+    Returns a function that writes rows - tuples in the order of the test module's COLUMNS - to a user's store.
+    """
+    columns = request.module.COLUMNS
+
+    def write(user_id, rows):
+        with tenants.connection(user_id) as conn:
+            ingest.upsert_frame(conn, 'transactions', pd.DataFrame(rows, columns=columns), columns)
+    return write
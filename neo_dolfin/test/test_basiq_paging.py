@@ -0,0 +1,45 @@
+from api.temporary_used import optimized_API
+
+from .conftest import FakeResponse
+
+
+FIRST = "https://au-api.basiq.io/users/u1/transactions"
+SECOND = "https://au-api.basiq.io/users/u1/transactions?next=abc"
+THIRD = "https://au-api.basiq.io/users/u1/transactions?next=def"
+
+
+def list_page(url, data, next_url):
+    return FakeResponse(200, {'type': 'list', 'data': data, 'links': {'self': url, 'next': next_url}})
+
+
+PAGES = {
+    FIRST: list_page(FIRST, [{'id': 't1'}, {'id': 't2'}], SECOND),
+    SECOND: list_page(SECOND, [{'id': 't3'}, {'id': 't4'}], THIRD),
+    THIRD: list_page(THIRD, [{'id': 't5'}], None),
+}
+
+
+def requested(session):
+    return [url for _, url, _ in session.calls]
+
+
+def test_pager_follows_next_links(basiq_session):
+    session = basiq_session(PAGES)
+    pages = optimized_API.Data.iter_transaction_pages('token', 'u1', limit_para=2)
+    assert [[t['id'] for t in page] for page in pages] == [['t1', 't2'], ['t3', 't4'], ['t5']]
+    assert requested(session) == [FIRST, SECOND, THIRD]
+
+
+def test_pager_is_lazy_and_honours_max_pages(basiq_session):
+    session = basiq_session(PAGES)
+    pages = optimized_API.Data.iter_transaction_pages('token', 'u1', limit_para=2, max_pages=2)
+    assert requested(session) == []
+    next(pages)
+    assert requested(session) == [FIRST]
+    assert len(list(pages)) == 1
+    assert requested(session) == [FIRST, SECOND]
+
+
+def test_pager_stops_on_empty_page(basiq_session):
+    basiq_session({FIRST: list_page(FIRST, [], SECOND)})
+    assert list(optimized_API.Data.iter_transaction_pages('token', 'u1', limit_para=2)) == []
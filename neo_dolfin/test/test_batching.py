@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import types
+
+import pytest
+
+from services.batching import MicroBatcher
+
+
+def test_concurrent_calls_share_batches():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch=4, max_wait=0.2)
+    start = threading.Barrier(10)
+    results = {}
+
+    def caller(n):
+        start.wait()
+        results[n] = batcher(n, timeout=5)
+
+    threads = [threading.Thread(target=caller, args=(n,)) for n in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {n: n * 2 for n in range(10)}
+    assert max(len(batch) for batch in calls) == 4
+    assert len(calls) < 10
+    stats = batcher.stats()
+    assert stats['items'] == 10 and stats['batches'] == len(calls)
+    assert sum(size * count for size, count in stats['batch_sizes'].items()) == 10
+    assert stats['max_queue_ms'] >= stats['p50_queue_ms'] >= 0
+
+
+def test_errors_reach_every_caller_and_batcher_recovers():
+    def flaky(items):
+        if 'bad' in items:
+            raise RuntimeError("model failed")
+        return items
+
+    batcher = MicroBatcher(flaky, max_batch=8, max_wait=0.05)
+    futures = [batcher.submit(item) for item in ('a', 'bad', 'c')]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(5)
+    assert batcher('ok', timeout=5) == 'ok'
+
+
+def test_usable_from_asyncio():
+    batcher = MicroBatcher(lambda items: [item.upper() for item in items], max_batch=16, max_wait=0.05)
+
+    async def main():
+        return await asyncio.gather(*(batcher.call_async(word) for word in ('hi', 'there', 'bot')))
+
+    assert asyncio.run(main()) == ['HI', 'THERE', 'BOT']
+    assert batcher.stats()['batches'] == 1
+
+
+def test_a_bad_chatbot_message_fails_only_its_own_request(monkeypatch):
+    from ai.chatbot import chatbot_logic
+    from ai.chatbot.featurizer import BagOfWords
+
+    words = ['balance', 'hello', 'spend']
+    model = types.SimpleNamespace(predict=lambda x: x * 0.9)     # echoes the bag of words as "probabilities"
+    monkeypatch.setattr(chatbot_logic, '_resources', types.SimpleNamespace(
+        featurizer=BagOfWords(words, str.split, lambda w: w), labels=words, model=model))
+    monkeypatch.setattr(chatbot_logic, 'intent_batcher', MicroBatcher(chatbot_logic.predict_vectors, max_wait=0.2))
+
+    messages = ['hello', None, 'my balance', 42]
+    start = threading.Barrier(len(messages))
+    results = {}
+
+    def ask(message):
+        start.wait()
+        try:
+            results[repr(message)] = [r['intent'] for r in chatbot_logic.predict_class(message)]
+        except Exception as e:
+            results[repr(message)] = type(e)
+
+    threads = [threading.Thread(target=ask, args=(message,)) for message in messages]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"'hello'": ['hello'], 'None': TypeError, "'my balance'": ['balance'], '42': TypeError}
+    assert chatbot_logic.intent_batcher.stats()['batches'] == 1
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from services.cache import LRUCache
+
+
+def test_lru_evicts_oldest_entry():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')              # 'a' is now most recently used
+    cache.put('c', 3)
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+
+
+def test_memory_cap_evicts_until_under_budget():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put('a', 'xxxxxx')
+    cache.put('b', 'yyyyyy')
+    assert 'a' not in cache
+    assert cache.total_bytes == 6
+    cache.put('c', 'z' * 11)    # larger than the whole budget, never stored
+    assert 'c' not in cache and 'b' in cache
+
+
+def test_concurrent_misses_compute_once():
+    cache = LRUCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ['value'] * 8
+
+
+def test_invalidate_during_compute_does_not_store_stale_value():
+    cache = LRUCache()
+
+    def compute():
+        cache.invalidate('key')
+        return 'stale'
+
+    assert cache.get_or_compute('key', compute) == 'stale'
+    assert 'key' not in cache
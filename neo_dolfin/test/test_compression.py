@@ -0,0 +1,61 @@
+import gzip
+
+from flask import Flask, jsonify
+
+from services import compression, http_cache
+
+PAYLOAD = {'rows': ['transaction %d' % i for i in range(200)]}
+
+
+def make_app(tmp_path):
+    static = tmp_path / 'static'
+    static.mkdir()
+    (static / 'dash.js').write_text("var x = 1;\n" * 200)
+    app = Flask(__name__, static_folder=str(static))
+    http_cache.init_app(app)
+    compression.init_app(app)
+
+    @app.route('/data')
+    def data():
+        return http_cache.json_response(lambda: PAYLOAD, 'alice', 1)
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    return app, static
+
+
+def test_json_is_gzipped_when_accepted(tmp_path):
+    app, _ = make_app(tmp_path)
+    client = app.test_client()
+    response = client.get('/data', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == client.get('/data').get_data()
+    assert response.headers['ETag'].startswith('W/')
+
+    # the weakened ETag still revalidates
+    again = client.get('/data', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+    assert 'Content-Encoding' not in client.get('/data').headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_static_files_use_precompressed_variants(tmp_path):
+    app, static = make_app(tmp_path)
+    client = app.test_client()
+    plain = client.get('/static/dash.js', headers={'Accept-Encoding': 'gzip'})
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers       # never compressed per request
+    plain.close()
+
+    assert compression.precompress(str(static)) >= 1
+    assert compression.precompress(str(static)) == 0     # already up to date
+    response = client.get('/static/dash.js', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype in ('application/javascript', 'text/javascript')
+    assert gzip.decompress(response.get_data()) == (static / 'dash.js').read_bytes()
+    response.close()
@@ -0,0 +1,59 @@
+import json
+import sqlite3
+
+from services import dashboard
+
+ROWS = [
+    # account, class, subClass, amount, direction, balance, postDate, day, month, year
+    ('acc-1', 'payment', 'Groceries', -20.0, 'debit', 480.0, '2023-06-03', 3, 6, 2023),
+    ('acc-2', 'transfer', 'Salary', 1000.0, 'credit', 1500.0, '2023-06-02', 2, 6, 2023),
+    ('acc-1', 'payment', 'Fuel', -50.0, 'debit', 500.0, '2023-06-01', 1, 6, 2023),
+]
+
+
+def make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''CREATE TABLE transactions (account TEXT, class TEXT, subClass TEXT, amount REAL, direction TEXT,
+                    balance REAL, postDate TEXT, day INTEGER, month INTEGER, year INTEGER)''')
+    conn.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', ROWS)
+    return conn
+
+
+def test_snapshot_has_all_and_per_account_views():
+    snapshot = dashboard.build_snapshot(make_db())
+    assert set(snapshot) == {'ALL', 'acc-1', 'acc-2'}
+    assert json.loads(snapshot['ALL']['jsxx']) == [{'account': 'ALL'}, {'account': 'acc-1'}, {'account': 'acc-2'}]
+
+    everything = snapshot['ALL']
+    assert everything['currentBalance'] == 480.0
+    assert everything['balanceRange'] == 1020.0
+    assert json.loads(everything['jsd1']) == {'labels': ['payment', 'transfer'], 'counts': [2, 1], 'totals': [-70.0, 1000.0]}
+    assert json.loads(everything['jsd8']) == [{'amount': -20.0, 'class': 'payment', 'day': 3, 'month': 6, 'year': 2023}]
+
+    acc1 = snapshot['acc-1']
+    assert acc1['defacc'] == 'acc-1'
+    assert acc1['currentBalance'] == 480.0
+    assert acc1['balanceRange'] == 20.0
+    assert json.loads(acc1['jsd4']) == {'labels': ['2023-06-01', '2023-06-03'], 'balances': [500.0, 480.0]}
+
+
+def test_flows_are_binned_by_period():
+    snapshot = dashboard.build_snapshot(make_db(), period='month')
+    flows = json.loads(snapshot['ALL']['jsd3'])
+    assert flows == {'labels': ['2023-06'], 'credit': [1000.0], 'debit': [70.0], 'creditTotal': 1000.0, 'debitTotal': 70.0}
+    assert json.loads(snapshot['acc-2']['jsd4']) == {'labels': ['2023-06'], 'balances': [1500.0]}
+
+
+def test_subclasses_fold_into_other():
+    subclasses = json.loads(dashboard.build_snapshot(make_db(), top_n=1)['ALL']['jsd2'])
+    assert len(subclasses['labels']) == 2
+    assert subclasses['labels'][-1] == 'Other'
+    assert sum(subclasses['counts']) == 3
+
+
+def test_unknown_account_gets_empty_payload():
+    snapshot = dashboard.build_snapshot(make_db())
+    payload = dashboard.account_payload(snapshot, 'missing')
+    assert payload['defacc'] == 'missing'
+    assert payload['currentBalance'] is None
+    assert json.loads(payload['jsd1']) == {'labels': [], 'counts': [], 'totals': []}
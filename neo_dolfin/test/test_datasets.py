@@ -0,0 +1,31 @@
+import os
+
+from services.datasets import Dataset
+
+
+def write(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+
+def test_dataset_is_loaded_lazily_and_serialised_once(tmp_path):
+    path = tmp_path / 'balances.csv'
+    write(path, "postDate,balance\n2023-06-01,10.5\n", 1000)
+    dataset = Dataset(str(path))
+    assert dataset._frame is None
+
+    records = dataset.records_json()
+    assert records == '[{"postDate":"2023-06-01","balance":10.5}]'
+    assert dataset.records_json() is records
+    assert dataset.frame() is dataset.frame()
+
+
+def test_dataset_reloads_when_the_file_changes(tmp_path):
+    path = tmp_path / 'balances.csv'
+    write(path, "postDate,balance\n2023-06-01,10.5\n", 1000)
+    dataset = Dataset(str(path))
+    assert len(dataset.frame()) == 1
+
+    write(path, "postDate,balance\n2023-06-01,10.5\n2023-06-02,11.0\n", 2000)
+    assert len(dataset.frame()) == 2
+    assert dataset.records_json().count("postDate") == 2
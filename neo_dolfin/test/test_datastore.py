@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from services import datastore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'test.db')
+    with datastore.connection(path) as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+    yield path
+    datastore.close_all()
+
+
+def test_connections_use_wal_and_busy_timeout(db_path):
+    with datastore.connection(db_path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == datastore.DB_BUSY_TIMEOUT_MS
+
+
+def test_pool_reuses_connections_and_rolls_back_on_error(db_path):
+    pool = datastore.get_pool(db_path)
+    with pool.connection() as first:
+        pass
+    with pytest.raises(RuntimeError):
+        with pool.connection() as second:
+            second.execute('INSERT INTO t VALUES (1)')
+            raise RuntimeError('boom')
+    assert second is first
+    with pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+
+def test_pool_blocks_when_exhausted(db_path):
+    pool = datastore.ConnectionPool(db_path, size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+
+def test_reads_are_not_blocked_by_an_open_write(db_path):
+    writer = datastore.open_connection(db_path)
+    writer.execute('INSERT INTO t VALUES (1)')      # write transaction left open
+    counts = []
+    reader = threading.Thread(target=lambda: counts.append(
+        datastore.open_connection(db_path).execute('SELECT COUNT(*) FROM t').fetchone()[0]))
+    reader.start()
+    reader.join(timeout=2)
+    writer.commit()
+    assert counts == [0]
+
+
+def test_query_hooks_receive_timings(db_path):
+    seen = []
+    hook = datastore.add_query_hook(lambda sql, seconds, path: seen.append((sql, path)))
+    try:
+        with datastore.connection(db_path) as conn:
+            conn.execute('SELECT COUNT(*) FROM t')
+            conn.cursor().execute('SELECT 1')
+    finally:
+        datastore.remove_query_hook(hook)
+    assert ('SELECT COUNT(*) FROM t', db_path) in seen
+    assert ('SELECT 1', db_path) in seen
+
+
+def test_request_scoped_connection_is_returned_on_teardown(db_path):
+    app = Flask(__name__)
+    datastore.init_app(app)
+    pool = datastore.get_pool(db_path)
+    with app.app_context():
+        conn = datastore.get_db(db_path)
+        assert datastore.get_db(db_path) is conn
+        conn.execute('INSERT INTO t VALUES (1)')
+    assert pool.acquire() is conn
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 1
+
+
+def test_least_recently_used_pools_are_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(datastore, 'DB_MAX_POOLS', 2)
+    datastore.close_all()
+    paths = [str(tmp_path / ('%d.db' % i)) for i in range(3)]
+    first = datastore.get_pool(paths[0])
+    with first.connection():
+        pass
+    datastore.get_pool(paths[1])
+    datastore.get_pool(paths[2])
+    assert paths[0] not in datastore._pools
+    assert first._idle.empty()
+    datastore.close_all()
@@ -0,0 +1,67 @@
+import json
+import os
+import pickle
+
+import numpy as np
+
+from ai.chatbot.featurizer import BagOfWords
+
+CHATBOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai', 'chatbot')
+
+
+def load_vocabulary():
+    with open(os.path.join(CHATBOT_DIR, 'words.pkl'), 'rb') as f:
+        words = pickle.load(f)
+    with open(os.path.join(CHATBOT_DIR, 'intents.json')) as f:
+        patterns = [pattern for intent in json.load(f)['intents'] for pattern in intent['patterns']]
+    return words, patterns
+
+
+def tokenize(sentence):
+    return sentence.replace('?', ' ? ').replace("'", " '").split()
+
+
+def lemmatize(word):
+    return word[:-1] if word.endswith('s') and len(word) > 3 else word
+
+
+def reference_bagw(sentence, words):
+    # chatbot_logic.bagw before the featurizer: every token against every vocabulary word
+    sentence_words = [lemmatize(word) for word in tokenize(sentence)]
+    bag = [0]*len(words)
+    for w in sentence_words:
+        for i, word in enumerate(words):
+            if word == w:
+                bag[i] = 1
+    return np.array(bag)
+
+
+def test_matches_previous_bagw():
+    words, patterns = load_vocabulary()
+    featurizer = BagOfWords(words, tokenize, lemmatize)
+    sentences = patterns + ["", "nothing in the vocabulary", "Check Check balance balances"]
+    for sentence in sentences:
+        vector = featurizer.transform(sentence)
+        assert vector.shape == (len(words),)
+        assert np.array_equal(vector, reference_bagw(sentence, words)), sentence
+    assert sum(featurizer.transform(sentence).sum() for sentence in patterns) > 0
+
+    matrix = featurizer.transform_batch(sentences)
+    assert matrix.shape == (len(sentences), len(words))
+    assert np.array_equal(matrix, np.stack([reference_bagw(sentence, words) for sentence in sentences]))
+
+
+def test_reuses_buffers_and_lemmas():
+    calls = []
+
+    def counting_lemmatize(word):
+        calls.append(word)
+        return word
+
+    featurizer = BagOfWords(['a', 'b', 'c', 'b'], str.split, counting_lemmatize)
+    out = np.ones(4, dtype=np.float32)
+    assert featurizer.transform("b b d", out=out) is out
+    assert out.tolist() == [0, 1, 0, 1]     # every position of a repeated word, as before
+    featurizer.transform("d b a")
+    assert sorted(calls) == ['a', 'b', 'd']
+    assert featurizer.transform_batch([]).shape == (0, 4)
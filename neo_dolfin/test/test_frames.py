@@ -0,0 +1,37 @@
+import sqlite3
+
+import pandas as pd
+
+from services import frames, tenants
+
+COLUMNS = ['id', 'account', 'class', 'subClass', 'direction', 'description', 'amount', 'balance', 'transactionDate',
+           'postDate', 'day', 'month', 'year']
+
+ROWS = [
+    ('t1', 'acc-a', 'payment', 'Food', 'debit', 'Coles', -5.25, 94.75, '2023-06-01', '2023-06-01 00:00:00', 1, 6, 2023),
+    ('t2', 'acc-a', 'transfer', 'Pay', 'credit', 'Salary', 100.0, 100.0, '2023-05-31', '2023-05-31', 31, 5, 2023),
+]
+
+
+def test_frame_uses_compact_dtypes(cache):
+    cache('alice', ROWS)
+    frame = frames.get_frame('alice')
+    assert list(frame['id']) == ['t1', 't2']
+    for column in ['account', 'class', 'subClass', 'direction']:
+        assert isinstance(frame[column].dtype, pd.CategoricalDtype)
+    assert frame['amount'].dtype == 'float32' and frame['day'].dtype == 'int32'
+    assert str(frame['postDate'].dtype) == 'datetime64[ns]'
+    assert frame['postDate'].iloc[0] == pd.Timestamp('2023-06-01')
+
+
+def test_frame_is_loaded_once_until_the_data_changes(cache):
+    cache('alice', ROWS[:1])
+    frame = frames.get_frame('alice')
+    assert frames.get_frame('alice') is frame
+
+    # written by another worker: nothing invalidates this process's cache, the data version moves on
+    with sqlite3.connect(tenants.transactions_db('alice')) as conn:
+        conn.execute("INSERT INTO transactions (id, amount) VALUES ('t9', 1.0)")
+    assert len(frames.get_frame('alice')) == 2
+    frames.invalidate('alice')
+    assert frames.get_frame('alice') is not frame
@@ -0,0 +1,59 @@
+from flask import Flask
+
+from services import http_cache
+
+
+def make_app(tmp_path):
+    static = tmp_path / 'static'
+    static.mkdir()
+    (static / 'app.js').write_text("console.log('v1');")
+    app = Flask(__name__, static_folder=str(static))
+    http_cache.init_app(app)
+    state = {'version': 1, 'builds': 0}
+
+    @app.route('/page')
+    def page():
+        from flask import url_for
+        return url_for('static', filename='app.js')
+
+    @app.route('/data')
+    def data():
+        def build():
+            state['builds'] += 1
+            return {'version': state['version']}
+        return http_cache.json_response(build, 'alice', state['version'])
+
+    return app, static, state
+
+
+def test_static_urls_are_fingerprinted_and_immutable(tmp_path):
+    app, static, _ = make_app(tmp_path)
+    client = app.test_client()
+    url = client.get('/page').get_data(as_text=True)
+    assert url.startswith('/static/app.js?v=')
+    assert 'immutable' in client.get(url).headers['Cache-Control']
+    assert client.get('/static/app.js').headers['Cache-Control'] == 'public, no-cache'
+
+    (static / 'app.js').write_text("console.log('version 2');")
+    assert client.get('/page').get_data(as_text=True) != url
+
+
+def test_data_endpoints_answer_304_without_rebuilding(tmp_path):
+    app, _, state = make_app(tmp_path)
+    client = app.test_client()
+    first = client.get('/data')
+    etag = first.headers['ETag']
+    assert first.get_json() == {'version': 1}
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get('/data', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and state['builds'] == 1
+
+    state['version'] = 2
+    changed = client.get('/data', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.get_json() == {'version': 2}
+
+
+def test_pages_are_not_stored(tmp_path):
+    app, _, _ = make_app(tmp_path)
+    assert app.test_client().get('/page').headers['Cache-Control'] == 'no-cache, no-store, must-revalidate'
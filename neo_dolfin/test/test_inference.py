@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pytest
+
+from ai.chatbot.inference import DenseNetwork, export, quantize
+
+CHATBOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai', 'chatbot')
+
+
+def sample_inputs(size, count=200, seed=0):
+    # bag-of-words vectors: mostly zeros with a handful of words set, plus the empty message
+    rng = np.random.default_rng(seed)
+    inputs = (rng.random((count, size)) < 0.02).astype(np.float32)
+    inputs[0] = 0
+    return inputs
+
+
+def test_matches_keras_model():
+    keras_models = pytest.importorskip('keras.models')
+    keras_model = keras_models.load_model(os.path.join(CHATBOT_DIR, 'chatbotmodel.h5'))
+    network = DenseNetwork.load(os.path.join(CHATBOT_DIR, 'chatbotmodel.npz'))     # the shipped export is current
+    inputs = sample_inputs(network.input_size)
+    expected = keras_model.predict(inputs, verbose=0)
+
+    got = network.predict(inputs)
+    assert got.shape == expected.shape
+    np.testing.assert_allclose(got, expected, rtol=1e-4, atol=1e-6)
+    np.testing.assert_allclose(network.predict(inputs[5])[0], expected[5], rtol=1e-4, atol=1e-6)
+
+
+def test_int8_export_keeps_predictions(tmp_path):
+    keras_models = pytest.importorskip('keras.models')
+    keras_model = keras_models.load_model(os.path.join(CHATBOT_DIR, 'chatbotmodel.h5'))
+    path = str(tmp_path / 'model.npz')
+    assert export(keras_model, path, int8=True) == 3
+    network = DenseNetwork.load(path)
+    inputs = sample_inputs(network.input_size)
+    expected = keras_model.predict(inputs, verbose=0)
+
+    got = network.predict(inputs)
+    assert np.abs(got - expected).max() < 0.05
+    assert (got.argmax(axis=1) == expected.argmax(axis=1)).mean() > 0.95
+
+
+def test_quantize_round_trips_within_half_a_step():
+    weights = np.array([[0.5, 0.0, -2.0], [-0.25, 0.0, 1.0]], dtype=np.float32)
+    values, scale = quantize(weights)
+    assert values.dtype == np.int8 and values[0, 0] == 127 and values[0, 2] == -127
+    assert np.all(np.abs(values * scale - weights) <= scale / 2 + 1e-7)
@@ -0,0 +1,70 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from services import datastore, ingest, migrations
+
+COLUMNS = ['id', 'amount', 'description', 'transactionDate', 'day']
+
+
+def make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''CREATE TABLE transactions (id TEXT PRIMARY KEY, amount REAL, description TEXT,
+                    transactionDate TEXT, day INTEGER, owner INTEGER)''')
+    return conn
+
+
+def frame(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df['transactionDate'] = pd.to_datetime(df['transactionDate'])
+    return df
+
+
+def test_insert_then_update_and_skip_unchanged():
+    conn = make_db()
+    first = frame([('t1', -5.0, 'coffee', '2023-06-01', 1), ('t2', 100.0, 'pay', '2023-06-02', 2)])
+    assert ingest.upsert_frame(conn, 'transactions', first, COLUMNS) == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    conn.commit()
+
+    second = frame([('t1', -5.0, 'coffee', '2023-06-01', 1),        # unchanged
+                    ('t2', 120.0, 'pay', '2023-06-02', 2),          # amount changed
+                    ('t3', -9.5, 'lunch', '2023-06-03', 3)])        # new
+    assert ingest.upsert_frame(conn, 'transactions', second, COLUMNS) == {'inserted': 1, 'updated': 1, 'skipped': 1}
+    conn.commit()
+
+    assert conn.execute("SELECT id, amount, transactionDate, day FROM transactions ORDER BY id").fetchall() == [
+        ('t1', -5.0, '2023-06-01 00:00:00', 1),
+        ('t2', 120.0, '2023-06-02 00:00:00', 2),
+        ('t3', -9.5, '2023-06-03 00:00:00', 3),
+    ]
+
+
+def test_duplicate_and_missing_ids_do_not_abort_the_batch():
+    conn = make_db()
+    df = frame([('t1', 1.0, 'a', '2023-06-01', 1), ('t1', 2.0, 'b', '2023-06-01', 1), (None, 3.0, 'c', '2023-06-01', 1)])
+    df.loc[0, 'description'] = np.nan
+    counts = ingest.upsert_frame(conn, 'transactions', df, COLUMNS, constants={'owner': 7})
+    assert counts == {'inserted': 1, 'updated': 0, 'skipped': 2}
+    assert conn.execute("SELECT id, amount, description, owner FROM transactions").fetchall() == [('t1', 2.0, 'b', 7)]
+
+
+def test_values_are_plain_python_types():
+    df = frame([('t1', 1.5, None, '2023-06-01', 4)])
+    columns, rows = ingest.frame_rows(df, COLUMNS)
+    assert columns == COLUMNS
+    assert rows == [('t1', 1.5, None, '2023-06-01 00:00:00', 4)]
+    assert type(rows[0][4]) is int
+
+
+def test_counts_ignore_trigger_writes_on_a_migrated_schema(tmp_path):
+    path = str(tmp_path / 'transactions.db')
+    migrations.upgrade(path)
+    with datastore.connection(path) as conn:
+        first = frame([('t1', -5.0, 'coffee', '2023-06-01', 1), ('t2', 100.0, 'pay', '2023-06-02', 2)])
+        assert ingest.upsert_frame(conn, 'transactions', first, COLUMNS) == {'inserted': 2, 'updated': 0, 'skipped': 0}
+        conn.commit()
+        second = frame([('t1', -5.0, 'coffee', '2023-06-01', 1), ('t2', 120.0, 'pay', '2023-06-02', 2)])
+        assert ingest.upsert_frame(conn, 'transactions', second, COLUMNS) == {'inserted': 0, 'updated': 1, 'skipped': 1}
+        conn.commit()
+        assert conn.execute("SELECT version FROM data_version").fetchone()[0] == 3
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+import app as dolfin
+from api.temporary_used import API_db_op
+from services import analytics, jobs, tenants
+
+COLUMNS = ['id', 'amount', 'description']
+
+
+def poll(client, url, **kwargs):
+    deadline = time.time() + 5
+    while True:
+        response = client.get(url, **kwargs)
+        body = response.get_json()
+        if body.get('state') not in ('queued', 'running') or time.time() > deadline:
+            return response, body
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def client(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'runner', jobs.JobRunner(db_path=str(tmp_path / 'jobs.db'), max_workers=2))
+    monkeypatch.setattr(dolfin, '_databases_ready', True)      # leave the shipped user database alone
+    client = dolfin.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'alice'
+    return client
+
+
+def test_failed_first_sync_is_shown_and_can_be_retried(client, monkeypatch):
+    def basiq_down(user_id):
+        raise RuntimeError("basiq down")
+
+    monkeypatch.setattr(API_db_op, '_sync_job', basiq_down)
+    _, status = poll(client, '/load/status')
+    assert status == {'state': 'failed', 'ready': False, 'error': 'basiq down'}
+
+    monkeypatch.setattr(API_db_op, '_sync_job', lambda user_id: {'inserted': 0})
+    response = client.post('/load')
+    assert response.status_code == 302 and response.headers['Location'].endswith('/load')
+    _, status = poll(client, '/load/status')
+    assert status == {'state': 'done', 'ready': True, 'error': None}
+
+
+def test_word_cloud_waits_for_a_stale_epv(client, cache, monkeypatch):
+    computed = threading.Event()
+
+    def levels(user_id):
+        computed.wait(5)
+        with tenants.connection(user_id) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        return {'data_cluster': [], 'level_bounds': [count]}
+
+    monkeypatch.setattr(analytics, 'expenditure_levels', levels)
+    monkeypatch.setattr(analytics, 'word_cloud_image', lambda user_id, level, mode, bounds: {'image': str(bounds)})
+
+    def word_cloud():
+        response = client.post('/dash/epv/generate_word_cloud', json={'level': 'level 0'})
+        return response, response.get_json()
+
+    for rows, bounds in ([('t1', -5.0, 'COFFEE')], [1]), ([('t2', -7.5, 'GROCER')], [2]):
+        cache('alice', rows)        # no EPV yet, then a stale one: the page is handed the EPV job to wait for
+        computed.clear()
+        response, epv = word_cloud()
+        assert response.status_code == 202 and epv['kind'] == 'epv'
+        computed.set()
+        _, epv = poll(client, '/jobs/%s' % epv['id'])
+        assert epv['state'] == 'done' and epv['result']['level_bounds'] == bounds
+
+        _, job = word_cloud()
+        _, job = poll(client, '/jobs/%s' % job['id'])
+        assert job['kind'] == 'word_cloud' and job['result'] == {'image': str(bounds)}
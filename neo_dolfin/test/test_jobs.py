@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from services.jobs import JobRunner, DONE, FAILED, CANCELLED
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def runner(tmp_path):
+    return JobRunner(db_path=str(tmp_path / 'jobs.db'), max_workers=2)
+
+
+def test_job_runs_in_background_and_records_result(runner):
+    job = runner.submit('sync', 'alice', lambda x: {'total': x * 2}, 21)
+    assert wait_for(lambda: job.state == DONE)
+    assert job.result == {'total': 42}
+    assert runner.get(job.id).result == {'total': 42}
+    assert runner.latest('sync', 'alice').id == job.id
+
+
+def test_duplicate_submit_returns_active_job(runner):
+    release = threading.Event()
+    calls = []
+
+    def slow(level):
+        calls.append(level)
+        release.wait(2)
+
+    first = runner.submit('epv', 'alice', slow, 1)
+    assert runner.submit('epv', 'alice', slow, 1) is first
+    assert runner.submit('epv', 'bob', slow, 1) is not first
+    assert runner.submit('epv', 'alice', slow, 2) is not first      # different arguments, different job
+    release.set()
+    assert wait_for(lambda: len(calls) == 3 and not runner._active)
+
+
+def test_results_are_cached_until_ttl_or_invalidated(runner):
+    calls = []
+    job = runner.submit('epv', 'alice', lambda: calls.append(1) or len(calls))
+    assert wait_for(lambda: job.state == DONE)
+
+    cached = runner.submit('epv', 'alice', lambda: calls.append(1) or len(calls))
+    assert cached.id == job.id and cached.result == 1
+
+    runner.invalidate('alice')
+    fresh = runner.submit('epv', 'alice', lambda: calls.append(1) or len(calls))
+    assert fresh.id != job.id
+    assert wait_for(lambda: fresh.state == DONE) and fresh.result == 2
+
+    uncached = runner.submit('sync', 'alice', lambda: 'ok', ttl=0)
+    assert wait_for(lambda: uncached.state == DONE)
+    assert runner.submit('sync', 'alice', lambda: 'ok', ttl=0).id != uncached.id
+
+
+def test_results_are_only_reused_for_the_same_data_version(runner, tmp_path):
+    def levels(user_id):
+        return {'level_bounds': [len(user_id)]}
+
+    job = runner.submit('epv', 'alice', levels, 'alice', version=1)
+    assert wait_for(lambda: job.state == DONE)
+
+    # another worker, where no invalidate() ran: the same version reuses the result, a newer one recomputes it
+    other = JobRunner(db_path=str(tmp_path / 'jobs.db'), max_workers=1)
+    assert other.submit('epv', 'alice', levels, 'alice', version=1).id == job.id
+    fresh = other.submit('epv', 'alice', levels, 'alice', version=2)
+    assert fresh.id != job.id
+    assert wait_for(lambda: fresh.state == DONE) and fresh.result == {'level_bounds': [5]}
+
+
+def test_failure_is_captured_and_not_cached(runner):
+    def boom():
+        raise RuntimeError("basiq down")
+
+    job = runner.submit('sync', 'alice', boom)
+    assert wait_for(lambda: job.state == FAILED)
+    assert runner.get(job.id).error == "basiq down"
+    assert runner.submit('sync', 'alice', boom).id != job.id
+
+
+def test_cancel_discards_result(runner):
+    release = threading.Event()
+    job = runner.submit('forecast', 'alice', lambda: release.wait(2) and 'late')
+    assert runner.cancel(job.id)
+    release.set()
+    assert wait_for(lambda: not runner._active)
+    assert runner.get(job.id).state == CANCELLED
+    assert runner.get(job.id).result is None
+    assert not runner.cancel(job.id)
+
+
+def test_jobs_are_visible_to_other_workers(runner, tmp_path):
+    release = threading.Event()
+    job = runner.submit('forecast', 'alice', lambda: release.wait(2) and [1, 2])
+    other = JobRunner(db_path=runner.db_path)
+    assert other.get(job.id).active
+    assert other.submit('forecast', 'alice', lambda: None).id == job.id    # still de-duplicated
+    release.set()
+    assert wait_for(lambda: other.get(job.id).state == DONE)
+    assert other.get(job.id).result == [1, 2]
+
+
+def test_jobs_of_exited_workers_are_failed(runner):
+    release = threading.Event()
+    job = runner.submit('forecast', 'alice', lambda: release.wait(2))
+    with runner._connection() as conn:
+        conn.execute("UPDATE jobs SET pid = ?, owner = 'gone' WHERE id = ?", (2 ** 22 + 1, job.id))
+    other = JobRunner(db_path=runner.db_path)
+    assert other.get(job.id).state == FAILED
+    assert other.submit('forecast', 'alice', lambda: None).id != job.id
+    release.set()
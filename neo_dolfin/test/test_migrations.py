@@ -0,0 +1,45 @@
+import sqlite3
+
+from services import datastore, migrations
+
+
+def fresh_db(tmp_path):
+    return str(tmp_path / 'transactions.db')
+
+
+def test_new_database_is_created_at_latest_version(tmp_path):
+    path = fresh_db(tmp_path)
+    assert migrations.upgrade(path) == [1, 2, 3, 4, 5, 6]
+    with datastore.connection(path) as conn:
+        assert migrations.current_version(conn) == migrations.LATEST_VERSION
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_transactions_year_month' in indexes
+    assert 'idx_transactions_account_class' in indexes
+
+
+def test_existing_database_is_upgraded_in_place(tmp_path):
+    # an old cache written by pandas.to_sql: no primary key, a duplicated id, no indexes, user_version 0
+    path = fresh_db(tmp_path)
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE transactions (id VARCHAR(255), amount REAL, account VARCHAR(255),
+                    balance REAL, direction VARCHAR(50), class VARCHAR(50), transactionDate TEXT, postDate TEXT,
+                    subClass VARCHAR(255), description TEXT, day INTEGER, month INTEGER, year INTEGER)''')
+    conn.execute("INSERT INTO transactions (id, amount, month, year) VALUES ('t1', -5.0, 6, 2023)")
+    conn.execute("INSERT INTO transactions (id, amount, month, year) VALUES ('t1', -7.0, 6, 2023)")
+    conn.commit()
+    conn.close()
+
+    with datastore.connection(path) as conn:
+        assert migrations.migrate(conn) == [1, 2, 3, 4, 5, 6]
+        assert migrations.migrate(conn) == []
+        assert conn.execute("SELECT id, amount FROM transactions").fetchall() == [('t1', -5.0)]
+        conn.execute("INSERT INTO transactions (id, amount) VALUES ('t1', 1.0) ON CONFLICT(id) DO UPDATE SET amount = excluded.amount")
+        assert conn.execute("SELECT id, amount FROM transactions").fetchall() == [('t1', 1.0)]
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    path = fresh_db(tmp_path)
+    migrations.upgrade(path)
+    with datastore.connection(path) as conn:
+        for name, (uses_index, plan) in migrations.check_query_plans(conn).items():
+            assert uses_index, "%s does a full table scan: %s" % (name, plan)
@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+from services import datastore, ingest, migrations, rollup
+from ai.chatbot import query_bankdata
+
+COLUMNS = ['id', 'description', 'amount', 'balance', 'direction', 'subClass', 'transactionDate', 'day', 'month', 'year']
+
+
+def frame(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS[:7])
+    dates = pd.to_datetime(df['transactionDate'])
+    df['day'], df['month'], df['year'] = dates.dt.day, dates.dt.month, dates.dt.year
+    return df
+
+
+def store(conn, batch):
+    # what API_db_op does with each batch it caches
+    periods = rollup.affected_periods(conn, batch)
+    ingest.upsert_frame(conn, 'transactions', batch, COLUMNS)
+    rollup.refresh(conn, periods)
+
+
+def scanned(conn, month, year):
+    # the answers query_bankdata used to compute from transactions
+    one = lambda sql, *args: conn.execute(sql, args + (month, year)).fetchone()
+    balance = one("SELECT balance FROM transactions WHERE month = ? AND year = ? ORDER BY transactionDate DESC, id DESC LIMIT 1")
+    debit = one("SELECT SUM(amount) FROM transactions WHERE direction = ? AND month = ? AND year = ?", 'debit')[0]
+    credit = one("SELECT SUM(amount) FROM transactions WHERE direction = ? AND month = ? AND year = ?", 'credit')[0]
+    negative = one("SELECT SUM(amount) FROM transactions WHERE amount < 0 AND month = ? AND year = ?")[0]
+    top = one("SELECT description, subClass, amount FROM transactions WHERE direction = 'debit' AND month = ? AND year = ? ORDER BY amount ASC LIMIT 1")
+    return balance[0] if balance else 0, debit or 0, credit or 0, negative or 0, top
+
+
+def summarised(conn, month, year):
+    row = conn.execute('''SELECT end_balance, debit_total, credit_total, negative_total,
+                                 top_debit_description, top_debit_subclass, top_debit_amount
+                          FROM monthly_summary WHERE year = ? AND month = ?''', (year, month)).fetchone()
+    if row is None:
+        return 0, 0, 0, 0, None
+    return row[0], row[1], row[2], row[3], tuple(row[4:]) if row[6] is not None else None
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'transactions.db')
+    migrations.upgrade(path)
+    with datastore.connection(path) as conn:
+        yield conn
+
+
+def test_summary_follows_inserts_updates_and_moves(conn):
+    store(conn, frame([
+        ('t1', 'rent', -1200.0, 800.0, 'debit', 'Housing', '2023-06-01'),
+        ('t2', 'pay', 2000.0, 2800.0, 'credit', 'Salary', '2023-06-15'),
+        ('t3', 'coffee', -4.5, 2795.5, 'debit', 'Cafe', '2023-06-15'),
+        ('t4', 'refund', 20.0, 2815.5, 'credit', 'Refund', '2023-07-02'),
+        ('t5', 'fuel', -60.0, 2755.5, 'debit', 'Fuel', '2023-07-03'),
+    ]))
+    assert conn.execute("SELECT year, month, transaction_count FROM monthly_summary ORDER BY year, month").fetchall() == [
+        (2023, 6, 3), (2023, 7, 2)]
+    for month in (6, 7, 8):
+        assert summarised(conn, month, 2023) == scanned(conn, month, 2023)
+
+    # t5 is re-posted into June with a new amount, t6 is new - July must lose t5 and June gain it
+    store(conn, frame([
+        ('t5', 'fuel', -1500.0, 1315.5, 'debit', 'Fuel', '2023-06-30'),
+        ('t6', 'gym', -30.0, 1285.5, 'debit', 'Health', '2023-08-01'),
+    ]))
+    for month in (6, 7, 8):
+        assert summarised(conn, month, 2023) == scanned(conn, month, 2023)
+    assert summarised(conn, 6, 2023)[4] == ('fuel', 'Fuel', -1500.0)
+
+    # a month whose last transaction leaves it loses its row
+    store(conn, frame([('t4', 'refund', 20.0, 2815.5, 'credit', 'Refund', '2023-08-02')]))
+    assert conn.execute("SELECT COUNT(*) FROM monthly_summary WHERE year = 2023 AND month = 7").fetchone()[0] == 0
+    assert rollup.rebuild(conn) == 2
+
+
+def test_chatbot_queries_read_the_summary(conn):
+    store(conn, frame([
+        ('t1', 'rent', -1200.0, 800.0, 'debit', 'Housing', '2022-12-01'),
+        ('t2', 'pay', 2000.0, 2800.0, 'credit', 'Salary', '2023-01-15'),
+        ('t3', 'laptop', -1800.0, 1000.0, 'debit', 'Tech', '2023-02-10'),
+        ('t4', 'coffee', -4.5, 995.5, 'debit', 'Cafe', '2023-02-11'),
+    ]))
+    assert query_bankdata.get_last_balance_for_month_year(conn, 2, 2023) == 995.5
+    assert query_bankdata.get_last_balance_for_month_year(conn, 3, 2023) == 0
+    assert query_bankdata.get_total_amount_for_month_year(conn, 'debit', 2, 2023) == (-1804.5, 995.5)
+    assert query_bankdata.get_total_amount_for_month_year(conn, 'credit', 2, 2023) == (0, 995.5)
+    assert query_bankdata.get_total_amount_for_month_year(conn, 'credit', 5, 2023) == (0, 0)
+    assert query_bankdata.get_highest_spending_last_period(conn, 'month', 2, 2023) == \
+        "Highest Spending in 2, 2023: laptop (Category: Tech) with amount -1800.0"
+    assert query_bankdata.get_highest_spending_last_period(conn, 'year', 2023, 2023) == \
+        "Highest Spending in 2023, 2023: laptop (Category: Tech) with amount -1800.0"
+    assert query_bankdata.get_highest_spending_last_period(conn, 'month', 1, 2023) == "No data found for the specified period."
+    assert query_bankdata.get_total_negative_amount_for_month_year(conn, 2, 2023) == -1804.5
+    assert query_bankdata.get_total_negative_amount_for_year(conn, 2022) == -1200.0
+    assert query_bankdata.get_current_year(conn) == 2023
+    assert query_bankdata.get_current_month(conn, 2023) == 2
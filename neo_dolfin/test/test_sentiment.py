@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from ai.chatbot import sentiment
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return sentiment.SentimentTracker(max_sessions=100, review_log=sentiment.ReviewLog(str(tmp_path / 'reviews.db'),
+                                                                                        flush_after=0.01))
+
+
+def test_concurrent_sessions_keep_exact_counts(tracker):
+    messages = ["I love this, thanks!", "This is terrible and useless", "What is my balance"]
+    start = threading.Barrier(8)
+
+    def chat(n):
+        start.wait()
+        for _ in range(50):
+            for message in messages:
+                tracker.record('session-%d' % (n % 2), message)
+
+    threads = [threading.Thread(target=chat, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tracker.stats() == {'positive': 400, 'negative': 400, 'neutral': 400, 'total': 1200, 'sessions': 2}
+    for session_id in ('session-0', 'session-1'):
+        assert tracker.session(session_id).to_dict() == {'positive': 200, 'negative': 200, 'neutral': 200, 'total': 600}
+    assert sentiment.analyzer() is sentiment.analyzer()
+
+
+def test_flagged_exchanges_are_written_in_the_background(tracker):
+    tracker.remember_reply('a', "Your balance is $10")
+    assert tracker.record('a', "That is awful, I hate this", user_id='7') == 'negative'
+    tracker.remember_reply('a', "Sorry to hear that")
+    assert tracker.record('a', "Thanks, that's great") == 'positive'
+    assert tracker.record('b', "Great, thank you") == 'positive'
+    assert tracker.record('b', "This is horrible") == 'negative'     # half of b's messages are negative
+
+    tracker.review_log.flush(5)
+    assert [(row['session_id'], row['user_id'], row['bot'], row['user']) for row in tracker.review_log.recent()] == [
+        ('b', None, "", "This is horrible"),
+        ('a', '7', "Your balance is $10", "That is awful, I hate this"),
+    ]
+    assert tracker.review_log.writer.stats()['items'] == 2
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+from services import startup
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     encodings
+import time:       300 |        300 |       keras.src
+import time:       200 |        500 |     keras
+import time:        50 |        550 |   ai.chatbot.chatbot_logic
+import time:        40 |         40 |     pandas.core
+import time:        60 |        100 |   pandas
+import time:        10 |        660 | app
+"""
+
+
+def test_breakdown_of_importtime_output():
+    rows = startup.parse_importtime(SAMPLE)
+    assert rows[0] == ('encodings', 2, 100, 100)
+    summary = startup.breakdown(rows)
+    assert summary['total'] == 660
+    assert summary['imports'] == [('ai.chatbot.chatbot_logic', 550), ('pandas', 100)]
+    assert summary['packages'][0] == ('keras', 500)
+
+
+def test_chatbot_import_loads_no_model():
+    # a fresh interpreter, so modules other tests imported don't count
+    code = ("import sys; from ai.chatbot import chatbot_logic; "
+            "print(sorted(m for m in ('keras', 'tensorflow', 'nltk', 'speech_recognition') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=startup.APP_DIR, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=startup.APP_DIR))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '[]'
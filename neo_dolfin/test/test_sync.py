@@ -0,0 +1,45 @@
+import pandas as pd
+
+from services import datastore, migrations, sync
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['id', 'postDate'])
+
+
+def test_first_sync_has_no_filter(tmp_path):
+    path = str(tmp_path / 'transactions.db')
+    migrations.upgrade(path)
+    with datastore.connection(path) as conn:
+        assert sync.get_mark(conn, 'alice') is None
+    assert sync.mark_filter(None) is None
+
+
+def test_mark_moves_forward_only(tmp_path):
+    path = str(tmp_path / 'transactions.db')
+    migrations.upgrade(path)
+    with datastore.connection(path) as conn:
+        sync.save_mark(conn, 'alice', frame([('t2', '2023-08-03'), ('t1', '2023-08-01'), ('t3', '2023-08-03')]))
+        assert sync.get_mark(conn, 'alice') == ('2023-08-03', 't2')
+        assert sync.mark_filter(sync.get_mark(conn, 'alice')) == "transaction.postDate.gteq('2023-08-03')"
+
+        # an empty or older batch leaves the mark alone
+        sync.save_mark(conn, 'alice', frame([]))
+        sync.save_mark(conn, 'alice', frame([('t0', '2023-07-01')]))
+        assert sync.get_mark(conn, 'alice') == ('2023-08-03', 't2')
+
+        sync.save_mark(conn, 'alice', frame([('t4', '2023-08-05')]))
+        assert sync.get_mark(conn, 'alice') == ('2023-08-05', 't4')
+
+
+def test_clear_marks(tmp_path):
+    path = str(tmp_path / 'transactions.db')
+    migrations.upgrade(path)
+    with datastore.connection(path) as conn:
+        sync.save_mark(conn, 'alice', frame([('t1', '2023-08-01')]))
+        sync.save_mark(conn, 'bob', frame([('t9', '2023-08-02')]))
+        sync.clear_marks(conn, 'alice')
+        assert sync.get_mark(conn, 'alice') is None
+        assert sync.get_mark(conn, 'bob') == ('2023-08-02', 't9')
+        sync.clear_marks(conn)
+        assert sync.get_mark(conn, 'bob') is None
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+
+from services import dashboard, tenants
+
+COLUMNS = ['id', 'account', 'class', 'subClass', 'amount', 'direction', 'balance', 'postDate', 'day', 'month', 'year']
+
+
+def test_users_get_separate_databases(cache):
+    cache('alice', [('t1', 'acc-a', 'payment', 'Food', -5.0, 'debit', 95.0, '2023-06-01', 1, 6, 2023)])
+    cache('bob', [('t1', 'acc-b', 'transfer', 'Pay', 50.0, 'credit', 150.0, '2023-06-02', 2, 6, 2023)])
+
+    assert tenants.transactions_db('alice') != tenants.transactions_db('bob')
+    with tenants.connection('alice') as conn:
+        assert conn.execute("SELECT id, account FROM transactions").fetchall() == [('t1', 'acc-a')]
+
+    # clearing one user's store leaves the other's alone
+    with tenants.connection('bob') as conn:
+        conn.execute("DELETE FROM transactions")
+    assert dashboard.get_snapshot('alice')['ALL']['currentBalance'] == 95.0
+    assert dashboard.get_snapshot('bob')['ALL']['currentBalance'] is None
+
+
+def test_file_names_are_safe_and_distinct(store):
+    paths = {tenants.transactions_db(user) for user in ['../etc/passwd', '.._etc_passwd', 'a b', 'a_b']}
+    assert len(paths) == 4
+    for path in paths:
+        assert os.path.dirname(path) == str(store)
+
+
+def test_snapshot_follows_writes_from_another_process(cache):
+    cache('alice', [('t1', 'acc-a', 'payment', 'Food', -5.0, 'debit', 95.0, '2023-06-01', 1, 6, 2023)])
+    snapshot = dashboard.get_snapshot('alice')
+    assert dashboard.get_snapshot('alice') is snapshot
+
+    # another gunicorn worker syncs: its invalidation listeners never run here, but the data version changes
+    with sqlite3.connect(tenants.transactions_db('alice')) as conn:
+        conn.execute("INSERT INTO transactions (id, account, amount, balance, postDate) "
+                     "VALUES ('t2', 'acc-a', -10.0, 85.0, '2023-06-02')")
+    assert dashboard.get_snapshot('alice')['ALL']['balanceRange'] == 10.0
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from api.token_manager import TokenManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBasiq:
+    def __init__(self, delay=0, expires_in=3600):
+        self.calls = 0
+        self.delay = delay
+        self.expires_in = expires_in
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+            return {'access_token': 'token-%d' % self.calls, 'expires_in': self.expires_in}
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_token_is_fetched_lazily_and_cached():
+    basiq = FakeBasiq()
+    manager = TokenManager(basiq, proactive=False, clock=FakeClock())
+    assert basiq.calls == 0
+    assert manager.get() == 'token-1'
+    assert manager.get() == 'token-1'
+    assert basiq.calls == 1
+
+
+def test_concurrent_callers_share_one_fetch():
+    basiq = FakeBasiq(delay=0.1)
+    manager = TokenManager(basiq, proactive=False, clock=FakeClock())
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(manager.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ['token-1'] * 8
+    assert basiq.calls == 1
+
+
+def test_near_expiry_refreshes_in_background_and_expired_refreshes_inline():
+    basiq = FakeBasiq()
+    clock = FakeClock()
+    manager = TokenManager(basiq, refresh_margin=600, proactive=False, clock=clock)
+    assert manager.get() == 'token-1'
+
+    clock.now += 3100                   # 500s left - inside the refresh margin
+    assert manager.get() == 'token-1'   # still served while the renewal runs
+    assert wait_for(lambda: manager.get() == 'token-2')
+
+    clock.now += 4000                   # expired - the caller waits for a new token
+    assert manager.get() == 'token-3'
+
+
+def test_failed_background_refresh_keeps_current_token():
+    clock = FakeClock()
+    responses = [{'access_token': 'token-1', 'expires_in': 3600}]
+
+    def fetch():
+        if responses:
+            return responses.pop(0)
+        raise ConnectionError("basiq down")
+
+    manager = TokenManager(fetch, refresh_margin=600, proactive=False, clock=clock)
+    manager.get()
+    clock.now += 3100
+    assert manager.get() == 'token-1'
+    assert wait_for(lambda: not manager._refreshing)
+    assert manager.get() == 'token-1'
+
+
+def test_forked_worker_gets_fresh_locks_but_keeps_token():
+    basiq = FakeBasiq()
+    manager = TokenManager(basiq, proactive=False, clock=FakeClock())
+    manager.get()
+    parent_lock = manager._lock
+    manager._pid = -1                   # as seen from a child process after fork
+    assert manager.get() == 'token-1'
+    assert manager._lock is not parent_lock
+    assert basiq.calls == 1
+
+
+def test_invalidate_forces_a_new_token():
+    basiq = FakeBasiq()
+    manager = TokenManager(basiq, proactive=False, clock=FakeClock())
+    manager.get()
+    manager.invalidate()
+    assert manager.get() == 'token-2'
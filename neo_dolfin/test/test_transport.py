@@ -0,0 +1,54 @@
+import pytest
+import requests
+
+from api import transport
+
+from .conftest import FakeResponse
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waited = []
+    monkeypatch.setattr(transport.time, 'sleep', waited.append)
+    return waited
+
+
+def test_get_retries_server_errors_then_parses_json(basiq_session, sleeps):
+    session = basiq_session([FakeResponse(503), requests.exceptions.ConnectionError(), FakeResponse(200, {'data': [1]})])
+    assert transport.get('/users/u1') == {'data': [1]}
+    assert len(session.calls) == 3
+    assert session.calls[0][1] == transport.BASIQ_URL + '/users/u1'
+    assert session.calls[0][2] == (transport.HTTP_CONNECT_TIMEOUT, transport.HTTP_READ_TIMEOUT)
+    assert len(sleeps) == 2
+
+
+def test_rate_limit_honours_retry_after(basiq_session, sleeps):
+    basiq_session([FakeResponse(429, headers={'Retry-After': '3'}), FakeResponse(200, {})])
+    assert transport.post('/users', json={}) == {}
+    assert sleeps == [3.0]
+
+
+def test_non_idempotent_post_is_not_retried_on_5xx(basiq_session, sleeps):
+    session = basiq_session([FakeResponse(500, {'error': 'boom'})])
+    with pytest.raises(transport.BasiqHTTPError) as e:
+        transport.post('/users', json={})
+    assert e.value.status_code == 500
+    assert e.value.payload == {'error': 'boom'}
+    assert len(session.calls) == 1 and sleeps == []
+
+
+def test_gives_up_after_retries_and_can_return_error_body(basiq_session, sleeps):
+    basiq_session([FakeResponse(502, {'error': 'bad gateway'})] * 3)
+    assert transport.get('/users/u1', retries=2, raise_errors=False) == {'error': 'bad gateway'}
+    assert len(sleeps) == 2
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(transport.random, 'uniform', lambda low, high: high)
+    assert transport.backoff_delay(0) == transport.HTTP_BACKOFF
+    assert transport.backoff_delay(2) == transport.HTTP_BACKOFF * 4
+    assert transport.backoff_delay(50) == transport.HTTP_BACKOFF_MAX
+
+
+def test_session_is_shared_per_process():
+    assert transport.get_session() is transport.get_session()